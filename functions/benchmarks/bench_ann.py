@@ -0,0 +1,90 @@
+"""Recall@k against latency for the local retrieval index.
+
+Builds indexes over a synthetic corpus of unit vectors drawn around random topic centres (so
+that, as with real abstracts, neighbours cluster), then runs the same queries through:
+exact float32 search (the ground truth), exact int8 search, and IVF search at increasing
+nprobe, both float32 and int8. Reports recall@k against the exact results and the per-query
+latency of each.
+
+Usage:
+    python bench_ann.py [--vectors 50000] [--dimensions 768] [--queries 200] [--k 15]
+                        [--nlist 256] [--nprobe 1 2 4 8 16 32]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+from typing import List, Set
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dha-generateRecommendations"))
+
+from local_index import LocalVectorIndex, build_index  # noqa: E402
+
+
+def synthetic_vectors(centres: np.ndarray, count: int, noise: float, rng: np.random.Generator) -> np.ndarray:
+    data = centres[rng.integers(len(centres), size=count)]
+    data = data + noise * rng.standard_normal(data.shape).astype(np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def run(label: str, search, queries: np.ndarray, truth: List[Set[str]], k: int) -> None:
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        result = search(query)
+        latencies.append((time.perf_counter() - started) * 1000)
+        hits += len(expected.intersection(doc_id for doc_id, _ in result))
+    latencies.sort()
+    recall = hits / (len(queries) * k)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    print(f"{label:<24} recall@{k} {recall:6.3f}   mean {statistics.fmean(latencies):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", type=int, default=50000)
+    parser.add_argument("--dimensions", type=int, default=768)
+    parser.add_argument("--topics", type=int, default=1000)
+    parser.add_argument("--noise", type=float, default=1.5, help="spread around each topic; higher is harder")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=15)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    centres = rng.standard_normal((args.topics, args.dimensions)).astype(np.float32)
+    data = synthetic_vectors(centres, args.vectors, args.noise, rng)
+    ids = [str(30000000 + i) for i in range(args.vectors)]
+    queries = synthetic_vectors(centres, args.queries, args.noise, rng)
+
+    with tempfile.TemporaryDirectory(prefix="bench_ann_") as root:
+        indexes = {}
+        for name, dtype, nlist in [("float32", "float32", args.nlist), ("int8", "int8", args.nlist)]:
+            path = os.path.join(root, name)
+            started = time.perf_counter()
+            build_index(path, ids, data, dtype=dtype, nlist=nlist, seed=args.seed)
+            indexes[name] = LocalVectorIndex.load(path)
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 2 ** 20
+            print(f"built {name} index with {nlist} lists in {time.perf_counter() - started:.1f}s, {size:.0f} MiB")
+
+        exact = indexes["float32"]
+        truth = [{doc_id for doc_id, _ in exact.search(q, args.k, exact=True)} for q in queries]
+        print(f"{args.vectors} vectors x {args.dimensions} dims, {args.queries} queries")
+
+        run("exact float32", lambda q: exact.search(q, args.k, exact=True), queries, truth, args.k)
+        run("exact int8", lambda q: indexes["int8"].search(q, args.k, exact=True), queries, truth, args.k)
+        for name, index in indexes.items():
+            for nprobe in args.nprobe:
+                run(f"ivf {name} nprobe={nprobe}", lambda q: index.search(q, args.k, nprobe=nprobe),
+                    queries, truth, args.k)
+
+
+if __name__ == "__main__":
+    main()
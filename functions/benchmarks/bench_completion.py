@@ -0,0 +1,220 @@
+"""Micro-benchmark of intake completion tracking on large synthetic records.
+
+Replays a 14-question intake on records padded with extra keys and long lists, comparing the
+original recursive walks (get_next_prompt, is_record_complete, get_completed_sections after
+every merge) with the compiled schema index and incrementally updated completion bitmaps.
+Results are cross-checked against the recursive implementation on randomised records.
+
+Usage:
+    python bench_completion.py [--padding 200] [--records 50] [--check 2000]
+"""
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dha-processMessage"))
+
+from completion import SCHEMA_INDEX, merge_user_input  # noqa: E402
+from schema import QUESTIONS, RECORD_SCHEMA, empty_record, nest  # noqa: E402
+
+
+# Recursive implementations as they were before the schema index, kept as the baseline
+
+def legacy_is_field_complete(record: Dict[str, Any], section_path: str) -> bool:
+    keys = section_path.split('.')
+    value = record
+    for key in keys:
+        if isinstance(value, dict):
+            value = value.get(key, {})
+        elif isinstance(value, list):
+            return True
+        else:
+            return False
+
+    def is_filled(v):
+        if isinstance(v, dict):
+            return any(is_filled(sub_v) for sub_v in v.values())
+        elif isinstance(v, list):
+            return len(v) > 0
+        elif isinstance(v, str):
+            return len(v.strip()) > 0
+        return v is not None
+
+    return is_filled(value)
+
+
+def legacy_get_next_prompt(record: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    for field, question in QUESTIONS:
+        if not legacy_is_field_complete(record, field):
+            return {"field": field, "prompt": question}
+    return None
+
+
+def legacy_is_record_complete(record: Dict[str, Any]) -> bool:
+    def check_section(section):
+        if isinstance(section, dict):
+            return any(check_section(v) for v in section.values())
+        return bool(section)
+
+    return all(check_section(record[s]) for s in ["symptoms", "lifestyle", "additional"])
+
+
+def legacy_get_completed_sections(record: Dict[str, Any]) -> List[str]:
+    def is_section_filled(section):
+        if isinstance(section, dict):
+            return any(is_section_filled(v) for v in section.values())
+        elif isinstance(section, list):
+            return bool(section)
+        elif isinstance(section, str):
+            return bool(section.strip())
+        return section is not None and section != ""
+
+    completed = []
+    for top, subsections in [
+        ("symptoms", [("current", ["symptoms-current"]), ("blood_sugar", ["symptoms-blood-sugar"]),
+                      ("medications", ["symptoms-medications", "symptoms-problems"])]),
+        ("lifestyle", [("diet", ["lifestyle-diet"]), ("activity", ["lifestyle-activity"]),
+                       ("mental", ["lifestyle-mental"]), ("cognitive", ["lifestyle-cognitive"])]),
+        ("additional", [("conditions", ["additional-conditions"]), ("healthcare", ["additional-healthcare"]),
+                        ("concerns", ["additional-concerns"])]),
+    ]:
+        section = record.get(top, {})
+        for sub, names in subsections:
+            if is_section_filled(section.get(sub)):
+                completed.extend(names)
+    return completed
+
+
+def legacy_merge(d: Dict[str, Any], u: Dict[str, Any]) -> Dict[str, Any]:
+    for k, v in u.items():
+        if isinstance(v, dict) and k in d and isinstance(d[k], dict):
+            d[k] = legacy_merge(d[k], v)
+        else:
+            d[k] = v
+    return d
+
+
+# Synthetic data
+
+ANSWERS = {
+    "symptoms.current": {"fatigue": True, "increased_thirst": True},
+    "symptoms.blood_sugar.check_frequency": "Daily",
+    "symptoms.blood_sugar.fasting_range": "110-130 mg/dL",
+    "symptoms.blood_sugar.post_meal_range": "under 180 mg/dL",
+    "symptoms.medications.medication_list": [{"name": "Metformin", "dosage": "500mg"}],
+    "symptoms.medications.adherence": "Always",
+    "symptoms.medications.problems": {"has_problems": False, "description": ""},
+    "lifestyle.diet": {"overall_health": "Somewhat healthy", "fruits_vegetables_frequency": "Daily"},
+    "lifestyle.activity": {"exercise_frequency": "Rarely"},
+    "lifestyle.mental": {"stress_level": "Moderate"},
+    "lifestyle.cognitive": {"has_changes": False},
+    "additional.conditions": {"has_conditions": True, "description": "Hypertension"},
+    "additional.healthcare": {"seeing_doctor": True, "provider_details": "Dr. Jones"},
+    "additional.concerns": "Preventing complications",
+}
+
+
+def padded_record(rng: random.Random, padding: int) -> Dict[str, Any]:
+    """An unanswered record whose sections carry many empty extra keys, the worst case for any() walks."""
+    record = empty_record()
+    for path in ["symptoms.current", "symptoms.blood_sugar", "symptoms.medications", "lifestyle.diet",
+                 "lifestyle.activity", "lifestyle.mental.symptoms", "lifestyle.cognitive",
+                 "additional.conditions", "additional.healthcare"]:
+        node = record
+        for key in path.split('.'):
+            node = node[key]
+        for i in range(padding):
+            node[f"note_{i}"] = {"text": "", "flags": {"reviewed": None, "source": ""}}
+    record["symptoms"]["medications"]["history"] = [{"name": f"drug-{i}"} for i in range(padding)]
+    return record
+
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+    if depth < 2 and rng.random() < 0.2:
+        return {f"k{i}": random_value(rng, depth + 1) for i in range(rng.randrange(3))}
+    return rng.choice(["", "   ", "text", False, True, None, 0, [], [1]])
+
+
+def random_update(rng: random.Random) -> Dict[str, Any]:
+    paths = SCHEMA_INDEX.paths + ["symptoms.extra", "lifestyle.diet.description", "additional.foo.bar"]
+    return nest(rng.choice(paths), random_value(rng))
+
+
+def check_equivalence(iterations: int, seed: int) -> None:
+    rng = random.Random(seed)
+    for _ in range(iterations):
+        record = copy.deepcopy(empty_record() if rng.random() < 0.5 else RECORD_SCHEMA)
+        completion = SCHEMA_INDEX.scan(record)
+        for _ in range(rng.randrange(1, 8)):
+            update = random_update(rng)
+            legacy_record = legacy_merge(copy.deepcopy(record), copy.deepcopy(update))
+            merge_user_input(record, copy.deepcopy(update), completion)
+            assert record == legacy_record
+            # The recursive is_record_complete indexes these sections directly
+            for section in ["symptoms", "lifestyle", "additional"]:
+                if not isinstance(record.get(section), dict):
+                    record[section] = {}
+                    legacy_record[section] = {}
+                    SCHEMA_INDEX.apply(completion, record, [section])
+
+            full = SCHEMA_INDEX.scan(record)
+            expected_next = legacy_get_next_prompt(record)
+            index = SCHEMA_INDEX.next_question(completion)
+            assert (QUESTIONS[index][0] if index is not None else None) == \
+                (expected_next["field"] if expected_next else None), (record, update)
+            assert SCHEMA_INDEX.next_question(full) == index
+            assert SCHEMA_INDEX.completed_sections(completion) == legacy_get_completed_sections(record), record
+            assert SCHEMA_INDEX.is_record_complete(completion) == legacy_is_record_complete(record), record
+    print(f"Equivalence check passed on {iterations} randomised records")
+
+
+def replay_legacy(record: Dict[str, Any]) -> None:
+    for field, _ in QUESTIONS:
+        legacy_merge(record, nest(field, copy.deepcopy(ANSWERS[field])))
+        legacy_get_next_prompt(record)
+        legacy_is_record_complete(record)
+        legacy_get_completed_sections(record)
+
+
+def replay_indexed(record: Dict[str, Any]) -> None:
+    completion = SCHEMA_INDEX.scan(record)
+    for field, _ in QUESTIONS:
+        merge_user_input(record, nest(field, copy.deepcopy(ANSWERS[field])), completion)
+        SCHEMA_INDEX.next_question(completion)
+        SCHEMA_INDEX.is_record_complete(completion)
+        SCHEMA_INDEX.completed_sections(completion)
+
+
+def time_replay(replay, records: List[Dict[str, Any]]) -> float:
+    copies = [copy.deepcopy(r) for r in records]
+    start = time.perf_counter()
+    for record in copies:
+        replay(record)
+    return (time.perf_counter() - start) / (len(records) * len(QUESTIONS)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--padding", type=int, default=200, help="extra keys added to each section")
+    parser.add_argument("--records", type=int, default=50, help="intakes to replay per measurement")
+    parser.add_argument("--check", type=int, default=2000, help="randomised records to cross-check")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    check_equivalence(args.check, args.seed)
+
+    rng = random.Random(args.seed)
+    print(f"{'padding':>8} {'recursive us/turn':>18} {'indexed us/turn':>16} {'speedup':>8}")
+    for padding in sorted({0, args.padding // 10, args.padding}):
+        records = [padded_record(rng, padding) for _ in range(args.records)]
+        legacy = time_replay(replay_legacy, records)
+        indexed = time_replay(replay_indexed, records)
+        print(f"{padding:>8} {legacy:>18.1f} {indexed:>16.1f} {legacy / indexed:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Recommendations prompt size, and optionally time to first token, with and without context packing.
+
+For each case, a patient record and RETRIEVAL_K abstracts are packed with
+context_packer.pack_context(). The script reports the estimated literature tokens before and
+after packing, how many abstracts survived, and the packing time. With --gemini it also streams
+the full and the packed recommendations prompt to Gemini and reports the counted prompt tokens
+and time to first token of each.
+
+Abstracts come from --abstracts, a JSONL file of {"id", "title", "abstract"} rows like the
+articles table. Without it, a synthetic corpus is used: abstracts of 6-14 sentences on a few
+topics, with some near-duplicates, which shows the mechanics but not real reranking quality.
+
+Usage:
+    python bench_context_packing.py [--abstracts articles.jsonl] [--cases 50] [--budget 4000]
+    python bench_context_packing.py --gemini --cases 5
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dha-generateRecommendations"))
+
+import context_packer  # noqa: E402
+
+RETRIEVAL_K = 15
+
+TOPICS = {
+    "glycaemic control": "metformin insulin HbA1c glucose SGLT2 GLP-1 sulfonylurea hypoglycaemia titration",
+    "kidney disease": "eGFR albuminuria nephropathy ACE inhibitor creatinine dialysis finerenone proteinuria",
+    "retinopathy": "retinal macular oedema anti-VEGF laser photocoagulation screening fundus vision",
+    "cardiovascular risk": "statin blood pressure LDL cholesterol myocardial infarction stroke aspirin",
+    "lifestyle": "diet exercise weight loss physical activity nutrition counselling sleep smoking",
+}
+FILLER = "patients cohort randomised trial outcome follow-up months significant associated reduced compared"
+
+RECORDS = [
+    "Type 2 diabetes for 8 years on metformin 1000mg twice daily. HbA1c 8.4%. eGFR 52, albuminuria.",
+    "Type 2 diabetes, HbA1c 7.1% on metformin and gliclazide. Recent diagnosis of macular oedema.",
+    "Newly diagnosed type 2 diabetes, BMI 34, sedentary, LDL 4.2 mmol/L, blood pressure 150/95.",
+    "Type 1 diabetes on basal-bolus insulin with frequent hypoglycaemia overnight.",
+]
+
+
+def synthetic_corpus(count: int, rng: random.Random) -> List[Dict[str, Any]]:
+    docs = []
+    for i in range(count):
+        if docs and rng.random() < 0.1:
+            # A near-duplicate: the same abstract with one sentence changed
+            source = rng.choice(docs)
+            sentences = context_packer.split_sentences(source["content"])
+            sentences[rng.randrange(len(sentences))] = "This cohort was followed for twelve months."
+            docs.append({"title": source["title"], "content": " ".join(sentences), "pmid": str(30000000 + i)})
+            continue
+        topic = rng.choice(list(TOPICS))
+        # Each abstract also has its own specific terms, as real abstracts on one topic do
+        words = TOPICS[topic].split() + FILLER.split() + [f"term{rng.randrange(5000)}" for _ in range(20)]
+        sentences = [" ".join(rng.choice(words) for _ in range(rng.randint(12, 30))).capitalize() + "."
+                     for _ in range(rng.randint(6, 14))]
+        docs.append({"title": f"A study of {topic}", "content": " ".join(sentences), "pmid": str(30000000 + i)})
+    return docs
+
+
+def load_abstracts(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [{"title": row["title"], "content": row["abstract"], "pmid": str(row["id"])}
+                for row in map(json.loads, f) if row.get("abstract")]
+
+
+def stream_first_token(client, model: str, prompt: str) -> float:
+    started = time.perf_counter()
+    for _ in client.models.generate_content_stream(model=model, contents=prompt):
+        return time.perf_counter() - started
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--abstracts", help="JSONL file of articles; synthetic if omitted")
+    parser.add_argument("--cases", type=int, default=50)
+    parser.add_argument("--budget", type=int, default=context_packer.CONTEXT_TOKEN_BUDGET)
+    parser.add_argument("--gemini", action="store_true", help="also measure prompt tokens and TTFT with Gemini")
+    parser.add_argument("--model", default=os.environ.get("GEMINI_MODEL", "gemini-2.5-pro"))
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    corpus = load_abstracts(args.abstracts) if args.abstracts else synthetic_corpus(2000, rng)
+
+    client = build_prompt = None
+    if args.gemini:
+        from google import genai
+        from main import build_recommendations_prompt as build_prompt
+        client = genai.Client(vertexai=True, project="gemini-med-lit-review", location="us-central1")
+
+    before, after, kept, pack_ms, ttft = [], [], [], [], {"full": [], "packed": []}
+    for case in range(args.cases):
+        record = RECORDS[case % len(RECORDS)]
+        docs = rng.sample(corpus, RETRIEVAL_K)
+        started = time.perf_counter()
+        packed, stats = context_packer.pack_context(record, docs, budget=args.budget)
+        pack_ms.append((time.perf_counter() - started) * 1000)
+        before.append(stats["tokens_in"])
+        after.append(stats["tokens_out"])
+        kept.append(stats["documents_out"])
+
+        if client:
+            for label, selection in (("full", docs), ("packed", packed)):
+                prompt = build_prompt(record, selection)
+                tokens = client.models.count_tokens(model=args.model, contents=prompt).total_tokens
+                seconds = stream_first_token(client, args.model, prompt)
+                ttft[label].append(seconds)
+                print(f"case {case:>3} {label:<7} {tokens:>6} prompt tokens   first token {seconds:6.2f}s")
+
+    print(f"{args.cases} cases x {RETRIEVAL_K} abstracts, budget {args.budget} estimated tokens")
+    print(f"literature tokens  before: mean {statistics.fmean(before):7.0f}  min {min(before):6}  max {max(before):6}")
+    print(f"                   after:  mean {statistics.fmean(after):7.0f}  min {min(after):6}  max {max(after):6}")
+    print(f"abstracts kept: mean {statistics.fmean(kept):.1f} of {RETRIEVAL_K}   "
+          f"packing time: mean {statistics.fmean(pack_ms):.2f} ms")
+    if client:
+        for label, samples in ttft.items():
+            print(f"time to first token ({label}): mean {statistics.fmean(samples):.2f}s  "
+                  f"max {max(samples):.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Per-request document lookup cost against a local Postgres: fresh connection vs the pool,
+and one query per hit vs one query per request.
+
+Before the pool, every generateRecommendations request opened a new connection (and never
+closed it) and then ran one SELECT per retrieved hit. This creates an articles table like the
+production one, then times `--requests` requests of `--docs` documents each: a connection per
+request with a lookup per document as before, the pooled PostgresDocumentStorage looking up
+one document at a time, and its batched get_by_ids, all with the document cache off; then
+get_by_ids again with the in-process document cache on. get_by_ids is first checked against
+the single lookups, including order, duplicates and ids that do not exist. Request ids are
+drawn with a skew towards a few hundred hot articles, as retrieval for one condition is.
+
+The connection here is plain TCP to localhost; the Cloud SQL connector adds an mTLS handshake
+and certificate refresh on top, so production savings per request are larger.
+
+Usage:
+    python bench_pg_pool.py [--host localhost] [--port 5432] [--user postgres] [--password ...]
+                            [--db postgres] [--articles 5000] [--requests 200] [--docs 15]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+import pg8000.dbapi
+import sqlalchemy
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dha-generateRecommendations"))
+
+from document_cache import DocumentCache  # noqa: E402
+from main import PG_POOL_MAX_OVERFLOW, PG_POOL_RECYCLE_SECONDS, PG_POOL_SIZE, PostgresDocumentStorage  # noqa: E402
+
+
+def populate(connect: Callable[[], pg8000.dbapi.Connection], articles: int) -> None:
+    conn = connect()
+    cursor = conn.cursor()
+    cursor.execute("DROP TABLE IF EXISTS articles")
+    cursor.execute("CREATE TABLE articles (id TEXT PRIMARY KEY, title TEXT NOT NULL, abstract TEXT NOT NULL)")
+    rows = [(str(30000000 + i), f"Article {i}", f"Abstract of article {i}. " * 40) for i in range(articles)]
+    cursor.executemany("INSERT INTO articles (id, title, abstract) VALUES (%s, %s, %s)", rows)
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+
+def fresh_connection_request(connect: Callable[[], pg8000.dbapi.Connection], ids: List[str]) -> None:
+    conn = connect()
+    cursor = conn.cursor()
+    for document_id in ids:
+        cursor.execute("SELECT id, title, abstract FROM articles WHERE id = %s", (document_id,))
+        cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+
+def pooled_request(storage: PostgresDocumentStorage, ids: List[str]) -> None:
+    for document_id in ids:
+        storage.get_by_id(document_id)
+
+
+def batched_request(storage: PostgresDocumentStorage, ids: List[str]) -> None:
+    storage.get_by_ids(ids)
+
+
+def check_batched(storage: PostgresDocumentStorage, requests: List[List[str]]) -> None:
+    for ids in requests[:20]:
+        ids = ids + ["missing-id", ids[0]]
+        expected = [storage.get_by_id(i) for i in ids]
+        assert storage.get_by_ids(ids) == expected, "get_by_ids disagrees with get_by_id"
+    assert storage.get_by_ids([]) == []
+
+
+def timed(label: str, run: Callable[[List[str]], None], requests: List[List[str]]) -> float:
+    samples = []
+    for ids in requests:
+        started = time.perf_counter()
+        run(ids)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    mean = statistics.fmean(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    print(f"{label:<20} mean {mean:8.2f} ms   p50 {statistics.median(samples):8.2f} ms   p95 {p95:8.2f} ms")
+    return mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.environ.get("PGHOST", "localhost"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PGPORT", "5432")))
+    parser.add_argument("--user", default=os.environ.get("PGUSER", "postgres"))
+    parser.add_argument("--password", default=os.environ.get("PGPASSWORD"))
+    parser.add_argument("--db", default=os.environ.get("PGDATABASE", "postgres"))
+    parser.add_argument("--articles", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--docs", type=int, default=15, help="documents fetched per request (the retriever's k)")
+    parser.add_argument("--hot", type=int, default=300, help="articles that most requests retrieve")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    def connect() -> pg8000.dbapi.Connection:
+        return pg8000.dbapi.connect(user=args.user, password=args.password, host=args.host,
+                                    port=args.port, database=args.db)
+
+    populate(connect, args.articles)
+    rng = random.Random(args.seed)
+
+    def pick() -> str:
+        # Four in five hits come from the hot set
+        pool = args.hot if rng.random() < 0.8 else args.articles
+        return str(30000000 + rng.randrange(pool))
+
+    requests = [[pick() for _ in range(args.docs)] for _ in range(args.requests)]
+
+    engine = sqlalchemy.create_engine(
+        "postgresql+pg8000://", creator=connect, pool_size=PG_POOL_SIZE, max_overflow=PG_POOL_MAX_OVERFLOW,
+        pool_recycle=PG_POOL_RECYCLE_SECONDS, pool_pre_ping=True,
+    )
+    # A zero-byte cache holds nothing, so every lookup reaches the database
+    storage = PostgresDocumentStorage(engine=engine, cache=DocumentCache(max_bytes=0))
+    cache = DocumentCache()
+    cached_storage = PostgresDocumentStorage(engine=engine, cache=cache)
+
+    print(f"{args.requests} requests x {args.docs} lookups, {args.articles} articles")
+    check_batched(storage, requests)
+    before = timed("connection/request", lambda ids: fresh_connection_request(connect, ids), requests)
+    pooled = timed("pooled", lambda ids: pooled_request(storage, ids), requests)
+    batched = timed("pooled, batched", lambda ids: batched_request(storage, ids), requests)
+    cached = timed("batched, cached", lambda ids: batched_request(cached_storage, ids), requests)
+    print(f"setup cost removed: {before - pooled:.2f} ms/request ({before / pooled:.1f}x)")
+    print(f"batching saves a further {pooled - batched:.2f} ms/request ({pooled / batched:.1f}x)")
+    stats = cache.stats()
+    print(f"document cache saves a further {batched - cached:.2f} ms/request "
+          f"(hit ratio {stats['hit_ratio']:.1%}, {stats['entries']} articles, {stats['bytes'] / 2 ** 20:.1f} MiB)")
+    engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
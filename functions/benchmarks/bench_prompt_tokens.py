@@ -0,0 +1,66 @@
+"""Compare input size of the full-record prompt against the field-scoped prompt.
+
+Usage:
+    python bench_prompt_tokens.py            # estimate tokens offline (~4 characters per token)
+    python bench_prompt_tokens.py --gemini   # count tokens with the Gemini count_tokens API
+"""
+import argparse
+import copy
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dha-processMessage"))
+
+from prompt_builder import build_full_prompt, build_scoped_prompt  # noqa: E402
+from schema import QUESTIONS, RECORD_SCHEMA, get_path  # noqa: E402
+
+USER_MESSAGE = "I'd say most of the time, though I sometimes forget my evening dose."
+
+
+def filled_record():
+    record = copy.deepcopy(RECORD_SCHEMA)
+    record["symptoms"]["current"].update({"increased_thirst": True, "fatigue": True})
+    record["symptoms"]["blood_sugar"].update({
+        "check_frequency": "Daily", "fasting_range": "110-130 mg/dL", "post_meal_range": "under 180 mg/dL"})
+    record["symptoms"]["medications"].update({
+        "taking_medications": True,
+        "medication_list": [{"name": "Metformin", "dosage": "500mg twice daily"}],
+    })
+    return record
+
+
+def make_counter(use_gemini):
+    if not use_gemini:
+        return lambda text: len(text) // 4
+
+    from google import genai
+    client = genai.Client(vertexai=True, project="gemini-med-lit-review", location="us-central1")
+    return lambda text: client.models.count_tokens(model="gemini-2.5-pro", contents=text).total_tokens
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gemini", action="store_true", help="count tokens with the Gemini API")
+    args = parser.parse_args()
+    count = make_counter(args.gemini)
+
+    records = {"empty": {}, "schema defaults": copy.deepcopy(RECORD_SCHEMA), "partially filled": filled_record()}
+    print(f"{'record':<18} {'field':<38} {'full':>7} {'scoped':>7} {'saved':>7}")
+    total_full = total_scoped = 0
+    for name, record in records.items():
+        for field, question in QUESTIONS:
+            assert get_path(RECORD_SCHEMA, field) is not None, field
+            current_prompt = {"field": field, "prompt": question}
+            full = count(build_full_prompt(USER_MESSAGE, record, current_prompt))
+            scoped = count(build_scoped_prompt(USER_MESSAGE, record, current_prompt))
+            total_full += full
+            total_scoped += scoped
+            print(f"{name:<18} {field:<38} {full:>7} {scoped:>7} {1 - scoped / full:>6.0%}")
+
+    unit = "tokens" if args.gemini else "estimated tokens"
+    print(f"\nTotal {unit}: full={total_full} scoped={total_scoped} "
+          f"({1 - total_scoped / total_full:.0%} fewer input tokens per turn)")
+
+
+if __name__ == "__main__":
+    main()
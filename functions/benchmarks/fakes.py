@@ -0,0 +1,343 @@
+"""Offline stand-ins for Gemini, BigQuery and Vector Search, for benchmarking the functions locally.
+
+They replace the remote services, not the client libraries: responses are real google-genai and
+LangChain objects, so everything between the HTTP handler and the network runs as in production.
+
+    FakeGeminiClient       drop-in for genai.Client with configurable latency, output size and errors
+    FakeBigQueryClient     drop-in for bigquery.Client over an in-memory patient table
+    SQLiteVectorCorpus     synthetic PubMed-like corpus in SQLite, with a brute-force searcher,
+                           document storage and embeddings to build the real vector store from
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import sqlite3
+import struct
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from google.genai import errors, types
+
+WORDS = (
+    "glucose insulin metformin glycemic hba1c retinopathy neuropathy nephropathy cardiovascular "
+    "adherence lifestyle exercise diet obesity hypertension dyslipidemia sglt2 glp1 sulfonylurea "
+    "hypoglycemia fasting postprandial monitoring outcomes cohort randomized trial elderly adults "
+    "depression cognitive decline sleep fatigue thirst urination vision wound infection therapy"
+).split()
+
+
+@dataclass
+class LatencyProfile:
+    """Simulated service time: base + per_token * output tokens, with multiplicative jitter."""
+    base_ms: float = 800.0
+    per_token_ms: float = 10.0
+    first_token_ms: float = 400.0
+    jitter: float = 0.25
+    error_rate: float = 0.0
+
+    def sample(self, rng: random.Random, tokens: int = 0) -> float:
+        ms = self.base_ms + self.per_token_ms * tokens
+        return max(0.0, ms * rng.lognormvariate(0, self.jitter)) / 1000
+
+
+def _text(rng: random.Random, tokens: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(tokens))
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _prompt_text(contents: Any) -> str:
+    if isinstance(contents, str):
+        return contents
+    if isinstance(contents, (list, tuple)):
+        return " ".join(_prompt_text(item) for item in contents)
+    parts = getattr(contents, "parts", None)
+    if parts is not None:
+        return " ".join(part.text or "" for part in parts)
+    return getattr(contents, "text", None) or ""
+
+
+class FakeModels:
+    """The client.models surface the functions call."""
+
+    def __init__(self, profile: LatencyProfile, output_tokens: int, seed: int,
+                 model_speed: Optional[Dict[str, float]] = None) -> None:
+        self.profile = profile
+        self.output_tokens = output_tokens
+        self.model_speed = model_speed or {}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def generate_content(self, model: str, contents: Any, config: Any = None) -> types.GenerateContentResponse:
+        prompt, text, delay = self._prepare(model, contents, config)
+        time.sleep(delay)
+        return self._response(prompt, text)
+
+    def generate_content_stream(self, model: str, contents: Any,
+                                config: Any = None) -> Iterator[types.GenerateContentResponse]:
+        prompt, text, delay = self._prepare(model, contents, config)
+        first = self.profile.first_token_ms * self.model_speed.get(model, 1.0) / 1000
+        time.sleep(min(first, delay))
+        chunks = [text[i:i + 64] for i in range(0, len(text), 64)] or [""]
+        per_chunk = max(0.0, delay - first) / len(chunks)
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(per_chunk)
+            yield self._response(prompt, chunk)
+
+    def count_tokens(self, model: str, contents: Any, config: Any = None) -> types.CountTokensResponse:
+        return types.CountTokensResponse(total_tokens=_tokens(_prompt_text(contents)))
+
+    def _prepare(self, model: str, contents: Any, config: Any) -> Tuple[str, str, float]:
+        with self._lock:
+            self.calls += 1
+            if self._rng.random() < self.profile.error_rate:
+                raise errors.ServerError(503, {"error": {"code": 503, "message": "fake overload", "status": "UNAVAILABLE"}})
+            prompt = _prompt_text(contents)
+            text = self._reply(prompt, config)
+            delay = self.profile.sample(self._rng, _tokens(text)) * self.model_speed.get(model, 1.0)
+        return prompt, text, delay
+
+    def _reply(self, prompt: str, config: Any) -> str:
+        # Intake extraction expects a JSON record update; everything else gets free text
+        if "updated_record" in prompt or getattr(config, "response_mime_type", None) == "application/json":
+            return json.dumps({"updated_record": {}, "message": _text(self._rng, 12)})
+        return _text(self._rng, self.output_tokens)
+
+    def _response(self, prompt: str, text: str) -> types.GenerateContentResponse:
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(
+                content=types.Content(role="model", parts=[types.Part(text=text)]),
+                finish_reason=types.FinishReason.STOP,
+            )],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=_tokens(prompt),
+                candidates_token_count=_tokens(text),
+                total_token_count=_tokens(prompt) + _tokens(text),
+            ),
+        )
+
+
+class FakeGeminiClient:
+    """Stands in for genai.Client."""
+
+    def __init__(self, profile: Optional[LatencyProfile] = None, output_tokens: int = 400, seed: int = 0,
+                 model_speed: Optional[Dict[str, float]] = None) -> None:
+        """model_speed scales the latency of the named models, e.g. {"gemini-2.5-flash": 0.3}."""
+        self.models = FakeModels(profile or LatencyProfile(), output_tokens, seed, model_speed)
+
+
+# BigQuery
+
+MEDICATIONS = ["Metformin 500 MG", "Insulin Glargine", "Sitagliptin 100 MG", "Glipizide 5 MG",
+               "Empagliflozin 10 MG", "Liraglutide", "Lisinopril 10 MG", "Atorvastatin 20 MG"]
+
+
+class FakeRow(dict):
+    """Supports both row["column"] and row.column, like bigquery.Row."""
+
+    def __getattr__(self, name: str) -> Any:
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class FakeQueryJob:
+    def __init__(self, rows: List[FakeRow], delay: float) -> None:
+        self._rows = rows
+        self._delay = delay
+
+    def result(self, timeout: Optional[float] = None) -> List[FakeRow]:
+        time.sleep(self._delay)
+        return self._rows
+
+
+class FakeBigQueryClient:
+    """Stands in for bigquery.Client for the patient medication query.
+
+    Holds a synthetic table of diabetic patients and answers with the row the production query
+    returns for the @patient_id prefix: the first matching patient by last name.
+    """
+
+    def __init__(self, patients: int = 1000, profile: Optional[LatencyProfile] = None, seed: int = 0) -> None:
+        rng = random.Random(seed)
+        self.profile = profile or LatencyProfile(base_ms=600, per_token_ms=0, jitter=0.3)
+        self._rng = rng
+        self._lock = threading.Lock()
+        self.patients = []
+        for i in range(patients):
+            meds = rng.sample(MEDICATIONS, rng.randint(1, 4))
+            self.patients.append(FakeRow(
+                patientId=hashlib.md5(f"patient-{seed}-{i}".encode()).hexdigest(),
+                last_name=f"Patient{i:05d}",
+                First_name="Test",
+                Diabetes_Code="44054006",
+                Diabetes_Description="Diabetes",
+                Diabetes_Medications=", ".join(sorted(meds)),
+                Diabetes_Med_Count=len(meds),
+            ))
+        self.patients.sort(key=lambda row: row["last_name"])
+
+    def query(self, query: str, job_config: Any = None, **kwargs: Any) -> FakeQueryJob:
+        prefix = ""
+        for parameter in getattr(job_config, "query_parameters", None) or []:
+            if parameter.name == "patient_id":
+                prefix = parameter.value
+        rows = [row for row in self.patients if row["patientId"].startswith(prefix)][:1]
+        with self._lock:
+            if self._rng.random() < self.profile.error_rate:
+                raise RuntimeError("fake BigQuery error")
+            delay = self.profile.sample(self._rng)
+        return FakeQueryJob(rows, delay)
+
+
+# Vector Search
+
+def hashed_embedding(text: str, dimensions: int) -> List[float]:
+    """Deterministic bag-of-words embedding: each word hashed to a dimension, then L2-normalised."""
+    vector = [0.0] * dimensions
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        digest = hashlib.md5(word.encode()).digest()
+        index = int.from_bytes(digest[:4], "little") % dimensions
+        vector[index] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class SQLiteVectorCorpus:
+    """Synthetic article corpus with embeddings, stored in one SQLite database.
+
+    searcher(), document_storage() and embeddings() return the pieces VectorSearchVectorStorePostgres
+    is built from, so retrieval runs through the real LangChain vector store.
+    """
+
+    def __init__(self, path: str = ":memory:", articles: int = 5000, dimensions: int = 256,
+                 profile: Optional[LatencyProfile] = None, seed: int = 0) -> None:
+        self.dimensions = dimensions
+        self.profile = profile or LatencyProfile(base_ms=80, per_token_ms=0, jitter=0.3)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS articles (id TEXT PRIMARY KEY, title TEXT, abstract TEXT, embedding BLOB)"
+        )
+        if self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0] == 0:
+            self._populate(articles, seed)
+        self._ids: List[str] = []
+        self._vectors: List[Tuple[float, ...]] = []
+        for doc_id, blob in self._conn.execute("SELECT id, embedding FROM articles ORDER BY id"):
+            self._ids.append(doc_id)
+            self._vectors.append(struct.unpack(f"{dimensions}f", blob))
+
+    def _populate(self, articles: int, seed: int) -> None:
+        rng = random.Random(seed)
+        rows = []
+        for i in range(articles):
+            title = _text(rng, 8).capitalize()
+            abstract = _text(rng, 180)
+            vector = hashed_embedding(f"{title} {abstract}", self.dimensions)
+            rows.append((str(30000000 + i), title, abstract, struct.pack(f"{self.dimensions}f", *vector)))
+        self._conn.executemany("INSERT INTO articles VALUES (?, ?, ?, ?)", rows)
+        self._conn.commit()
+
+    def neighbors(self, vector: List[float], k: int) -> List[Tuple[str, float]]:
+        scored = [(sum(a * b for a, b in zip(vector, row)), doc_id) for doc_id, row in zip(self._ids, self._vectors)]
+        scored.sort(reverse=True)
+        return [(doc_id, score) for score, doc_id in scored[:k]]
+
+    def fetch(self, document_ids: List[str]) -> Dict[str, Tuple[str, str, str]]:
+        placeholders = ",".join("?" * len(document_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, title, abstract FROM articles WHERE id IN ({placeholders})", document_ids
+            ).fetchall()
+        return {row[0]: row for row in rows}
+
+    def delay(self) -> None:
+        with self._lock:
+            seconds = self.profile.sample(self._rng)
+        time.sleep(seconds)
+
+    def searcher(self) -> "FakeSearcher":
+        return FakeSearcher(self)
+
+    def document_storage(self):
+        return _sqlite_document_storage_class()(self)
+
+    def embeddings(self):
+        return _hashed_embeddings_class()(self.dimensions)
+
+
+class FakeSearcher:
+    """Stands in for VectorSearchSearcher: brute-force inner product over the corpus."""
+
+    def __init__(self, corpus: SQLiteVectorCorpus) -> None:
+        self._corpus = corpus
+
+    def find_neighbors(self, embeddings: List[List[float]], k: int = 4,
+                       filter_: Any = None, **kwargs: Any) -> List[List[Tuple[str, float]]]:
+        self._corpus.delay()
+        return [self._corpus.neighbors(embedding, k) for embedding in embeddings]
+
+    def remove_datapoints(self, datapoint_ids: List[str], **kwargs: Any) -> None:
+        raise NotImplementedError()
+
+    def add_to_index(self, ids: List[str], embeddings: List[List[float]], **kwargs: Any) -> None:
+        raise NotImplementedError()
+
+
+def _sqlite_document_storage_class():
+    from langchain_core.documents import Document
+    from langchain_google_vertexai.vectorstores._document_storage import DocumentStorage
+
+    class SQLiteDocumentStorage(DocumentStorage):
+        """Stands in for PostgresDocumentStorage, reading the corpus' article rows."""
+
+        def __init__(self, corpus: SQLiteVectorCorpus) -> None:
+            super().__init__()
+            self._corpus = corpus
+
+        def get_by_id(self, document_id: str) -> Optional[Document]:
+            return self.get_by_ids([document_id])[0]
+
+        def mget_by_ids(self, ids: List[str]) -> List[Optional[Document]]:
+            return self.get_by_ids(ids)
+
+        def get_by_ids(self, ids: List[str]) -> List[Optional[Document]]:
+            rows = self._corpus.fetch(list(ids))
+            return [
+                Document(page_content=rows[i][2], metadata={"id": rows[i][0], "title": rows[i][1]})
+                if i in rows else None
+                for i in ids
+            ]
+
+        def store_by_id(self, document_id: str, document: Document):
+            raise NotImplementedError()
+
+    return SQLiteDocumentStorage
+
+
+def _hashed_embeddings_class():
+    from langchain_core.embeddings import Embeddings
+
+    class HashedEmbeddings(Embeddings):
+        """Stands in for VertexAIEmbeddings with hashed_embedding()."""
+
+        def __init__(self, dimensions: int) -> None:
+            self.dimensions = dimensions
+
+        def embed_query(self, text: str) -> List[float]:
+            return hashed_embedding(text, self.dimensions)
+
+        def embed_documents(self, texts: List[str]) -> List[List[float]]:
+            return [hashed_embedding(text, self.dimensions) for text in texts]
+
+    return HashedEmbeddings
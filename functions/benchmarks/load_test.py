@@ -0,0 +1,311 @@
+"""Drive every function's HTTP entry point at fixed concurrency against offline service fakes.
+
+Gemini, BigQuery and Vector Search are replaced by the stand-ins in fakes.py; everything else
+(Flask handlers, prompt building, parsing, caches, the shared Gemini client) runs as deployed.
+Reports throughput, p50/p95/p99 latency, p50/p95 time to first byte (which differs from latency
+only for streamed responses) and error rate per scenario.
+
+Usage:
+    python load_test.py                                # all scenarios, 8 workers, 64 requests each
+    python load_test.py --only processMessage --concurrency 32 --requests 500
+    python load_test.py --save baseline.json           # record a baseline
+    python load_test.py --compare baseline.json        # exit 1 if p95, throughput or errors regress
+    python load_test.py --only generateRecommendations --retrieval-pipeline speculative
+"""
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from unittest import mock
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+FUNCTIONS_DIR = os.path.join(BENCH_DIR, "..")
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(FUNCTIONS_DIR, "shared"))
+
+from fakes import (  # noqa: E402
+    FakeBigQueryClient, FakeGeminiClient, LatencyProfile, SQLiteVectorCorpus,
+)
+
+# A 1x1 PNG, enough for the medication image handler to pass along
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360f8cf00000301010018dd8db00000000049454e44ae426082"
+)
+
+PATIENT_RECORD = {
+    "symptoms": {
+        "current": {"increased_thirst": True, "fatigue": True},
+        "blood_sugar": {"check_frequency": "Daily", "fasting_range": "140-180 mg/dL"},
+        "medications": {"taking_medications": True, "medication_list": ["Metformin 1000mg twice daily"]},
+    },
+    "lifestyle": {"diet": {"overall_health": "Somewhat healthy"}, "activity": {"exercise_frequency": "Rarely"}},
+}
+
+Scenario = Tuple[str, str, Callable[[random.Random, int], Dict[str, Any]]]
+
+
+def load_function(name: str):
+    """Import a function's main.py under a unique module name, with its directory on the path."""
+    directory = os.path.join(FUNCTIONS_DIR, name)
+    sys.path.insert(1, directory)
+    spec = importlib.util.spec_from_file_location(f"{name.replace('-', '_')}_main", os.path.join(directory, "main.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_app(args) -> Tuple[Any, List[Scenario], Dict[str, str]]:
+    """Load the functions with fakes installed and mount their handlers on one Flask app."""
+    from flask import Flask, request
+
+    import gemini_client
+    import model_router
+    gemini_client._client = FakeGeminiClient(
+        LatencyProfile(base_ms=args.llm_ms, per_token_ms=args.llm_per_token_ms,
+                       first_token_ms=args.llm_first_token_ms, error_rate=args.error_rate),
+        output_tokens=args.output_tokens,
+        seed=args.seed,
+        model_speed={model_router.FAST_MODEL: 1 / args.fast_model_speedup},
+    )
+    fake_bigquery = FakeBigQueryClient(patients=1000, seed=args.seed)
+    corpus = SQLiteVectorCorpus(articles=args.articles, seed=args.seed)
+
+    handlers: Dict[str, Callable] = {}
+    scenarios: List[Scenario] = []
+    skipped: Dict[str, str] = {}
+
+    def mount(name: str, handler_name: str, setup: Optional[Callable] = None):
+        try:
+            module = load_function(name)
+            if setup:
+                setup(module)
+            handlers[name] = getattr(module, handler_name)
+            return module
+        except Exception as e:
+            skipped[name] = f"{type(e).__name__}: {e}"
+            return None
+
+    process_message = mount("dha-processMessage", "process_message")
+    if process_message is not None:
+        from schema import QUESTIONS, empty_record
+        fields = dict(QUESTIONS)
+        with open(os.path.join(FUNCTIONS_DIR, "..", "frontend", "example_narrative.txt")) as f:
+            narrative = f.read()
+
+        def turn(field: str, message: str):
+            return lambda rng, i: {"json": {
+                "userMessage": message.format(n=rng.randint(1, 10 ** 6)),
+                "currentRecord": empty_record(),
+                "currentPrompt": {"field": field, "prompt": fields[field]},
+            }}
+
+        scenarios += [
+            ("processMessage:llm", "dha-processMessage", turn(
+                "symptoms.medications.medication_list", "Metformin 500mg twice a day and {n} units of insulin at night")),
+            ("processMessage:fast_path", "dha-processMessage", turn("symptoms.blood_sugar.check_frequency", "Daily")),
+            ("processMessage:narrative", "dha-processMessage", lambda rng, i: {"json": {
+                "action": "bulk_intake", "narrative": f"{narrative}\n(visit {rng.randint(1, 10 ** 6)})"}}),
+        ]
+
+    def fake_vector_store(module):
+        module.configure_vector_store = lambda: module.VectorSearchVectorStorePostgres(
+            searcher=corpus.searcher(),
+            document_storage=corpus.document_storage(),
+            embbedings=corpus.embeddings(),
+        )
+
+    if mount("dha-generateRecommendations", "generate_recommendations_http", fake_vector_store):
+        scenarios.append(("generateRecommendations", "dha-generateRecommendations", lambda rng, i: {"json": {
+            "patientRecord": {**PATIENT_RECORD, "age": rng.randint(30, 90)}}}))
+        scenarios.append(("generateRecommendations:stream", "dha-generateRecommendations", lambda rng, i: {"json": {
+            "patientRecord": {**PATIENT_RECORD, "age": rng.randint(30, 90)}, "stream": True}}))
+
+    if mount("dha-generateFollowUp", "generate_follow_up_letter_http"):
+        scenarios.append(("generateFollowUp", "dha-generateFollowUp", lambda rng, i: {"json": {
+            "patientRecord": {**PATIENT_RECORD, "age": rng.randint(30, 90)}}}))
+
+    if mount("dha-doctorSummaryAndQA", "doctor_summary_and_qa_http"):
+        scenarios.append(("doctorSummaryAndQA", "dha-doctorSummaryAndQA", lambda rng, i: {"json": {
+            "action": "summary", "currentRecord": {**PATIENT_RECORD, "age": rng.randint(30, 90)}}}))
+
+    if mount("dha-processMedicationImage", "process_medication_image"):
+        scenarios.append(("processMedicationImage", "dha-processMedicationImage", lambda rng, i: {
+            "data": {"image": (io.BytesIO(PNG_BYTES + rng.randbytes(8)), "label.png", "image/png")},
+            "content_type": "multipart/form-data"}))
+
+    def with_fake_bigquery(name: str, handler_name: str):
+        from google.cloud import bigquery
+        with mock.patch.object(bigquery, "Client", return_value=fake_bigquery):
+            return mount(name, handler_name)
+
+    if with_fake_bigquery("dha-queryPatientMedications", "query_patient_medications"):
+        scenarios.append(("queryPatientMedications", "dha-queryPatientMedications", lambda rng, i: {"json": {
+            "patientId": rng.choice(fake_bigquery.patients)["patientId"][:8]}}))
+
+    app = Flask(__name__)
+    for name, handler in handlers.items():
+        app.add_url_rule(f"/{name}", name, (lambda h: lambda: h(request))(handler), methods=["GET", "POST", "OPTIONS"])
+    return app, scenarios, skipped
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    # Nearest rank
+    return sorted_values[min(len(sorted_values), max(1, math.ceil(q * len(sorted_values)))) - 1]
+
+
+def run_scenario(app, path: str, make_request: Callable, requests: int, concurrency: int, seed: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    first_bytes: List[float] = []
+    statuses: Dict[str, int] = {}
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(worker_id: int) -> None:
+        client = app.test_client()
+        rng = random.Random(seed * 1000 + worker_id)
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            first_byte = None
+            try:
+                response = client.post(f"/{path}", buffered=False, **make_request(rng, i))
+                status = str(response.status_code)
+                body = iter(response.response)
+                next(body, None)
+                first_byte = (time.perf_counter() - started) * 1000
+                for _ in body:
+                    pass
+                response.close()
+            except Exception:
+                status = "exception"
+                traceback.print_exc(file=sys.stderr)
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                latencies.append(elapsed)
+                if first_byte is not None:
+                    first_bytes.append(first_byte)
+                statuses[status] = statuses.get(status, 0) + 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(worker, range(concurrency)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    first_bytes.sort()
+    errors = sum(count for status, count in statuses.items() if status == "exception" or int(status) >= 500)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 1),
+        "p95_ms": round(percentile(latencies, 0.95), 1),
+        "p99_ms": round(percentile(latencies, 0.99), 1),
+        "max_ms": round(latencies[-1], 1) if latencies else 0.0,
+        "ttfb_p50_ms": round(percentile(first_bytes, 0.50), 1),
+        "ttfb_p95_ms": round(percentile(first_bytes, 0.95), 1),
+        "statuses": statuses,
+    }
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Regressions against a saved run: slower p95, lower throughput or a higher error rate."""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+        if result["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {before['throughput_rps']} -> {result['throughput_rps']} req/s")
+        if result["error_rate"] > before["error_rate"] + 0.01:
+            regressions.append(f"{name}: error rate {before['error_rate']:.2%} -> {result['error_rate']:.2%}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario")
+    parser.add_argument("--only", action="append", help="run only scenarios starting with this name")
+    parser.add_argument("--llm-ms", type=float, default=800, help="fake Gemini base latency")
+    parser.add_argument("--llm-per-token-ms", type=float, default=10, help="fake Gemini latency per output token")
+    parser.add_argument("--llm-first-token-ms", type=float, default=400, help="fake Gemini time to first chunk")
+    parser.add_argument("--fast-model-speedup", type=float, default=3.0,
+                        help="how much faster the fake Flash model answers than Pro")
+    parser.add_argument("--output-tokens", type=int, default=400, help="fake Gemini free-text reply length")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake Gemini calls that return 503")
+    parser.add_argument("--articles", type=int, default=5000, help="fake Vector Search corpus size")
+    parser.add_argument("--llm-cache", action="store_true", help="leave the Gemini response cache enabled")
+    parser.add_argument("--retrieval-pipeline", choices=["serial", "speculative"], default="serial",
+                        help="generateRecommendations retrieval mode")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--save", help="write results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    # Keep local state out of /tmp so runs do not warm each other up
+    state_dir = tempfile.mkdtemp(prefix="load_test_")
+    os.environ["LLM_CACHE_ENABLED"] = "1" if args.llm_cache else "0"
+    os.environ["LLM_CACHE_DISK_ENABLED"] = os.environ["LLM_CACHE_ENABLED"]
+    os.environ["LLM_CACHE_DB_PATH"] = os.path.join(state_dir, "llm_cache.db")
+    os.environ["SESSION_DB_PATH"] = os.path.join(state_dir, "sessions.db")
+    # Every simulated client shares one address; per-client rate limits would throttle the whole run
+    os.environ["RATE_LIMIT_PER_MINUTE"] = "0"
+    os.environ["RETRIEVAL_PIPELINE"] = args.retrieval_pipeline
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        app, scenarios, skipped = build_app(args)
+    logging.disable(logging.WARNING)
+
+    for name, reason in skipped.items():
+        print(f"skipped {name}: {reason}", file=sys.stderr)
+    if args.only:
+        scenarios = [s for s in scenarios if any(s[0].startswith(prefix) for prefix in args.only)]
+
+    results: Dict[str, Dict[str, Any]] = {}
+    print(f"{'scenario':<28} {'reqs':>5} {'err%':>6} {'req/s':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} "
+          f"{'ttfb p50':>8} {'ttfb p95':>8}")
+    for name, path, make_request in scenarios:
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = run_scenario(app, path, make_request, args.requests, args.concurrency, args.seed)
+        results[name] = result
+        print(f"{name:<28} {result['requests']:>5} {result['error_rate']:>6.1%} {result['throughput_rps']:>7.2f} "
+              f"{result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f} "
+              f"{result['ttfb_p50_ms']:>8.1f} {result['ttfb_p95_ms']:>8.1f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
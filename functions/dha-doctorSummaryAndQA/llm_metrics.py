@@ -0,0 +1 @@
+../shared/llm_metrics.py
\ No newline at end of file
@@ -1,42 +1,16 @@
-from google import genai
-from google.genai import types
 import functions_framework
 from flask import jsonify, request
 import os
 
-# Initialize Gemini client
-client = genai.Client(
-    vertexai=True,
-    project="gemini-med-lit-review",
-    location="us-central1",
-)
-
-model = "gemini-2.5-pro"
+import admission
+import gemini_client
+import llm_metrics
+import single_flight
 
 textsi_1 = """You are a helpful and friendly medical assistant AI. Your purpose is to assist healthcare professionals by providing summaries of patient records and answering medical questions. Always prioritize patient safety and refer to the most up-to-date medical guidelines. If you're unsure about any information, clearly state that and suggest consulting with a specialist or referring to recent medical literature."""
 
-generate_content_config = types.GenerateContentConfig(
+generate_content_config = gemini_client.make_config(
     temperature=0.9,
-    top_p=0.95,
-    max_output_tokens=8192,
-    safety_settings=[
-        types.SafetySetting(
-            category="HARM_CATEGORY_HATE_SPEECH",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_DANGEROUS_CONTENT",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_HARASSMENT",
-            threshold="OFF"
-        )
-    ],
     system_instruction=textsi_1,
 )
 
@@ -61,22 +35,17 @@ def doctor_summary_and_qa(action, current_record, question=None):
     else:
         raise ValueError("Invalid action specified")
 
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part(text=prompt)]
-        )
-    ]
-
-    response = client.models.generate_content(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    )
+    response = gemini_client.generate_content(gemini_client.user_content(prompt), generate_content_config,
+                                            cache=False, operation=action)
     
     return response.text
 
+# Double-clicks and client retries share the generation already running for the same request
+in_flight = single_flight.SingleFlight()
+
 @functions_framework.http
+@llm_metrics.instrumented("dha-doctorSummaryAndQA")
+@admission.rate_limited
 def doctor_summary_and_qa_http(request):
     """HTTP Cloud Function."""
     # Handle CORS preflight request
@@ -103,13 +72,18 @@ def doctor_summary_and_qa_http(request):
         if not action or not current_record:
             return jsonify({'error': 'Missing required parameters'}), 400, headers
 
-        result = doctor_summary_and_qa(action, current_record, question)
+        result = in_flight.do(
+            single_flight.request_key(action, current_record, question),
+            lambda: doctor_summary_and_qa(action, current_record, question),
+        )
 
         if action == 'summary':
             return jsonify({'summary': result}), 200, headers
         elif action == 'question':
             return jsonify({'answer': result}), 200, headers
 
+    except admission.Overloaded as e:
+        return jsonify({'error': str(e)}), e.status, {**headers, **e.headers()}
     except Exception as e:
         return jsonify({'error': str(e)}), 500, headers
 
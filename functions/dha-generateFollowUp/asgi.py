@@ -0,0 +1,92 @@
+"""ASGI entry point for the follow-up letter, built on the async Gemini client.
+
+Both Gemini calls are awaited on the event loop instead of holding a request thread, so one
+instance can keep many letters in flight. Serve with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+import json
+import logging
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response
+from starlette.routing import Route
+
+import admission
+import gemini_client
+import llm_metrics
+from main import build_letter_prompt, build_recommendations_prompt, generate_content_config
+
+logger = logging.getLogger(__name__)
+
+async def agenerate_follow_up_letter(patient_record, recommendations=None):
+    if not recommendations:
+        rec_response = await gemini_client.agenerate_content(
+            gemini_client.user_content(build_recommendations_prompt(patient_record)), generate_content_config,
+            cache=False, operation="recommendations")
+        recommendations = rec_response.text
+
+    prompt = build_letter_prompt(patient_record, recommendations)
+    generated_letter = ""
+    async for chunk in gemini_client.agenerate_content_stream(gemini_client.user_content(prompt),
+                                                              generate_content_config,
+                                                              cache=False, operation="letter"):
+        generated_letter += chunk.text
+
+    return generated_letter
+
+@llm_metrics.instrumented_async("dha-generateFollowUp")
+async def generate_follow_up_letter_asgi(request: Request):
+    """Async counterpart of generate_follow_up_letter_http."""
+    if request.method == 'OPTIONS':
+        headers = {
+            'Access-Control-Allow-Origin': '*',
+            'Access-Control-Allow-Methods': 'POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Max-Age': '3600'
+        }
+        return Response(status_code=204, headers=headers)
+
+    headers = {
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    try:
+        admission.rate_limiter.check(
+            admission.client_key(request.headers, request.client.host if request.client else None))
+        try:
+            request_json = await request.json()
+        except json.JSONDecodeError:
+            request_json = None
+        if not request_json:
+            return JSONResponse({"error": "No JSON data provided"}, 400, headers)
+
+        patient_record = request_json.get('patientRecord')
+        recommendations = request_json.get('recommendations', '')
+
+        if not patient_record:
+            return JSONResponse({'error': 'Missing patient record'}, 400, headers)
+
+        follow_up_letter = await agenerate_follow_up_letter(patient_record, recommendations)
+
+        return JSONResponse({
+            "letter": follow_up_letter
+        }, 200, headers)
+
+    except admission.Overloaded as e:
+        logger.warning(f"Turned away follow-up letter: {str(e)}")
+        return JSONResponse({"error": str(e)}, e.status, {**headers, **e.headers()})
+    except Exception as e:
+        logger.error(f"Error generating follow-up letter: {str(e)}")
+        return JSONResponse({
+            "error": "An unexpected error occurred. Please try again later."
+        }, 500, headers)
+
+async def metrics(request: Request):
+    return PlainTextResponse(llm_metrics.metrics.render(), media_type=llm_metrics.METRICS_CONTENT_TYPE)
+
+app = Starlette(routes=[
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/', generate_follow_up_letter_asgi, methods=['POST', 'OPTIONS']),
+])
@@ -1,72 +1,29 @@
-from google import genai
-from google.genai import types
 import functions_framework
 from flask import jsonify, request
 import json
 import logging
 import os
 
+import admission
+import gemini_client
+import llm_metrics
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client
-client = genai.Client(
-    vertexai=True,
-    project="gemini-med-lit-review",
-    location="us-central1",
-)
-
-model = "gemini-2.5-pro"
-
-generate_content_config = types.GenerateContentConfig(
-    temperature=0.7,
-    top_p=0.95,
-    max_output_tokens=8192,
-    safety_settings=[
-        types.SafetySetting(
-            category="HARM_CATEGORY_HATE_SPEECH",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_DANGEROUS_CONTENT",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-            threshold="OFF"
-        ),
-        types.SafetySetting(
-            category="HARM_CATEGORY_HARASSMENT",
-            threshold="OFF"
-        )
-    ],
-)
+generate_content_config = gemini_client.make_config(temperature=0.7)
 
-def generate_follow_up_letter(patient_record, recommendations=None):
-    if not recommendations:
-        rec_prompt = f"""
+def build_recommendations_prompt(patient_record):
+    return f"""
         Based on the following patient record, generate 3-5 medically sound recommendations:
         {json.dumps(patient_record, indent=2)}
         
         Provide the recommendations in a list format.
         """
-        
-        rec_contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=rec_prompt)]
-            )
-        ]
-        
-        rec_response = client.models.generate_content(
-            model=model,
-            contents=rec_contents,
-            config=generate_content_config,
-        )
-        recommendations = rec_response.text
 
-    prompt = f"""
+def build_letter_prompt(patient_record, recommendations):
+    return f"""
     You are a caring and professional physician. Generate a follow-up letter for a patient based on their medical record and recommendations. The letter should be pleasant, informative, and mention any referrals or actions the facility will handle for the patient.
 
     Patient Record:
@@ -92,24 +49,24 @@ def generate_follow_up_letter(patient_record, recommendations=None):
     - Wrap the entire content in a <div> with class "follow-up-letter"
     """
 
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part(text=prompt)]
-        )
-    ]
+def generate_follow_up_letter(patient_record, recommendations=None):
+    if not recommendations:
+        rec_response = gemini_client.generate_content(
+            gemini_client.user_content(build_recommendations_prompt(patient_record)), generate_content_config,
+            cache=False, operation="recommendations")
+        recommendations = rec_response.text
 
+    prompt = build_letter_prompt(patient_record, recommendations)
     generated_letter = ""
-    for chunk in client.models.generate_content_stream(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    ):
+    for chunk in gemini_client.generate_content_stream(gemini_client.user_content(prompt), generate_content_config,
+                                                       cache=False, operation="letter"):
         generated_letter += chunk.text
 
     return generated_letter
 
 @functions_framework.http
+@llm_metrics.instrumented("dha-generateFollowUp")
+@admission.rate_limited
 def generate_follow_up_letter_http(request):
     """HTTP Cloud Function for generating follow-up letters."""
     # Handle CORS preflight request
@@ -144,6 +101,9 @@ def generate_follow_up_letter_http(request):
             "letter": follow_up_letter
         }), 200, headers
 
+    except admission.Overloaded as e:
+        logger.warning(f"Turned away follow-up letter: {str(e)}")
+        return jsonify({"error": str(e)}), e.status, {**headers, **e.headers()}
     except Exception as e:
         logger.error(f"Error generating follow-up letter: {str(e)}")
         return jsonify({
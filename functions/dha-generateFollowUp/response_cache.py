@@ -0,0 +1 @@
+../shared/response_cache.py
\ No newline at end of file
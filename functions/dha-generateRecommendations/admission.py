@@ -0,0 +1 @@
+../shared/admission.py
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""ASGI entry point for the recommendations pipeline.
+
+The pipeline stages are main's, run in worker threads so the event loop stays free while they
+block on Gemini and the vector store. A streamed report is read from the async Gemini client
+once its documents are retrieved. Serve with:
+
+    uvicorn asgi:app --host 0.0.0.0 --port $PORT
+"""
+import asyncio
+import json
+import logging
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+import admission
+import gemini_client
+import llm_metrics
+import main
+import single_flight
+from speculative import StageTimings
+
+logger = logging.getLogger(__name__)
+
+async def agenerate_recommendations_pipeline(patient_record, mode=None):
+    """main.recommendations_pipeline in a worker thread."""
+    return await asyncio.to_thread(main.recommendations_pipeline, patient_record, mode)
+
+async def astream_recommendations_pipeline(patient_record, mode=None):
+    """Async counterpart of main.stream_recommendations_pipeline."""
+    timings = StageTimings(mode or main.RETRIEVAL_PIPELINE)
+    events = main.RecommendationEvents(timings)
+    try:
+        retrieved_docs, source = await asyncio.to_thread(main.retrieve_for_record, patient_record, timings)
+        yield events.documents(retrieved_docs, source)
+
+        with timings.stage("recommendations"):
+            prompt = main.build_packed_recommendations_prompt(patient_record, retrieved_docs)
+            async for chunk in gemini_client.agenerate_content_stream(
+                    gemini_client.user_content(prompt), main.generate_content_config,
+                    cache=False, operation="recommendations_stream"):
+                if chunk.text:
+                    yield events.message(chunk.text)
+        yield events.done()
+    except Exception as e:
+        yield events.error(e)
+
+@llm_metrics.instrumented_async("dha-generateRecommendations")
+async def generate_recommendations_asgi(request: Request):
+    """Async counterpart of generate_recommendations_http."""
+    if request.method == "OPTIONS":
+        headers = {
+            "Access-Control-Allow-Origin": request.headers.get("Origin", "*"),
+            "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
+            "Access-Control-Allow-Headers": "Content-Type",
+            "Access-Control-Allow-Credentials": "true",
+            "Access-Control-Max-Age": "3600"
+        }
+        return Response(status_code=204, headers=headers)
+
+    headers = {
+        "Access-Control-Allow-Origin": request.headers.get("Origin", "*"),
+        "Access-Control-Allow-Credentials": "true"
+    }
+
+    try:
+        admission.rate_limiter.check(
+            admission.client_key(request.headers, request.client.host if request.client else None))
+    except admission.Overloaded as e:
+        return JSONResponse({'error': str(e)}, e.status, {**headers, **e.headers()})
+
+    try:
+        request_json = await request.json()
+    except json.JSONDecodeError:
+        request_json = None
+
+    if not request_json or 'patientRecord' not in request_json:
+        return JSONResponse({'error': 'No patient record provided'}, 400, headers)
+
+    patient_record = request_json['patientRecord']
+
+    if request_json.get('stream') or 'text/event-stream' in request.headers.get('accept', ''):
+        return StreamingResponse(astream_recommendations_pipeline(patient_record), 200, {
+            **headers,
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }, media_type='text/event-stream')
+
+    try:
+        recommendations, retrieved_docs = await main.in_flight.ado(
+            single_flight.request_key("recommendations", patient_record),
+            lambda: agenerate_recommendations_pipeline(patient_record),
+        )
+
+        return JSONResponse({
+            'recommendations': recommendations,
+            'documents': retrieved_docs[:5]  # Send only the first 5 documents
+        }, 200, headers)
+    except admission.Overloaded as e:
+        return JSONResponse({'error': str(e)}, e.status, {**headers, **e.headers()})
+    except Exception as e:
+        logger.error(f"Error generating recommendations: {str(e)}")
+        return JSONResponse({'error': str(e)}, 500, headers)
+
+async def metrics(request: Request):
+    return PlainTextResponse(llm_metrics.metrics.render(), media_type=llm_metrics.METRICS_CONTENT_TYPE)
+
+app = Starlette(routes=[
+    Route('/metrics', metrics, methods=['GET']),
+    Route('/', generate_recommendations_asgi, methods=['POST', 'OPTIONS']),
+])
@@ -0,0 +1,233 @@
+"""Recommendations for a whole panel of patients, as a batch job.
+
+Patients are taken in chunks of --chunk-size. For each chunk, retrieval queries are built for
+every patient (retrieval summaries generated in parallel, or local keyword queries with
+--query keywords), then embedded, searched and their documents fetched in one batch, with each
+distinct article read once (main.retrieve_batch). Recommendations are generated by a pool of
+--workers threads; the next chunk's retrieval runs while the previous chunk is still generating,
+and a chunk is not started until the one before the previous has finished. The job's own Gemini
+calls wait for one of GEMINI_MAX_IN_FLIGHT slots before reaching the admission gate, so however
+many workers there are, none is turned away by its queue timeout. A patient whose summary fails
+is failed on its own; the rest of the chunk goes on.
+
+Results are appended to the output file, one JSON line per patient, as each finishes. That file
+is the checkpoint: a rerun with the same output skips patients already done and retries those
+that failed. Throughput in patients per minute is logged after each chunk and at the end.
+
+Input is a JSON list or JSONL of {"patientId": ..., "patientRecord": ...}; without a patientId,
+a hash of the record identifies the patient.
+
+Usage:
+    python batch.py panel.jsonl results.jsonl [--workers 8] [--chunk-size 32] [--query summary]
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Set
+
+import admission
+import main
+import single_flight
+from speculative import keyword_query
+
+logger = logging.getLogger(__name__)
+
+BATCH_WORKERS = int(os.environ.get("BATCH_WORKERS", "8"))
+BATCH_CHUNK_SIZE = int(os.environ.get("BATCH_CHUNK_SIZE", "32"))
+
+
+def read_panel(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        entries = json.loads(text)
+    else:
+        entries = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return [{"patientId": str(entry.get("patientId") or single_flight.request_key("patient", entry["patientRecord"])),
+             "patientRecord": entry["patientRecord"]}
+            for entry in entries]
+
+
+def completed_ids(path: str) -> Set[str]:
+    """Patients with a successful result in the checkpoint file."""
+    done: Set[str] = set()
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run; that patient is redone
+                continue
+            if result.get("status") == "ok":
+                done.add(result["patientId"])
+    return done
+
+
+class Checkpoint:
+    """Append-only JSONL of results, flushed per patient so an interrupted run loses nothing done."""
+
+    def __init__(self, path: str) -> None:
+        cut_short = os.path.exists(path) and os.path.getsize(path) > 0 and not _ends_with_newline(path)
+        self._file = open(path, "a")
+        if cut_short:
+            # Keep the next result off the line an interrupted run left unfinished
+            self._file.write("\n")
+        self._lock = threading.Lock()
+
+    def write(self, result: Dict[str, Any]) -> None:
+        with self._lock:
+            self._file.write(json.dumps(result) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _ends_with_newline(path: str) -> bool:
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b"\n"
+
+
+class Progress:
+    def __init__(self, total: int) -> None:
+        self.total = total
+        self.succeeded = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            minutes = (time.perf_counter() - self.started) / 60
+            done = self.succeeded + self.failed
+            return {
+                "patients": self.total,
+                "succeeded": self.succeeded,
+                "failed": self.failed,
+                "minutes": round(minutes, 2),
+                "patients_per_minute": round(done / minutes, 2) if minutes else 0.0,
+            }
+
+
+def retrieval_queries(records: List[Any], query_mode: str, pool: ThreadPoolExecutor,
+                      gemini_slots: threading.Semaphore) -> List[Any]:
+    """A query per record, or the exception its summary failed with."""
+    if query_mode == "keywords":
+        return [keyword_query(record) for record in records]
+
+    def summarise(record: Any) -> Any:
+        try:
+            with gemini_slots:
+                return main.generate_summary_for_retrieval(record)
+        except Exception as e:
+            return e
+
+    return list(pool.map(summarise, records))
+
+
+def fail(patient: Dict[str, Any], stage: str, error: Exception, checkpoint: Checkpoint, progress: Progress) -> None:
+    logger.error(f"{stage} failed for patient {patient['patientId']}: {str(error)}")
+    checkpoint.write({"patientId": patient["patientId"], "status": "error", "error": str(error)})
+    progress.record(False)
+
+
+def generate_one(patient: Dict[str, Any], documents: List[Dict[str, Any]], checkpoint: Checkpoint,
+                 progress: Progress, gemini_slots: threading.Semaphore) -> None:
+    try:
+        with gemini_slots:
+            recommendations = main.generate_recommendations(patient["patientRecord"], documents)
+        checkpoint.write({"patientId": patient["patientId"], "status": "ok",
+                          "recommendations": recommendations, "documents": documents[:5]})
+        progress.record(True)
+    except Exception as e:
+        fail(patient, "Recommendations", e, checkpoint, progress)
+
+
+def run_panel(patients: List[Dict[str, Any]], output_path: str, workers: int = BATCH_WORKERS,
+              chunk_size: int = BATCH_CHUNK_SIZE, query_mode: str = "summary") -> Dict[str, Any]:
+    """Generate recommendations for every patient not already done in output_path; returns the run's stats."""
+    done = completed_ids(output_path)
+    # A patient listed twice is run once
+    pending = list({patient["patientId"]: patient for patient in patients
+                    if patient["patientId"] not in done}.values())
+    logger.info(f"{len(patients)} patients, {len(done)} already done, {len(pending)} to run")
+
+    # More threads than Gemini slots would only queue at the admission gate
+    workers = max(1, min(workers, admission.gate.max_in_flight))
+    # Shared by both pools: the job's Gemini calls wait here, without the gate's queue timeout
+    gemini_slots = threading.BoundedSemaphore(admission.gate.max_in_flight)
+    checkpoint = Checkpoint(output_path)
+    progress = Progress(len(pending))
+    hits = distinct = 0
+    vector_store = main.get_vector_store()
+    previous: List[Future] = []
+    try:
+        # The pools are shut down, and their last results written, before the checkpoint closes
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-summary") as summary_pool, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-generate") as generate_pool:
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                queries = retrieval_queries([patient["patientRecord"] for patient in chunk], query_mode,
+                                            summary_pool, gemini_slots)
+                retrievable = []
+                for patient, query in zip(chunk, queries):
+                    if isinstance(query, Exception):
+                        fail(patient, "Retrieval summary", query, checkpoint, progress)
+                    else:
+                        retrievable.append((patient, query))
+
+                current: List[Future] = []
+                try:
+                    documents = main.retrieve_batch([query for _, query in retrievable], vector_store) \
+                        if retrievable else []
+                except Exception as e:
+                    for patient, _ in retrievable:
+                        fail(patient, "Retrieval", e, checkpoint, progress)
+                else:
+                    hits += sum(len(docs) for docs in documents)
+                    distinct += len({doc["pmid"] for docs in documents for doc in docs})
+                    current = [generate_pool.submit(generate_one, patient, docs, checkpoint, progress, gemini_slots)
+                               for (patient, _), docs in zip(retrievable, documents)]
+
+                # At most two chunks are generating or queued at once
+                for future in previous:
+                    future.result()
+                previous = current
+                logger.info(f"Retrieved for {start + len(chunk)}/{len(pending)} patients; {progress.report()}")
+            for future in previous:
+                future.result()
+    finally:
+        checkpoint.close()
+
+    stats = {**progress.report(), "already_done": len(done), "document_hits": hits, "documents_fetched": distinct}
+    logger.info(f"Panel finished: {stats}")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate recommendations for a panel of patients.")
+    parser.add_argument("panel", help="JSON list or JSONL of {patientId, patientRecord}")
+    parser.add_argument("output", help="JSONL results, also the checkpoint for resuming")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=BATCH_CHUNK_SIZE)
+    parser.add_argument("--query", choices=["summary", "keywords"], default="summary",
+                        help="retrieve with a generated summary, or with keywords taken from the record")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    stats = run_panel(read_panel(args.panel), args.output, args.workers, args.chunk_size, args.query)
+    print(json.dumps(stats))
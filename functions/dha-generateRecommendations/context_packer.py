@@ -0,0 +1,130 @@
+"""Token-budgeted packing of retrieved abstracts into the recommendations prompt.
+
+Retrieval returns RETRIEVAL_K abstracts of whatever length; pasted in full, the prompt (and with it
+time to first token) varies widely from case to case. pack_context() fits them to a budget:
+
+1. Rerank the hits by TF-IDF cosine similarity to the patient record's filled values
+   (speculative.case_values, so schema keys and denied symptoms do not count), with the vector
+   search rank as a small prior.
+2. Select in maximal marginal relevance order, so each pick is relevant but unlike the ones
+   already taken; hits at least CONTEXT_DUPLICATE_SIMILARITY alike an earlier pick are dropped.
+3. Trim each abstract to its sentences most similar to the record, kept in their original
+   order, and stop adding abstracts once the budget is spent.
+
+Tokens are estimated at ~4 characters each, as in the prompt benchmarks; no API call is made.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, List, Sequence, Tuple
+
+from speculative import STOPWORDS, case_values
+
+CONTEXT_PACKING_ENABLED = os.environ.get("CONTEXT_PACKING_ENABLED", "1") == "1"
+# Estimated tokens of literature in the recommendations prompt
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", "4000"))
+CONTEXT_MAX_SENTENCES = int(os.environ.get("CONTEXT_MAX_SENTENCES", "6"))
+# Weight of relevance against novelty when selecting; 1 ignores redundancy
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", "0.7"))
+CONTEXT_DUPLICATE_SIMILARITY = float(os.environ.get("CONTEXT_DUPLICATE_SIMILARITY", "0.85"))
+# Relevance bonus of the top vector search hit, falling linearly to 0 for the last
+RANK_PRIOR = 0.1
+CHARS_PER_TOKEN = 4
+
+Vector = Dict[str, float]
+
+_WORD = re.compile(r"[a-z][a-z0-9'-]*|\d+(?:\.\d+)?")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\[])")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def format_document(doc: Dict[str, Any]) -> str:
+    return f"Title: {doc['title']}\nAbstract: {doc['content']}\nPMID: {doc['pmid']}"
+
+
+def literature_tokens(docs: Sequence[Dict[str, Any]]) -> int:
+    return estimate_tokens("\n\n".join(format_document(doc) for doc in docs))
+
+
+def _terms(text: str) -> Counter:
+    return Counter(word for word in _WORD.findall(text.lower()) if word not in STOPWORDS)
+
+
+def _vector(terms: Counter, idf: Dict[str, float]) -> Vector:
+    vector = {term: count * idf.get(term, 1.0) for term, count in terms.items()}
+    norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+    return {term: value / norm for term, value in vector.items()}
+
+
+def _cosine(a: Vector, b: Vector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(value * b.get(term, 0.0) for term, value in a.items())
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+def _trim(content: str, query: Vector, idf: Dict[str, float], max_sentences: int, max_tokens: int) -> str:
+    """The abstract's sentences most similar to the query, in their original order, within max_tokens."""
+    sentences = split_sentences(content)
+    ranked = sorted(range(len(sentences)), key=lambda i: -_cosine(query, _vector(_terms(sentences[i]), idf)))
+    kept: List[int] = []
+    tokens = 0
+    for i in ranked[:max_sentences]:
+        cost = estimate_tokens(sentences[i]) + 1
+        if tokens + cost <= max_tokens:
+            kept.append(i)
+            tokens += cost
+    return " ".join(sentences[i] for i in sorted(kept))
+
+
+def pack_context(patient_record: Any, docs: Sequence[Dict[str, Any]], budget: int = CONTEXT_TOKEN_BUDGET,
+                 max_sentences: int = CONTEXT_MAX_SENTENCES, mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+                 duplicate_similarity: float = CONTEXT_DUPLICATE_SIMILARITY
+                 ) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Reranked, deduplicated and trimmed documents within `budget` estimated tokens, with stats."""
+    stats = {"documents_in": len(docs), "tokens_in": literature_tokens(docs), "duplicates": 0}
+    if not docs:
+        return [], {**stats, "documents_out": 0, "tokens_out": 0}
+
+    doc_terms = [_terms(f"{doc['title']} {doc['content']}") for doc in docs]
+    idf = {term: math.log((1 + len(docs)) / (1 + df)) + 1
+           for term, df in Counter(term for terms in doc_terms for term in terms).items()}
+    query = _vector(_terms(" ".join(case_values(patient_record))), idf)
+    vectors = [_vector(terms, idf) for terms in doc_terms]
+    relevance = [_cosine(query, vector) + RANK_PRIOR * (len(docs) - rank) / len(docs)
+                 for rank, vector in enumerate(vectors)]
+
+    selected: List[int] = []
+    remaining = list(range(len(docs)))
+    while remaining:
+        def mmr(i: int) -> float:
+            redundancy = max((_cosine(vectors[i], vectors[j]) for j in selected), default=0.0)
+            return mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=mmr)
+        remaining.remove(best)
+        if any(_cosine(vectors[best], vectors[j]) >= duplicate_similarity for j in selected):
+            stats["duplicates"] += 1
+            continue
+        selected.append(best)
+
+    packed: List[Dict[str, Any]] = []
+    spent = 0
+    for i in selected:
+        doc = docs[i]
+        overhead = estimate_tokens(format_document({**doc, "content": ""})) + 1
+        if spent + overhead >= budget:
+            break
+        content = _trim(doc["content"], query, idf, max_sentences, budget - spent - overhead)
+        if not content:
+            continue
+        packed.append({**doc, "content": content})
+        spent += overhead + estimate_tokens(content)
+
+    return packed, {**stats, "documents_out": len(packed), "tokens_out": literature_tokens(packed)}
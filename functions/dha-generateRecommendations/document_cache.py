@@ -0,0 +1,100 @@
+"""In-process cache of article rows for PostgresDocumentStorage.
+
+Retrieval for diabetes cases keeps returning the same few hundred PMIDs, so their rows are kept
+in memory and cached reads skip Cloud SQL. The cache is bounded by the approximate memory of
+the rows it holds (DOCUMENT_CACHE_MAX_BYTES) and evicts least recently used rows first. Rows are
+stored rather than Document objects, so every read gets a fresh Document that callers may
+modify. Lookups and the cache's size are exported through llm_metrics.
+
+Set DOCUMENT_CACHE_WARM_IDS_FILE to a file of PMIDs (one per line) to load them at start-up.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from llm_metrics import metrics
+
+DOCUMENT_CACHE_ENABLED = os.environ.get("DOCUMENT_CACHE_ENABLED", "1") == "1"
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get("DOCUMENT_CACHE_MAX_BYTES", str(64 * 2 ** 20)))
+DOCUMENT_CACHE_WARM_IDS_FILE = os.environ.get("DOCUMENT_CACHE_WARM_IDS_FILE")
+
+# (id, title, abstract), as selected from the articles table
+Row = Tuple[str, str, str]
+
+# Per-entry bookkeeping on top of the strings themselves: the tuple and the OrderedDict node
+_ENTRY_OVERHEAD = 200
+
+
+def row_size(row: Row) -> int:
+    return sum(sys.getsizeof(value) for value in row) + _ENTRY_OVERHEAD
+
+
+class DocumentCache:
+    def __init__(self, max_bytes: int = DOCUMENT_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._rows: "OrderedDict[str, Tuple[Row, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, document_ids: List[str]) -> Dict[str, Row]:
+        """Cached rows among document_ids; each distinct id is counted as a hit or a miss."""
+        found: Dict[str, Row] = {}
+        missed = 0
+        with self._lock:
+            for document_id in dict.fromkeys(document_ids):
+                entry = self._rows.get(document_id)
+                if entry is None:
+                    missed += 1
+                    continue
+                self._rows.move_to_end(document_id)
+                found[document_id] = entry[0]
+            self.hits += len(found)
+            self.misses += missed
+        metrics.record_document_cache(hits=len(found), misses=missed)
+        return found
+
+    def put_many(self, rows: Iterable[Row]) -> None:
+        with self._lock:
+            for row in rows:
+                document_id = str(row[0])
+                size = row_size(row)
+                if size > self.max_bytes:
+                    continue
+                previous = self._rows.pop(document_id, None)
+                if previous is not None:
+                    self._bytes -= previous[1]
+                self._rows[document_id] = (row, size)
+                self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, size) = self._rows.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+            metrics.set_document_cache_size(len(self._rows), self._bytes)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._rows),
+                "bytes": self._bytes,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+def create_document_cache() -> Optional[DocumentCache]:
+    return DocumentCache() if DOCUMENT_CACHE_ENABLED else None
+
+
+def read_warm_ids(path: Optional[str] = DOCUMENT_CACHE_WARM_IDS_FILE) -> List[str]:
+    if not path:
+        return []
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
@@ -0,0 +1,209 @@
+"""On-instance nearest-neighbour index over the articles corpus.
+
+Stands in for the Vertex Vector Search endpoint: LocalSearcher has the same find_neighbors
+interface as VectorSearchSearcher, so VectorSearchVectorStorePostgres and its retriever work
+unchanged on top of it. Vectors are scored by dot product, which for the unit-length gecko
+embeddings is cosine similarity; higher is closer.
+
+An index is a directory written by build_index():
+    meta.json     dimensions, count, dtype ("float32" or "int8") and nlist
+    ids.json      article id of each row
+    vectors.bin   row-major matrix, memory-mapped rather than read into memory
+    scales.bin    per-row float32 scale of an int8 matrix
+    centroids.npy, offsets.npy
+                  IVF coarse index: rows are stored grouped by nearest centroid, and list i is
+                  rows offsets[i]:offsets[i + 1]
+
+Search is exact (brute force over every row, in chunks) unless the index has an IVF, in which
+case only the `nprobe` lists whose centroids score highest are scanned.
+
+Build from the JSONL files the Vector Search index was created from:
+    python local_index.py OUT_DIR embeddings-*.json [--int8] [--nlist 1024]
+"""
+import argparse
+import json
+import os
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+LOCAL_INDEX_NPROBE = int(os.environ.get("LOCAL_INDEX_NPROBE", "16"))
+# Rows scored per matrix product in brute-force search; bounds the temporary float32 copy
+SEARCH_CHUNK_ROWS = 65536
+
+
+class LocalVectorIndex:
+    def __init__(self, ids: List[str], vectors: np.ndarray, scales: Optional[np.ndarray] = None,
+                 centroids: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None) -> None:
+        self.ids = ids
+        self.vectors = vectors
+        self.scales = scales
+        self.centroids = centroids
+        self.offsets = offsets
+
+    @classmethod
+    def load(cls, path: str) -> "LocalVectorIndex":
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "ids.json")) as f:
+            ids = json.load(f)
+        shape = (meta["count"], meta["dimensions"])
+        vectors = np.memmap(os.path.join(path, "vectors.bin"), dtype=meta["dtype"], mode="r", shape=shape)
+        scales = None
+        if meta["dtype"] == "int8":
+            scales = np.memmap(os.path.join(path, "scales.bin"), dtype=np.float32, mode="r", shape=(meta["count"],))
+        centroids = offsets = None
+        if meta.get("nlist"):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+        return cls(ids, vectors, scales, centroids, offsets)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, query: Sequence[float], k: int, nprobe: Optional[int] = LOCAL_INDEX_NPROBE,
+               exact: bool = False) -> List[Tuple[str, float]]:
+        """Top k (id, score) pairs, best first. exact=True scans every row even if there is an IVF."""
+        query = np.asarray(query, dtype=np.float32)
+        if exact or self.centroids is None:
+            ranges = [(start, min(start + SEARCH_CHUNK_ROWS, len(self.ids)))
+                      for start in range(0, len(self.ids), SEARCH_CHUNK_ROWS)]
+        else:
+            lists = _top_k(self.centroids @ query, nprobe or LOCAL_INDEX_NPROBE)
+            ranges = [(int(self.offsets[i]), int(self.offsets[i + 1])) for i in lists]
+        if not ranges:
+            return []
+
+        scores = np.concatenate([self._score_range(start, end, query) for start, end in ranges])
+        rows = np.concatenate([np.arange(start, end) for start, end in ranges])
+        return [(self.ids[rows[i]], float(scores[i])) for i in _top_k(scores, k)]
+
+    def _score_range(self, start: int, end: int, query: np.ndarray) -> np.ndarray:
+        scores = self.vectors[start:end].astype(np.float32, copy=False) @ query
+        if self.scales is not None:
+            scores *= self.scales[start:end]
+        return scores
+
+
+class LocalSearcher:
+    """VectorSearchSearcher over a LocalVectorIndex. Filters are not supported."""
+
+    def __init__(self, index: LocalVectorIndex, nprobe: int = LOCAL_INDEX_NPROBE) -> None:
+        self.index = index
+        self.nprobe = nprobe
+
+    def find_neighbors(self, embeddings: List[List[float]], k: int = 4, filter_: Any = None,
+                       **kwargs: Any) -> List[List[Tuple[str, float]]]:
+        if filter_:
+            raise NotImplementedError("The local index does not support namespace filters")
+        return [self.index.search(embedding, k, self.nprobe) for embedding in embeddings]
+
+    def remove_datapoints(self, datapoint_ids: List[str], **kwargs: Any) -> None:
+        raise NotImplementedError()
+
+    def add_to_index(self, ids: List[str], embeddings: List[List[float]], **kwargs: Any) -> None:
+        raise NotImplementedError()
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def kmeans(vectors: np.ndarray, nlist: int, iterations: int = 10, sample: int = 256,
+           seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids, trained on at most `sample` rows per list."""
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    rows = rng.choice(len(vectors), size=min(len(vectors), nlist * sample), replace=False)
+    training = np.asarray(vectors[np.sort(rows)], dtype=np.float32)
+    centroids = training[rng.choice(len(training), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(training @ centroids.T, axis=1)
+        for i in range(nlist):
+            members = training[assignment == i]
+            if len(members):
+                centroids[i] = members.sum(axis=0)
+            else:
+                # Restart an empty list from a random training row
+                centroids[i] = training[rng.integers(len(training))]
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignment = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), SEARCH_CHUNK_ROWS):
+        block = np.asarray(vectors[start:start + SEARCH_CHUNK_ROWS], dtype=np.float32)
+        assignment[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+    return assignment
+
+
+def build_index(path: str, ids: List[str], vectors: np.ndarray, dtype: str = "float32", nlist: int = 0,
+                seed: int = 0) -> None:
+    """Write an index directory for `vectors` (one row per id). nlist > 0 adds an IVF coarse index."""
+    if dtype not in ("float32", "int8"):
+        raise ValueError(f"Unsupported index dtype: {dtype}")
+    os.makedirs(path, exist_ok=True)
+    vectors = np.asarray(vectors, dtype=np.float32)
+
+    order = np.arange(len(ids))
+    if nlist:
+        centroids = kmeans(vectors, nlist, seed=seed)
+        nlist = len(centroids)
+        assignment = assign(vectors, centroids)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+        np.save(os.path.join(path, "centroids.npy"), centroids)
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+
+    out = np.memmap(os.path.join(path, "vectors.bin"), dtype=dtype, mode="w+", shape=vectors.shape)
+    if dtype == "int8":
+        scales = np.memmap(os.path.join(path, "scales.bin"), dtype=np.float32, mode="w+", shape=(len(ids),))
+    for start in range(0, len(ids), SEARCH_CHUNK_ROWS):
+        block = vectors[order[start:start + SEARCH_CHUNK_ROWS]]
+        if dtype == "int8":
+            # Symmetric per-row quantisation: row = int8 row * scale
+            scale = np.maximum(np.abs(block).max(axis=1), 1e-12) / 127
+            out[start:start + len(block)] = np.round(block / scale[:, None]).astype(np.int8)
+            scales[start:start + len(block)] = scale
+        else:
+            out[start:start + len(block)] = block
+    out.flush()
+    if dtype == "int8":
+        scales.flush()
+
+    with open(os.path.join(path, "ids.json"), "w") as f:
+        json.dump([ids[i] for i in order], f)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({"dimensions": vectors.shape[1], "count": len(ids), "dtype": dtype, "nlist": nlist}, f)
+
+
+def read_jsonl(paths: Iterable[str]) -> Tuple[List[str], np.ndarray]:
+    """Ids and embeddings from Vector Search input files ({"id": ..., "embedding": [...]} per line)."""
+    ids: List[str] = []
+    rows: List[List[float]] = []
+    for path in paths:
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    ids.append(str(record["id"]))
+                    rows.append(record["embedding"])
+    return ids, np.asarray(rows, dtype=np.float32)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build a local index from Vector Search JSONL files.")
+    parser.add_argument("out_dir")
+    parser.add_argument("inputs", nargs="+")
+    parser.add_argument("--int8", action="store_true", help="quantise vectors to int8")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists; 0 for brute force only")
+    args = parser.parse_args()
+    ids, vectors = read_jsonl(args.inputs)
+    build_index(args.out_dir, ids, vectors, "int8" if args.int8 else "float32", args.nlist)
+    print(f"Indexed {len(ids)} vectors of {vectors.shape[1]} dimensions in {args.out_dir}")
@@ -1,6 +1,9 @@
+import contextvars
+import logging
 import os
-from google import genai
-from google.genai import types
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from langchain.memory import ConversationBufferMemory
 from langchain.callbacks.base import BaseCallbackHandler
 from langchain_google_vertexai import VertexAIEmbeddings
@@ -9,29 +12,66 @@ from langchain_google_vertexai.vectorstores.vectorstores import _BaseVertexAIVec
 from langchain_google_vertexai.vectorstores._sdk_manager import VectorSearchSDKManager
 from langchain_google_vertexai.vectorstores._searcher import VectorSearchSearcher
 from langchain_google_vertexai.vectorstores._document_storage import DocumentStorage
-from typing import Any, Dict, Optional, Type, List
+from typing import Any, Dict, Iterator, Optional, Type, List, Tuple
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 import pg8000
+import sqlalchemy
 from google.cloud.sql.connector import Connector, IPTypes
 import functions_framework
-from flask import jsonify, request
+from flask import Response, jsonify, request, stream_with_context
 from flask_cors import CORS
 
-# Initialize Gemini client
-client = genai.Client(
-    vertexai=True,
-    project="gemini-med-lit-review",
-    location="us-central1",
-)
+import admission
+import gemini_client
+import llm_metrics
+import model_router
+import single_flight
+import context_packer
+import document_cache
+from local_index import LocalSearcher, LocalVectorIndex
+from retrieval_cache import RetrievalCache, create_retrieval_cache
+from speculative import StageTimings, fuse_rankings, is_confident, keyword_query
+from streaming import sse_event
 
-model = "gemini-2.5-pro"
+logger = logging.getLogger(__name__)
+
+generate_content_config = gemini_client.make_config(temperature=0.7)
+
+# Cloud SQL connection pool, per instance
+PG_POOL_SIZE = int(os.environ.get("PG_POOL_SIZE", "5"))
+PG_POOL_MAX_OVERFLOW = int(os.environ.get("PG_POOL_MAX_OVERFLOW", "2"))
+PG_POOL_TIMEOUT_SECONDS = float(os.environ.get("PG_POOL_TIMEOUT_SECONDS", "10"))
+PG_POOL_RECYCLE_SECONDS = int(os.environ.get("PG_POOL_RECYCLE_SECONDS", "1800"))
+
+# "vertex" queries the Vector Search endpoint; "local" searches the index in LOCAL_INDEX_DIR
+RETRIEVAL_ENGINE = os.environ.get("RETRIEVAL_ENGINE", "vertex")
+LOCAL_INDEX_DIR = os.environ.get("LOCAL_INDEX_DIR", "local_index")
+
+# "serial" retrieves with the summary once it is generated; "speculative" starts retrieving from
+# the raw record while the summary is generated (see speculative.py)
+RETRIEVAL_PIPELINE = os.environ.get("RETRIEVAL_PIPELINE", "serial")
+RETRIEVAL_K = 15
+# Threads generating retrieval summaries alongside speculative retrieval
+SPECULATION_WORKERS = int(os.environ.get("SPECULATION_WORKERS", "8"))
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+# Query embeddings and neighbour ids of recent retrievals, shared by the instance's vector stores
+query_cache = create_retrieval_cache()
+# Recently read article rows, shared by the instance's document storages
+articles_cache = document_cache.create_document_cache()
 
 class VectorSearchVectorStorePostgres(_BaseVertexAIVectorStore):
     """VectorSearch with Postgres document storage."""
 
+    def __init__(self, *args: Any, retrieval_cache: Optional[RetrievalCache] = None, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._retrieval_cache = retrieval_cache if retrieval_cache is not None else query_cache
+
     @classmethod
     def from_components(
         cls: Type["VectorSearchVectorStorePostgres"],
@@ -45,6 +85,7 @@ class VectorSearchVectorStorePostgres(_BaseVertexAIVectorStore):
         pg_db: str,
         pg_collection_name: str,
         embedding: Optional[Embeddings] = None,
+        pg_engine: Optional[sqlalchemy.engine.Engine] = None,
         **kwargs: Dict[str, Any],
     ) -> "VectorSearchVectorStorePostgres":
 
@@ -61,6 +102,7 @@ class VectorSearchVectorStorePostgres(_BaseVertexAIVectorStore):
             password=pg_password,
             db=pg_db,
             collection_name=pg_collection_name,
+            engine=pg_engine,
         )
 
         return cls(
@@ -72,21 +114,103 @@ class VectorSearchVectorStorePostgres(_BaseVertexAIVectorStore):
             embbedings=embedding,
         )
 
-class PostgresDocumentStorage(DocumentStorage):
-    """Stores documents in Google CloudSQL Postgres."""
+    def similarity_search_with_score(
+        self,
+        query: str,
+        k: int = 4,
+        filter: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Like the base class, but reuses the neighbours of a cached identical or similar query."""
+        cache = self._retrieval_cache
+        if cache is None or filter or kwargs:
+            return super().similarity_search_with_score(query, k=k, filter=filter, **kwargs)
 
-    def __init__(
+        neighbors = cache.get(query, k)
+        if neighbors is None:
+            embedding = self._embeddings.embed_query(query)
+            neighbors = cache.get_similar(embedding, k)
+            if neighbors is None:
+                neighbors = self._find_neighbors(embedding, k)
+                cache.put(query, embedding, k, neighbors)
+        return self._with_documents(neighbors)
+
+    def batch_similarity_search_with_score(self, queries: List[str], k: int = 4) -> List[List[Tuple[Document, float]]]:
+        """similarity_search_with_score for many queries at once.
+
+        Queries not in the retrieval cache are embedded in one call, those without a similar cached
+        query are searched in one call, and the documents of all the queries are fetched in one
+        query, each distinct article once.
+        """
+        cache = self._retrieval_cache
+        neighbors_list = [cache.get(query, k) if cache is not None else None for query in queries]
+        missing = [i for i, neighbors in enumerate(neighbors_list) if neighbors is None]
+        if missing:
+            embeddings = dict(zip(missing, embed_queries(self._embeddings, [queries[i] for i in missing])))
+            if cache is not None:
+                for i in missing:
+                    neighbors_list[i] = cache.get_similar(embeddings[i], k)
+                missing = [i for i in missing if neighbors_list[i] is None]
+        if missing:
+            found = self._searcher.find_neighbors(embeddings=[embeddings[i] for i in missing], k=k)
+            for i, neighbors in zip(missing, found):
+                neighbors_list[i] = neighbors
+                if cache is not None:
+                    cache.put(queries[i], embeddings[i], k, neighbors)
+        return self._with_documents_many(neighbors_list)
+
+    def similarity_search_by_vector_with_score(
         self,
-        instance_connection_string: str,
-        user: str,
-        password: str,
-        db: str,
-        collection_name: str
-    ) -> None:
-        super().__init__()
-        self._collection_name = collection_name
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Any] = None,
+        **kwargs: Any,
+    ) -> List[Tuple[Document, float]]:
+        """Nearest neighbours, with their documents fetched in one query rather than one per hit."""
+        return self._with_documents(self._find_neighbors(embedding, k, filter, **kwargs))
+
+    def _find_neighbors(self, embedding: List[float], k: int, filter: Optional[Any] = None,
+                        **kwargs: Any) -> List[Tuple[str, float]]:
+        neighbors_list = self._searcher.find_neighbors(embeddings=[embedding], k=k, filter_=filter, **kwargs)
+        return neighbors_list[0] if neighbors_list else []
+
+    def _with_documents(self, neighbors: List[Tuple[str, float]]) -> List[Tuple[Document, float]]:
+        """Documents for the neighbours, in order; hits missing from storage are skipped."""
+        return self._with_documents_many([neighbors])[0]
+
+    def _with_documents_many(self, neighbors_list: List[List[Tuple[str, float]]]
+                             ) -> List[List[Tuple[Document, float]]]:
+        ids = list(dict.fromkeys(neighbor_id for neighbors in neighbors_list for neighbor_id, _ in neighbors))
+        documents = dict(zip(ids, self._document_storage.get_by_ids(ids))) if ids else {}
+        results = []
+        for neighbors in neighbors_list:
+            found = []
+            for neighbor_id, distance in neighbors:
+                document = documents[neighbor_id]
+                if document is None:
+                    logger.warning(f"Document with id {neighbor_id} not found in document storage")
+                    continue
+                found.append((document, distance))
+            results.append(found)
+        return results
+
+def embed_queries(embeddings: Embeddings, queries: List[str]) -> List[List[float]]:
+    """Query embeddings of many texts, in as few requests as the model allows."""
+    if isinstance(embeddings, VertexAIEmbeddings):
+        # embed_documents would embed them as documents, which score differently against the index
+        return embeddings.embed(queries, embeddings_task_type="RETRIEVAL_QUERY")
+    return [embeddings.embed_query(query) for query in queries]
 
-        self._conn: pg8000.dbapi.Connection = Connector().connect(
+def create_pg_engine(instance_connection_string: str, user: str, password: str, db: str) -> sqlalchemy.engine.Engine:
+    """Bounded pool of Cloud SQL connections.
+
+    Connections are checked with a ping before use and replaced once they are
+    PG_POOL_RECYCLE_SECONDS old, so ones dropped by Cloud SQL or the network are not handed out.
+    """
+    connector = Connector()
+
+    def connect() -> pg8000.dbapi.Connection:
+        return connector.connect(
             instance_connection_string,
             "pg8000",
             user=user,
@@ -95,30 +219,124 @@ class PostgresDocumentStorage(DocumentStorage):
             ip_type=IPTypes.PUBLIC,
         )
 
+    return sqlalchemy.create_engine(
+        "postgresql+pg8000://",
+        creator=connect,
+        pool_size=PG_POOL_SIZE,
+        max_overflow=PG_POOL_MAX_OVERFLOW,
+        pool_timeout=PG_POOL_TIMEOUT_SECONDS,
+        pool_recycle=PG_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=True,
+    )
+
+class PostgresDocumentStorage(DocumentStorage):
+    """Stores documents in Google CloudSQL Postgres."""
+
+    def __init__(
+        self,
+        instance_connection_string: Optional[str] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        db: Optional[str] = None,
+        collection_name: str = "articles",
+        engine: Optional[sqlalchemy.engine.Engine] = None,
+        cache: Optional[document_cache.DocumentCache] = None,
+    ) -> None:
+        super().__init__()
+        self._collection_name = collection_name
+        self._engine = engine or create_pg_engine(instance_connection_string, user, password, db)
+        self._cache = cache if cache is not None else articles_cache
+
     def get_by_id(self, document_id: str) -> Document | None:
         """Gets the text of a document by its id. If not found, returns None."""
-        cursor = self._conn.cursor()
-        cursor.execute("SELECT id, title, abstract FROM articles WHERE id = %s", (document_id,))
-        result = cursor.fetchone()
-        cursor.close()
-
-        if result is None:
-            return None
- 
-        return Document(
-            page_content=result[2],
-            metadata={
-                "id": result[0],
-                "title": result[1]
-            },
-        )
+        return self.get_by_ids([document_id])[0]
+
+    def get_by_ids(self, document_ids: List[str]) -> List[Document | None]:
+        """Gets documents by id, in the order given; None for ids that are not found.
+
+        Cached articles are served from memory; the rest are read in one query.
+        """
+        if not document_ids:
+            return []
+
+        document_ids = [str(document_id) for document_id in document_ids]
+        rows = self._cache.get_many(document_ids) if self._cache is not None else {}
+        missing = [document_id for document_id in dict.fromkeys(document_ids) if document_id not in rows]
+        if missing:
+            fetched = self._fetch_rows(missing)
+            if self._cache is not None:
+                self._cache.put_many(fetched)
+            rows.update((str(row[0]), row) for row in fetched)
+
+        documents = {
+            document_id: Document(
+                page_content=result[2],
+                metadata={
+                    "id": result[0],
+                    "title": result[1]
+                },
+            )
+            for document_id, result in rows.items()
+        }
+        return [documents.get(document_id) for document_id in document_ids]
+
+    def _fetch_rows(self, document_ids: List[str]) -> List[document_cache.Row]:
+        # Closing a pooled connection returns it to the pool
+        conn = self._engine.raw_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, title, abstract FROM articles WHERE id = ANY(%s)", (document_ids,))
+            rows = cursor.fetchall()
+            cursor.close()
+        finally:
+            conn.close()
+        return [tuple(row) for row in rows]
+
+    def warm(self, document_ids: List[str], batch_size: int = 500) -> int:
+        """Load articles into the cache ahead of requests; returns how many were found."""
+        if self._cache is None:
+            return 0
+        loaded = 0
+        for start in range(0, len(document_ids), batch_size):
+            rows = self._fetch_rows([str(i) for i in document_ids[start:start + batch_size]])
+            self._cache.put_many(rows)
+            loaded += len(rows)
+        return loaded
+
+    def mget_by_ids(self, ids: List[str]) -> List[Document | None]:
+        return self.get_by_ids(ids)
 
     def store_by_id(self, document_id: str, document: Document):
         raise NotImplementedError()
 
 def configure_vector_store():
+    vector_store = create_vector_store()
+    try:
+        warm_ids = document_cache.read_warm_ids()
+        if warm_ids:
+            loaded = vector_store._document_storage.warm(warm_ids)
+            logger.info(f"Warmed document cache with {loaded} of {len(warm_ids)} articles")
+    except Exception as e:
+        # A cold cache only costs latency; serve anyway
+        logger.warning(f"Document cache warm-up failed: {str(e)}")
+    return vector_store
+
+def create_vector_store():
     embeddings = VertexAIEmbeddings("textembedding-gecko@003")
 
+    if RETRIEVAL_ENGINE == "local":
+        return VectorSearchVectorStorePostgres(
+            searcher=LocalSearcher(LocalVectorIndex.load(LOCAL_INDEX_DIR)),
+            document_storage=PostgresDocumentStorage(
+                instance_connection_string=os.environ.get("PG_INSTANCE_CONNECTION_STRING"),
+                user=os.environ.get("PG_USER"),
+                password=os.environ.get("PG_PASSWORD"),
+                db="pubmed",
+                collection_name="articles",
+            ),
+            embbedings=embeddings,
+        )
+
     vector_store = VectorSearchVectorStorePostgres.from_components(
         project_id="gemini-med-lit-review",
         region="us-central1",
@@ -134,68 +352,72 @@ def configure_vector_store():
 
     return vector_store
 
-def generate_with_gemini(prompt: str) -> str:
-    """Generate content using the new Gemini SDK."""
-    generate_content_config = types.GenerateContentConfig(
-        temperature=0.7,
-        top_p=0.95,
-        max_output_tokens=8192,
-        safety_settings=[
-            types.SafetySetting(
-                category="HARM_CATEGORY_HATE_SPEECH",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_HARASSMENT",
-                threshold="OFF"
-            )
-        ],
-    )
-    
-    contents = [
-        types.Content(
-            role="user",
-            parts=[types.Part(text=prompt)]
-        )
-    ]
-    
-    response = client.models.generate_content(
-        model=model,
-        contents=contents,
-        config=generate_content_config,
-    )
+def get_vector_store():
+    """The instance's vector store, configured on first use and shared by every request."""
+    global _vector_store
+    if _vector_store is None:
+        with _vector_store_lock:
+            if _vector_store is None:
+                _vector_store = configure_vector_store()
+    return _vector_store
+
+def generate_with_gemini(prompt: str, cache: bool = False, operation: str = "generate",
+                         model: str = gemini_client.MODEL) -> str:
+    """Generate content using the new Gemini SDK.
+
+    Only cache calls whose prompts carry no patient data and whose output should not vary.
+    """
+    response = gemini_client.generate_content(gemini_client.user_content(prompt), generate_content_config,
+                                              model=model, cache=cache, operation=operation)
     
     return response.text
 
-def generate_summary_for_retrieval(patient_record):
-    prompt = (
+def build_retrieval_summary_prompt(patient_record):
+    return (
         "Given the following patient record, create a concise summary of the patient's conditions and case. "
         "This summary will be used for retrieving relevant medical literature. Focus on key diagnoses, "
         f"treatments, and any unique aspects of the case.\n\nPatient Record: {patient_record}"
     )
-    return generate_with_gemini(prompt)
 
-def retrieve_documents(query):
-    vector_store = configure_vector_store()
-    retriever = vector_store.as_retriever(search_type="similarity", search_kwargs={"k": 15})
-    docs = retriever.invoke(query)
-    return [{"title": doc.metadata.get('title', 'No title'), 
-             "content": doc.page_content, 
-             "pmid": doc.metadata.get('id', 'No PMID')}  # Add this line
-            for doc in docs]
+def generate_summary_for_retrieval(patient_record):
+    prompt = build_retrieval_summary_prompt(patient_record)
+    return model_router.router.run(
+        "retrieval_summary",
+        lambda model: generate_with_gemini(prompt, operation="retrieval_summary", model=model),
+        validate=is_usable_query)
 
-def generate_recommendations(patient_record, retrieved_docs):
-    literature_text = "\n\n".join([f"Title: {doc['title']}\nAbstract: {doc['content']}\nPMID: {doc['pmid']}" for doc in retrieved_docs])
+def is_usable_query(summary):
+    return bool(summary and summary.strip())
+
+def retrieve_documents(query, vector_store=None):
+    return [doc for doc, _ in retrieve_scored(query, vector_store)]
+
+def retrieve_scored(query, vector_store=None, k=RETRIEVAL_K):
+    """Retrieved documents with their similarity scores, best first."""
+    if vector_store is None:
+        vector_store = get_vector_store()
+    return [({"title": doc.metadata.get('title', 'No title'),
+              "content": doc.page_content,
+              "pmid": doc.metadata.get('id', 'No PMID')}, score)
+            for doc, score in vector_store.similarity_search_with_score(query, k=k)]
+
+def retrieve_batch(queries, vector_store=None, k=RETRIEVAL_K):
+    """retrieve_documents for many queries, with batched embedding, search and document fetch."""
+    if vector_store is None:
+        vector_store = get_vector_store()
+    return [[{"title": doc.metadata.get('title', 'No title'),
+              "content": doc.page_content,
+              "pmid": doc.metadata.get('id', 'No PMID')}
+             for doc, _ in hits]
+            for hits in vector_store.batch_similarity_search_with_score(queries, k=k)]
+
+def merge_retrievals(speculative_hits, summary_hits):
+    return fuse_rankings([summary_hits, speculative_hits], RETRIEVAL_K)
+
+def build_recommendations_prompt(patient_record, retrieved_docs):
+    literature_text = "\n\n".join(context_packer.format_document(doc) for doc in retrieved_docs)
     
-    prompt = (
+    return (
         "You are a medical specialist reviewing a patient case and relevant medical literature. "
         "Based on the patient's record and the provided medical abstracts, generate treatment recommendations. "
         "Include a summary of the case, a table of recommendations based on actionable events, "
@@ -208,10 +430,143 @@ def generate_recommendations(patient_record, retrieved_docs):
         "3. Analysis and Discussion\n\n"
         "Be sure to include the PMID for each recommendation in the table."
     )
-    
-    return generate_with_gemini(prompt)
+
+def build_packed_recommendations_prompt(patient_record, retrieved_docs):
+    """The recommendations prompt, with the literature packed to CONTEXT_TOKEN_BUDGET when enabled."""
+    if not context_packer.CONTEXT_PACKING_ENABLED:
+        prompt = build_recommendations_prompt(patient_record, retrieved_docs)
+        logger.info(f"Recommendations prompt: ~{context_packer.estimate_tokens(prompt)} tokens, "
+                    f"{len(retrieved_docs)} abstracts unpacked")
+        return prompt
+
+    packed_docs, stats = context_packer.pack_context(patient_record, retrieved_docs)
+    prompt = build_recommendations_prompt(patient_record, packed_docs)
+    unpacked_tokens = context_packer.estimate_tokens(prompt) + stats["tokens_in"] - stats["tokens_out"]
+    logger.info(f"Recommendations prompt: ~{unpacked_tokens} -> ~{context_packer.estimate_tokens(prompt)} tokens, "
+                f"{stats['documents_in']} -> {stats['documents_out']} abstracts "
+                f"({stats['duplicates']} near-duplicates dropped)")
+    return prompt
+
+def log_generation_latency(started):
+    # Whole-response time of the unstreamed call; the streaming path marks time_to_first_token
+    logger.info(f"Recommendations generated in {time.perf_counter() - started:.2f}s "
+                f"(context packing {'on' if context_packer.CONTEXT_PACKING_ENABLED else 'off'})")
+
+def generate_recommendations(patient_record, retrieved_docs):
+    prompt = build_packed_recommendations_prompt(patient_record, retrieved_docs)
+    started = time.perf_counter()
+    recommendations = generate_with_gemini(prompt, operation="recommendations")
+    log_generation_latency(started)
+    return recommendations
+
+_speculation_pool = ThreadPoolExecutor(max_workers=SPECULATION_WORKERS, thread_name_prefix="retrieval-summary")
+
+def speculative_retrieval(patient_record, timings):
+    """Retrieve with a keyword query while the summary is generated, then fuse or keep those hits."""
+    # The copied context keeps the summary's Gemini call attributed to this endpoint in metrics
+    summary_future = _speculation_pool.submit(
+        contextvars.copy_context().run, timings.timed, "summary", generate_summary_for_retrieval, patient_record)
+    try:
+        vector_store = get_vector_store()
+        with timings.stage("speculative_retrieval"):
+            speculative_hits = retrieve_scored(keyword_query(patient_record), vector_store)
+        if is_confident(speculative_hits):
+            # Only a summary that has not started yet is dropped; a running one finishes in its thread
+            summary_future.cancel()
+            return [doc for doc, _ in speculative_hits], "speculative"
+        summary = summary_future.result()
+    except BaseException:
+        summary_future.cancel()
+        raise
+
+    with timings.stage("summary_retrieval"):
+        summary_hits = retrieve_scored(summary, vector_store)
+    with timings.stage("fusion"):
+        return merge_retrievals(speculative_hits, summary_hits), "fused"
+
+def retrieve_for_record(patient_record, timings):
+    """Documents for the record in timings.mode, and whether they came from the summary, speculation or both."""
+    if timings.mode == "speculative":
+        return speculative_retrieval(patient_record, timings)
+
+    # Generate a summary for document retrieval
+    with timings.stage("summary"):
+        summary = generate_summary_for_retrieval(patient_record)
+
+    # Retrieve relevant documents
+    with timings.stage("summary_retrieval"):
+        retrieved_docs = retrieve_documents(summary)
+    return retrieved_docs, "summary"
+
+def recommendations_pipeline(patient_record, mode=None):
+    timings = StageTimings(mode or RETRIEVAL_PIPELINE)
+    retrieved_docs, source = retrieve_for_record(patient_record, timings)
+
+    # Generate recommendations
+    with timings.stage("recommendations"):
+        recommendations = generate_recommendations(patient_record, retrieved_docs)
+    timings.report(documents=source)
+    return recommendations, retrieved_docs
+
+class RecommendationEvents:
+    """Server-Sent Events of a streamed pipeline run, shared by the sync and async streams.
+
+    A "documents" event carries the documents as soon as they are retrieved, "message" events
+    carry the report text as Gemini generates it, and a final "done" event carries the stage
+    timings in milliseconds; a failure ends the stream with an "error" event.
+    """
+
+    def __init__(self, timings):
+        self.timings = timings
+        self.source = None
+        self._first = True
+
+    def documents(self, retrieved_docs, source):
+        self.source = source
+        self.timings.mark("time_to_documents")
+        return sse_event("documents", {"documents": retrieved_docs[:5]})
+
+    def message(self, text):
+        if self._first:
+            self.timings.mark("time_to_first_token")
+            self._first = False
+        return sse_event("message", {"delta": text})
+
+    def done(self):
+        return sse_event("done", {"timings": self.timings.report(documents=self.source, streamed=True)})
+
+    def error(self, e):
+        if isinstance(e, admission.Overloaded):
+            logger.warning(f"Turned away streamed recommendations: {str(e)}")
+            return sse_event("error", {"error": str(e), "retry_after": e.headers()["Retry-After"]})
+        logger.error(f"Error streaming recommendations: {str(e)}")
+        return sse_event("error", {"error": str(e)})
+
+def stream_recommendations_pipeline(patient_record, mode=None) -> Iterator[str]:
+    """Like recommendations_pipeline, but yields the Server-Sent Events of RecommendationEvents."""
+    timings = StageTimings(mode or RETRIEVAL_PIPELINE)
+    events = RecommendationEvents(timings)
+    try:
+        retrieved_docs, source = retrieve_for_record(patient_record, timings)
+        yield events.documents(retrieved_docs, source)
+
+        with timings.stage("recommendations"):
+            prompt = build_packed_recommendations_prompt(patient_record, retrieved_docs)
+            for chunk in gemini_client.generate_content_stream(
+                    gemini_client.user_content(prompt), generate_content_config,
+                    cache=False, operation="recommendations_stream"):
+                if chunk.text:
+                    yield events.message(chunk.text)
+        yield events.done()
+    except Exception as e:
+        yield events.error(e)
+
+# Repeated clicks and client retries share the pipeline already running for the same record
+in_flight = single_flight.SingleFlight()
 
 @functions_framework.http
+@llm_metrics.instrumented("dha-generateRecommendations")
+@admission.rate_limited
 def generate_recommendations_http(request):
     """HTTP Cloud Function for generating medical recommendations."""
     # Configure CORS
@@ -248,20 +603,27 @@ def generate_recommendations_http(request):
 
     patient_record = request_json['patientRecord']
 
+    # Opt-in streaming of the report as Server-Sent Events; streams are not coalesced
+    if request_json.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+        return Response(stream_with_context(stream_recommendations_pipeline(patient_record)), 200, {
+            **headers,
+            'Content-Type': 'text/event-stream',
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+
     try:
-        # Generate a summary for document retrieval
-        summary = generate_summary_for_retrieval(patient_record)
-        
-        # Retrieve relevant documents
-        retrieved_docs = retrieve_documents(summary)
-        
-        # Generate recommendations
-        recommendations = generate_recommendations(patient_record, retrieved_docs)
+        recommendations, retrieved_docs = in_flight.do(
+            single_flight.request_key("recommendations", patient_record),
+            lambda: recommendations_pipeline(patient_record),
+        )
         
         return (jsonify({
             'recommendations': recommendations,
             'documents': retrieved_docs[:5]  # Send only the first 5 documents
         }), 200, headers)
+    except admission.Overloaded as e:
+        return (jsonify({'error': str(e)}), e.status, {**headers, **e.headers()})
     except Exception as e:
         return (jsonify({'error': str(e)}), 500, headers)
 
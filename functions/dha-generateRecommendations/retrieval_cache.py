@@ -0,0 +1,123 @@
+"""Cache of query embeddings and nearest-neighbour results for recommendation retrieval.
+
+Queries are keyed by their normalised text (case, whitespace and punctuation folded). A query
+seen before within the TTL reuses its embedding and neighbour ids, so it skips both the embedding
+call and the vector search. With a similarity threshold set, a new query is embedded and, if its
+embedding is at least that close (cosine) to a cached query's, reuses that query's neighbours
+and skips the search. Entries are evicted least recently used first.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from llm_metrics import metrics
+
+RETRIEVAL_CACHE_ENABLED = os.environ.get("RETRIEVAL_CACHE_ENABLED", "1") == "1"
+RETRIEVAL_CACHE_SIZE = int(os.environ.get("RETRIEVAL_CACHE_SIZE", "512"))
+RETRIEVAL_CACHE_TTL_SECONDS = float(os.environ.get("RETRIEVAL_CACHE_TTL_SECONDS", "86400"))
+# Cosine similarity at which another query's results are reused; 0 reuses exact matches only
+RETRIEVAL_CACHE_SIMILARITY = float(os.environ.get("RETRIEVAL_CACHE_SIMILARITY", "0"))
+
+Neighbors = List[Tuple[str, float]]
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalise_query(query: str) -> str:
+    return _WHITESPACE.sub(" ", _PUNCTUATION.sub(" ", query.lower())).strip()
+
+
+class RetrievalCache:
+    """A lookup is get() and, when that misses, get_similar() with the query's embedding.
+
+    get() counts exact hits; get_similar() counts similar hits and the misses, so each lookup is
+    counted once, whether or not near-duplicate reuse is enabled.
+    """
+
+    def __init__(self, max_entries: int = RETRIEVAL_CACHE_SIZE, ttl_seconds: float = RETRIEVAL_CACHE_TTL_SECONDS,
+                 similarity_threshold: float = RETRIEVAL_CACHE_SIMILARITY) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # key -> (unit embedding, k, neighbours, expires_at)
+        self._entries: "OrderedDict[str, Tuple[np.ndarray, int, Neighbors, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    def get(self, query: str, k: int) -> Optional[Neighbors]:
+        """Neighbours of a query with the same normalised text, if cached with at least k results."""
+        key = _key(query)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[3] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None or entry[1] < k:
+                return None
+            self._entries.move_to_end(key)
+            self._count("exact_hits")
+            return entry[2][:k]
+
+    def get_similar(self, embedding: Sequence[float], k: int) -> Optional[Neighbors]:
+        """Neighbours of the most similar cached query, if it clears the similarity threshold."""
+        if self.similarity_threshold <= 0:
+            self._count_locked("misses")
+            return None
+        query = _unit(embedding)
+        now = time.time()
+        with self._lock:
+            candidates = [(key, entry) for key, entry in self._entries.items() if entry[3] > now and entry[1] >= k]
+            if candidates:
+                similarities = np.stack([entry[0] for _, entry in candidates]) @ query
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    key, entry = candidates[best]
+                    self._entries.move_to_end(key)
+                    self._count("similar_hits")
+                    return entry[2][:k]
+            self._count("misses")
+            return None
+
+    def put(self, query: str, embedding: Sequence[float], k: int, neighbors: Neighbors) -> None:
+        key = _key(query)
+        with self._lock:
+            self._entries[key] = (_unit(embedding), k, list(neighbors), time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = sum(self.counters.values())
+            hits = self.counters["exact_hits"] + self.counters["similar_hits"]
+            return {**self.counters, "entries": len(self._entries),
+                    "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+    def _count(self, result: str) -> None:
+        self.counters[result] += 1
+        metrics.record_retrieval_cache(result)
+
+    def _count_locked(self, result: str) -> None:
+        with self._lock:
+            self._count(result)
+
+
+def _key(query: str) -> str:
+    return hashlib.sha256(normalise_query(query).encode("utf-8")).hexdigest()
+
+
+def _unit(embedding: Sequence[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    return vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+
+def create_retrieval_cache() -> Optional[RetrievalCache]:
+    return RetrievalCache() if RETRIEVAL_CACHE_ENABLED else None
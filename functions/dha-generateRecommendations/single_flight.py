@@ -0,0 +1 @@
+../shared/single_flight.py
\ No newline at end of file
@@ -0,0 +1,161 @@
+"""Speculative retrieval for the recommendations pipeline.
+
+The serial pipeline cannot search until the retrieval summary (a full Gemini call) is done. In
+speculative mode the search starts at once, with a keyword query extracted locally from the
+patient record, while the summary is still being generated. If the speculative hits score well
+enough (SPECULATIVE_ACCEPT_SCORE) they are used as they are and the summary is not waited for;
+otherwise the summary's hits are fused with them by reciprocal rank fusion.
+
+StageTimings records the wall time of each stage to the logs and to llm_metrics, in both modes,
+so the two can be compared.
+"""
+import contextlib
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, Iterator, List, Sequence, Tuple
+
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Mean score of the top SPECULATIVE_CONFIDENCE_TOP speculative hits at which they are used without
+# waiting for the summary; 0 always waits and fuses
+SPECULATIVE_ACCEPT_SCORE = float(os.environ.get("SPECULATIVE_ACCEPT_SCORE", "0"))
+SPECULATIVE_CONFIDENCE_TOP = int(os.environ.get("SPECULATIVE_CONFIDENCE_TOP", "5"))
+SPECULATIVE_QUERY_MAX_TERMS = int(os.environ.get("SPECULATIVE_QUERY_MAX_TERMS", "64"))
+# Rank offset of reciprocal rank fusion; the usual 60 keeps one list's top hit from dominating
+RRF_CONSTANT = 60
+
+ScoredDocs = List[Tuple[Dict[str, Any], float]]
+
+# Fields, or lines of a text record, that identify the patient rather than describe the case
+IDENTITY_FIELDS = frozenset(["patient", "name", "patient name", "mrn", "dob", "date of birth", "address", "phone",
+                             "email", "patient id"])
+_IDENTITY_LINE = re.compile(r"^\s*(" + "|".join(IDENTITY_FIELDS) + r")\s*:", re.IGNORECASE)
+# Flags that only switch on a description held in a sibling field
+_SWITCH_FLAG = re.compile(r"^(has|taking|seeing)_")
+# Filled-in values that say nothing about the case
+_EMPTY_VALUES = frozenset(["none", "no", "n/a", "na", "not defined", "unknown"])
+_LABEL = re.compile(r"^\s*[A-Za-z][\w /()-]{0,30}:")
+_TERM = re.compile(r"[A-Za-z][A-Za-z0-9'+/-]*|\d+(?:\.\d+)?%?")
+STOPWORDS = frozenset("""
+    a about above after again against all also am an and any are as at be because been before being
+    below between both but by can could did do does doing down during each few for from further had
+    has have having he her here hers him his how i if in into is it its itself just me more most my
+    no nor not now of off on once only or other our out over own per same she should so some such
+    than that the their them then there these they this those through to too under until up very
+    was we were what when where which while who whom why will with would you your
+    patient patients pt history hx currently current reports reported noted denies day days daily
+    mg mcg ml twice once year years old male female
+""".split())
+
+
+def case_values(patient_record: Any) -> List[str]:
+    """The record's clinical content: filled values and the names of flags that are set.
+
+    A dict record (the intake schema) is walked: False flags, empty and uninformative values
+    and identifying fields are skipped, and a True flag contributes its name, e.g.
+    "increased thirst". A text record gives its lines without identifying lines or labels.
+    """
+    values: List[str] = []
+
+    def walk(value: Any, key: str) -> None:
+        if key.replace("_", " ").lower() in IDENTITY_FIELDS:
+            return
+        if isinstance(value, dict):
+            for child_key, child in value.items():
+                walk(child, str(child_key))
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                walk(item, key)
+        elif value is True:
+            if key and not _SWITCH_FLAG.match(key):
+                values.append(key.replace("_", " "))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values.append(str(value))
+        elif isinstance(value, str) and value.strip() and value.strip().lower() not in _EMPTY_VALUES:
+            values.append(value.strip())
+
+    if isinstance(patient_record, (dict, list)):
+        walk(patient_record, "")
+        return values
+    for line in str(patient_record).splitlines():
+        if not _IDENTITY_LINE.match(line) and _LABEL.sub(" ", line).strip():
+            values.append(_LABEL.sub(" ", line).strip())
+    return values
+
+
+def keyword_query(patient_record: Any) -> str:
+    """Search query of the record's distinct clinical terms (see case_values)."""
+    terms: List[str] = []
+    seen = set()
+    for value in case_values(patient_record):
+        for term in _TERM.findall(value):
+            lowered = term.lower()
+            if lowered in STOPWORDS or lowered in seen or (len(term) < 2 and not term.isdigit()):
+                continue
+            seen.add(lowered)
+            terms.append(term)
+            if len(terms) >= SPECULATIVE_QUERY_MAX_TERMS:
+                return " ".join(terms)
+    return " ".join(terms)
+
+
+def is_confident(hits: ScoredDocs) -> bool:
+    """Whether speculative hits are good enough to use without the summary's."""
+    if SPECULATIVE_ACCEPT_SCORE <= 0 or not hits:
+        return False
+    top = [score for _, score in hits[:SPECULATIVE_CONFIDENCE_TOP]]
+    return sum(top) / len(top) >= SPECULATIVE_ACCEPT_SCORE
+
+
+def fuse_rankings(rankings: Sequence[ScoredDocs], k: int) -> List[Dict[str, Any]]:
+    """Reciprocal rank fusion of several hit lists, by PMID; ties keep first-seen order."""
+    scores: Dict[str, float] = {}
+    documents: Dict[str, Dict[str, Any]] = {}
+    for ranking in rankings:
+        for rank, (doc, _) in enumerate(ranking):
+            key = str(doc["pmid"])
+            documents.setdefault(key, doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (RRF_CONSTANT + rank + 1)
+    order = sorted(scores, key=lambda key: -scores[key])
+    return [documents[key] for key in order[:k]]
+
+
+class StageTimings:
+    """Wall time per pipeline stage, and marks of time since the start.
+
+    Stages may overlap, so they need not add up to the total.
+    """
+
+    def __init__(self, mode: str) -> None:
+        self.mode = mode
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = time.perf_counter() - started
+
+    def mark(self, name: str) -> None:
+        """Record the time since the pipeline started, e.g. until the first byte was sent."""
+        self.stages[name] = time.perf_counter() - self.started
+
+    def timed(self, name: str, fn, *args: Any) -> Any:
+        with self.stage(name):
+            return fn(*args)
+
+    def report(self, **details: Any) -> Dict[str, float]:
+        """Record the stages and the total to metrics and the log, and return them in milliseconds."""
+        self.stages["total"] = time.perf_counter() - self.started
+        for name, seconds in self.stages.items():
+            metrics.record_stage(self.mode, name, seconds)
+        timings = {name: round(seconds * 1000, 1) for name, seconds in self.stages.items()}
+        logger.info(f"Recommendations pipeline ({self.mode}) stage timings ms: {timings} {details or ''}".rstrip())
+        return timings
@@ -0,0 +1,31 @@
+from context_packer import estimate_tokens, literature_tokens, pack_context
+
+RECORD = {
+    "symptoms": {"current": {"increased_thirst": True, "fatigue": False, "other_symptoms": ""}},
+    "additional": {"conditions": {"has_conditions": True, "description": "chronic kidney disease"}},
+}
+
+
+def doc(pmid, content, title="A study"):
+    return {"pmid": pmid, "title": title, "content": content}
+
+
+def test_denied_symptom_does_not_raise_sentence_score():
+    abstract = doc("1", "Fatigue and more fatigue. Thirst was measured in this group.")
+    packed, _ = pack_context(RECORD, [abstract, doc("2", "Unrelated cardiology trial outcomes.")], max_sentences=1)
+    assert packed[0]["content"] == "Thirst was measured in this group."
+
+
+def test_denied_symptom_does_not_rank_a_document_first():
+    fatigue = doc("1", "Fatigue and more fatigue.", title="Fatigue")
+    kidney = doc("2", "Outcomes of kidney care in trials.", title="Trial")
+    packed, _ = pack_context(RECORD, [fatigue, kidney])
+    assert [d["pmid"] for d in packed][0] == "2"
+
+
+def test_near_duplicates_dropped_and_budget_kept():
+    text = "Thirst and kidney disease outcomes were measured over twelve months in this cohort. " * 10
+    docs = [doc(str(i), text) for i in range(5)]
+    packed, stats = pack_context(RECORD, docs, budget=200)
+    assert stats["duplicates"] == 4 and len(packed) == 1
+    assert literature_tokens(packed) <= 200 + estimate_tokens("\n\n")
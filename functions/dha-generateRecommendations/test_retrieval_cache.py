@@ -0,0 +1,24 @@
+from retrieval_cache import RetrievalCache
+
+
+def lookup(cache, query, embedding, k=2):
+    return cache.get(query, k) or cache.get_similar(embedding, k)
+
+
+def test_each_lookup_is_counted_once_without_similarity():
+    cache = RetrievalCache(similarity_threshold=0)
+    assert lookup(cache, "Type 2 diabetes", [1.0, 0.0]) is None
+    cache.put("Type 2 diabetes", [1.0, 0.0], 2, [("a", 0.9), ("b", 0.8)])
+    assert lookup(cache, "type 2  Diabetes.", [1.0, 0.0]) == [("a", 0.9), ("b", 0.8)]
+    assert lookup(cache, "hypertension", [0.0, 1.0]) is None
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["similar_hits"], stats["misses"]) == (1, 0, 2)
+    assert stats["hit_rate"] == round(1 / 3, 4)
+
+
+def test_near_duplicate_reuses_neighbors():
+    cache = RetrievalCache(similarity_threshold=0.95)
+    cache.put("diabetic kidney disease", [1.0, 0.1], 2, [("a", 0.9), ("b", 0.8)])
+    assert lookup(cache, "kidney disease in diabetes", [1.0, 0.12]) == [("a", 0.9), ("b", 0.8)]
+    assert lookup(cache, "kidney disease in diabetes", [1.0, 0.12], k=3) is None
+    assert cache.stats()["similar_hits"] == 1 and cache.stats()["misses"] == 1
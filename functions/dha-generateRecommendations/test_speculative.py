@@ -0,0 +1,50 @@
+from speculative import case_values, fuse_rankings, keyword_query
+
+RECORD = {
+    "name": "Jane Doe",
+    "symptoms": {
+        "current": {
+            "increased_thirst": True,
+            "blurred_vision": True,
+            "fatigue": False,
+            "numbness_tingling": False,
+            "other_symptoms": "",
+        },
+        "blood_sugar": {"check_frequency": "Weekly", "fasting_range": "140-180 mg/dL"},
+        "medications": {
+            "taking_medications": True,
+            "medication_list": ["Metformin 500mg"],
+            "problems": {"has_problems": False, "description": ""},
+        },
+    },
+    "lifestyle": {"mental": {"stress_level": "High", "symptoms": {"depression": False, "other": ""}}},
+    "additional": {
+        "conditions": {"has_conditions": True, "description": "hypertension, chronic kidney disease"},
+        "concerns": "None",
+    },
+}
+
+
+def test_dict_record_gives_filled_values_and_set_flags():
+    assert case_values(RECORD) == [
+        "increased thirst", "blurred vision", "Weekly", "140-180 mg/dL", "Metformin 500mg", "High",
+        "hypertension, chronic kidney disease",
+    ]
+
+
+def test_keyword_query_of_dict_record():
+    query = keyword_query(RECORD).lower().split()
+    assert "hypertension" in query and "kidney" in query and "thirst" in query
+    # Denied symptoms, schema keys, booleans and identifying fields stay out of the query
+    for term in ("fatigue", "numbness", "depression", "symptoms", "current", "false", "true", "jane", "none"):
+        assert term not in query
+
+
+def test_keyword_query_of_text_record_drops_identity_lines_and_labels():
+    record = "Patient: John Doe\nAge: 45\nDiagnosis: Type 2 Diabetes\nMedications: Metformin 1000mg twice daily"
+    assert keyword_query(record) == "45 Type 2 Diabetes Metformin 1000"
+
+
+def test_fuse_rankings_prefers_documents_in_both_lists():
+    a, b, c = ({"pmid": pmid} for pmid in ("1", "2", "3"))
+    assert [doc["pmid"] for doc in fuse_rankings([[(a, 0.9), (b, 0.8)], [(c, 0.9), (b, 0.7)]], 3)] == ["2", "1", "3"]
@@ -1,11 +1,19 @@
 import base64
 import json
 import functions_framework
-from google import genai
 from google.genai import types
 import os
 
+import admission
+import gemini_client
+import llm_metrics
+import model_router
+
+generate_content_config = gemini_client.make_config(temperature=0.4)
+
 @functions_framework.http
+@llm_metrics.instrumented("dha-processMedicationImage")
+@admission.rate_limited
 def process_medication_image(request):
     print("Function started")
     # Set CORS headers for the preflight request
@@ -36,16 +44,6 @@ def process_medication_image(request):
         image_data = image_file.read()
         print(f"Image data length: {len(image_data)} bytes")
 
-        # Initialize Gemini client
-        print("Initializing Gemini client")
-        client = genai.Client(
-            vertexai=True,
-            project="gemini-med-lit-review",
-            location="us-central1",
-        )
-        
-        model = "gemini-2.5-pro"
-
         # Prepare the image for the model
         print("Preparing image for model")
         image_part = types.Part.from_bytes(
@@ -60,40 +58,17 @@ def process_medication_image(request):
                 role="user",
                 parts=[
                     image_part,
-                    types.Part.from_text("Extract all relevant medication information from this image. Include names, dosages, total volumes, and any other pertinent details. Provide the information in a structured format.")
+                    types.Part.from_text(text="Extract all relevant medication information from this image. Include names, dosages, total volumes, and any other pertinent details. Provide the information in a structured format.")
                 ]
             )
         ]
         
-        generate_content_config = types.GenerateContentConfig(
-            temperature=0.4,
-            top_p=0.95,
-            max_output_tokens=8192,
-            safety_settings=[
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HATE_SPEECH",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                    threshold="OFF"
-                ),
-                types.SafetySetting(
-                    category="HARM_CATEGORY_HARASSMENT",
-                    threshold="OFF"
-                )
-            ],
-        )
-        
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        )
+        # Label transcription usually succeeds on the fast model; an empty reply is retried on Pro
+        response = model_router.router.run(
+            "medication_image",
+            lambda model: gemini_client.generate_content(contents, generate_content_config, model=model,
+                                                         operation="medication_image"),
+            validate=lambda response: bool(response.text and response.text.strip()))
 
         # Process the response
         print("Processing response")
@@ -108,6 +83,9 @@ def process_medication_image(request):
         print("Returning successful response")
         return (json.dumps(result), 200, headers)
 
+    except admission.Overloaded as e:
+        print(f"Request turned away: {str(e)}")
+        return (json.dumps({'error': str(e)}), e.status, {**headers, **e.headers()})
     except Exception as e:
         print(f"Error occurred: {str(e)}")
         print(f"Error type: {type(e)}")
@@ -0,0 +1,257 @@
+import hashlib
+import json
+from typing import Dict, Any, Iterable, List, Optional
+
+from schema import RECORD_SCHEMA, QUESTIONS, get_path
+
+# Progress items reported to the frontend, with the record path each one tracks
+COMPLETED_SECTIONS = [
+    ("symptoms-current", "symptoms.current"),
+    ("symptoms-blood-sugar", "symptoms.blood_sugar"),
+    ("symptoms-medications", "symptoms.medications"),
+    ("symptoms-problems", "symptoms.medications"),  # Problems are part of medications
+    ("lifestyle-diet", "lifestyle.diet"),
+    ("lifestyle-activity", "lifestyle.activity"),
+    ("lifestyle-mental", "lifestyle.mental"),
+    ("lifestyle-cognitive", "lifestyle.cognitive"),
+    ("additional-conditions", "additional.conditions"),
+    ("additional-healthcare", "additional.healthcare"),
+    ("additional-concerns", "additional.concerns"),
+]
+
+# Sections that each need at least one truthy answer before the record can be inserted
+REQUIRED_SECTIONS = ["symptoms", "lifestyle", "additional"]
+
+
+def is_filled(value: Any) -> bool:
+    """Whether a value counts as answered for prompting: False and 0 count, empty strings do not."""
+    if isinstance(value, dict):
+        return any(is_filled(v) for v in value.values())
+    elif isinstance(value, list):
+        return len(value) > 0
+    elif isinstance(value, str):
+        return len(value.strip()) > 0
+    return value is not None
+
+
+def is_truthy(value: Any) -> bool:
+    """Whether a value counts toward a complete record: only truthy answers do."""
+    if isinstance(value, dict):
+        return any(is_truthy(v) for v in value.values())
+    return bool(value)
+
+
+class CompletionState:
+    """Completion bitmaps for one record, indexed by SchemaIndex offsets.
+
+    filled/truthy have a bit per schema node whose own value is answered; a dict node's bit
+    stands for answers under keys the schema does not define. lists marks dict nodes that hold
+    a list instead. pending and sections are derived bitmaps over QUESTIONS and COMPLETED_SECTIONS.
+    """
+
+    __slots__ = ("filled", "truthy", "lists", "pending", "sections")
+
+    def __init__(self, filled: int = 0, truthy: int = 0, lists: int = 0, pending: int = 0, sections: int = 0):
+        self.filled = filled
+        self.truthy = truthy
+        self.lists = lists
+        self.pending = pending
+        self.sections = sections
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "schema": SCHEMA_INDEX.fingerprint,
+            "filled": self.filled,
+            "truthy": self.truthy,
+            "lists": self.lists,
+            "pending": self.pending,
+            "sections": self.sections,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> Optional["CompletionState"]:
+        """Restore a persisted state, or None if it was built against a different schema."""
+        if not data or data.get("schema") != SCHEMA_INDEX.fingerprint:
+            return None
+        return cls(data["filled"], data["truthy"], data["lists"], data["pending"], data["sections"])
+
+
+class SchemaIndex:
+    """RECORD_SCHEMA compiled into a flat path table with a bit offset per node."""
+
+    def __init__(self, schema: Dict[str, Any], questions: List[str], sections: List[str]):
+        self.paths: List[str] = []
+        self.offsets: Dict[str, int] = {}
+        self._children: List[Optional[Dict[str, int]]] = []
+        self._subtree: List[int] = []
+        self._ancestors: List[int] = []
+        self._roots: Dict[str, int] = {}
+        for key, node in schema.items():
+            self._roots[key] = self._compile(key, node, 0)
+
+        self.questions = questions
+        self.sections = sections
+        self._question_offsets = [self.offsets[path] for path in questions]
+        self._section_offsets = [self.offsets[path] for path in sections]
+        self._required_masks = [self._subtree[self.offsets[path]] for path in REQUIRED_SECTIONS]
+        self.fingerprint = hashlib.sha1(
+            json.dumps([self.paths, questions, sections]).encode("utf-8")
+        ).hexdigest()[:12]
+
+    def _compile(self, path: str, node: Any, ancestors: int) -> int:
+        offset = len(self.paths)
+        self.paths.append(path)
+        self.offsets[path] = offset
+        self._children.append(None)
+        self._subtree.append(0)
+        self._ancestors.append(ancestors)
+
+        mask = 1 << offset
+        if isinstance(node, dict):
+            children = {}
+            for key, child in node.items():
+                child_offset = self._compile(f"{path}.{key}", child, ancestors | (1 << offset))
+                children[key] = child_offset
+                mask |= self._subtree[child_offset]
+            self._children[offset] = children
+        self._subtree[offset] = mask
+        return offset
+
+    # Building and updating state
+
+    def scan(self, record: Dict[str, Any]) -> CompletionState:
+        """Walk a record once and build its completion state."""
+        state = CompletionState()
+        if isinstance(record, dict):
+            for key, offset in self._roots.items():
+                if key in record:
+                    self._scan_node(state, offset, record[key])
+        self._derive(state, -1)
+        return state
+
+    def apply(self, state: CompletionState, record: Dict[str, Any], touched: Iterable[str]) -> CompletionState:
+        """Refresh the state after the values at the given dotted paths were replaced."""
+        before = (state.filled, state.lists)
+        for path in touched:
+            offset = self._deepest_known(path)
+            if offset is None:
+                continue
+            clear = ~self._subtree[offset]
+            state.filled &= clear
+            state.truthy &= clear
+            state.lists &= clear
+            value = get_path(record, self.paths[offset])
+            if value is not None:
+                self._scan_node(state, offset, value)
+        self._derive(state, (before[0] ^ state.filled) | (before[1] ^ state.lists))
+        return state
+
+    def _deepest_known(self, path: str) -> Optional[int]:
+        offset = None
+        children = self._roots
+        for key in path.split('.'):
+            if children is None or key not in children:
+                break
+            offset = children[key]
+            children = self._children[offset]
+        return offset
+
+    def _scan_node(self, state: CompletionState, offset: int, value: Any) -> None:
+        children = self._children[offset]
+        bit = 1 << offset
+        if children is not None and isinstance(value, dict):
+            for key, child_value in value.items():
+                if key in children:
+                    self._scan_node(state, children[key], child_value)
+                else:
+                    if is_filled(child_value):
+                        state.filled |= bit
+                    if is_truthy(child_value):
+                        state.truthy |= bit
+            return
+
+        if is_filled(value):
+            state.filled |= bit
+        if is_truthy(value):
+            state.truthy |= bit
+        if children is not None and isinstance(value, list):
+            state.lists |= bit
+
+    def _derive(self, state: CompletionState, changed: int) -> None:
+        """Recompute the question and section bitmaps whose masks overlap the changed bits."""
+        for i, offset in enumerate(self._question_offsets):
+            if (self._subtree[offset] | self._ancestors[offset]) & changed:
+                if self._offset_complete(state, offset):
+                    state.pending &= ~(1 << i)
+                else:
+                    state.pending |= 1 << i
+        for i, offset in enumerate(self._section_offsets):
+            if self._subtree[offset] & changed:
+                if state.filled & self._subtree[offset]:
+                    state.sections |= 1 << i
+                else:
+                    state.sections &= ~(1 << i)
+
+    # Lookups
+
+    def _offset_complete(self, state: CompletionState, offset: int) -> bool:
+        # A list where the schema expects a section counts as answering everything below it
+        return bool(state.filled & self._subtree[offset]) or bool(state.lists & self._ancestors[offset])
+
+    def is_field_complete(self, state: CompletionState, path: str) -> Optional[bool]:
+        """Completion of a schema path, or None if the path is not in the schema."""
+        offset = self.offsets.get(path)
+        if offset is None:
+            return None
+        return self._offset_complete(state, offset)
+
+    def next_question(self, state: CompletionState) -> Optional[int]:
+        """Index into QUESTIONS of the first unanswered question, or None when all are answered."""
+        if not state.pending:
+            return None
+        return (state.pending & -state.pending).bit_length() - 1
+
+    def remaining_questions(self, state: CompletionState) -> int:
+        return bin(state.pending).count("1")
+
+    def pending_questions(self, state: CompletionState) -> List[int]:
+        """Indexes into QUESTIONS of every unanswered question, in order."""
+        return [i for i in range(len(self.questions)) if state.pending >> i & 1]
+
+    def completed_sections(self, state: CompletionState) -> List[str]:
+        sections = state.sections
+        return [name for i, (name, _) in enumerate(COMPLETED_SECTIONS) if sections >> i & 1]
+
+    def is_record_complete(self, state: CompletionState) -> bool:
+        return all(state.truthy & mask for mask in self._required_masks)
+
+
+SCHEMA_INDEX = SchemaIndex(
+    RECORD_SCHEMA,
+    [field for field, _ in QUESTIONS],
+    [path for _, path in COMPLETED_SECTIONS],
+)
+
+
+def merge_user_input(current_record: Dict[str, Any], user_input: Dict[str, Any],
+                     completion: Optional[CompletionState] = None) -> Dict[str, Any]:
+    """Merge user input with the current record, updating only provided fields.
+
+    If a completion state is given, only the replaced sub-trees are re-indexed.
+    """
+    touched: List[str] = []
+
+    def deep_update(d: Dict[str, Any], u: Dict[str, Any], prefix: str) -> Dict[str, Any]:
+        for k, v in u.items():
+            path = f"{prefix}.{k}" if prefix else k
+            if isinstance(v, dict) and k in d and isinstance(d[k], dict):
+                d[k] = deep_update(d[k], v, path)
+            else:
+                d[k] = v
+                touched.append(path)
+        return d
+
+    merged = deep_update(current_record, user_input, "")
+    if completion is not None:
+        SCHEMA_INDEX.apply(completion, merged, touched)
+    return merged
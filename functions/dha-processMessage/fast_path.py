@@ -0,0 +1,470 @@
+import difflib
+import logging
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+from schema import nest
+
+logger = logging.getLogger(__name__)
+
+# Answers below this confidence are handed to Gemini instead; a single unexplained word (0.9) is below it.
+MIN_CONFIDENCE = float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", "0.95"))
+
+# Used to estimate latency saved for a field until a real Gemini call for it has been timed.
+DEFAULT_LLM_LATENCY_MS = float(os.environ.get("FAST_PATH_DEFAULT_LLM_LATENCY_MS", "4000"))
+
+# Plausible blood glucose readings in mg/dL; anything outside is left to the LLM.
+MIN_GLUCOSE_MG_DL = 20
+MAX_GLUCOSE_MG_DL = 600
+
+FILLER_WORDS = {
+    "i", "im", "ive", "my", "me", "it", "its", "is", "am", "are", "was", "be",
+    "a", "an", "the", "to", "of", "in", "on", "at", "for", "and", "or", "so", "that", "this",
+    "do", "does", "did", "dont", "not", "have", "has", "havent", "hasnt", "had",
+    "any", "anything", "other", "usually", "typically", "generally", "normally", "mostly",
+    "probably", "about", "around", "roughly", "approximately", "say", "would", "id",
+    "well", "um", "uh", "ok", "okay", "yes", "yeah", "just", "really", "pretty", "quite",
+    "thanks", "thank", "you", "please", "per", "time", "times", "level", "levels", "range",
+    "mg", "dl", "mgdl", "between", "from", "like", "currently", "right", "now", "at", "all",
+    "of", "those", "these", "them", "symptoms", "with", "by",
+}
+
+NEGATION_LEADS = {"no", "nope", "nah", "none", "nothing", "not", "never", "negative"}
+
+# Words a bare denial may carry besides filler. Never answer vocabulary (symptoms, conditions,
+# providers): "no, just fatigue" or "no, my GP" carry an answer and must go to the LLM.
+DENIAL_WORDS = {
+    "else", "thats", "more", "further", "really", "problem", "problems", "issue", "issues",
+    "change", "changes", "noticed", "condition", "conditions", "question", "questions",
+    "concern", "concerns", "seeing", "anyone", "anybody", "nobody", "moment",
+}
+
+# Any of these means the answer carries a qualification the rules cannot capture.
+CONTRAST_WORDS = {"but", "except", "although", "though", "however", "besides", "unless"}
+
+UNSURE_PHRASES = ["dont know", "do not know", "not sure", "no idea", "unsure", "cant remember", "dont remember"]
+
+CHECK_FREQUENCY_OPTIONS = [
+    ("Several times a day", ["several times a day", "several times daily", "multiple times a day",
+                             "many times a day", "a few times a day", "few times a day",
+                             "couple times a day", "couple of times a day", "twice a day",
+                             "twice daily", "two times a day", "three times a day",
+                             "3 times a day", "2 times a day", "before and after meals"]),
+    ("Daily", ["daily", "every day", "everyday", "once a day", "once daily", "each day",
+               "every morning", "every night", "every evening", "each morning"]),
+    ("Weekly", ["weekly", "once a week", "every week", "a few times a week", "few times a week",
+                "couple times a week", "several times a week"]),
+    ("Less often", ["less often", "monthly", "once a month", "rarely", "occasionally",
+                    "every now and then", "not often", "hardly ever", "once in a while"]),
+    ("Not at all", ["not at all", "never", "i dont check", "i do not check", "none"]),
+]
+
+ADHERENCE_OPTIONS = [
+    ("Most of the time", ["most of the time", "mostly", "usually", "almost always", "nearly always",
+                          "most days", "most times"]),
+    ("Always", ["always", "every time", "all the time", "religiously", "never miss", "never missed",
+                "as prescribed", "every dose"]),
+    ("Sometimes", ["sometimes", "some of the time", "occasionally", "now and then", "half the time"]),
+    ("Rarely", ["rarely", "seldom", "hardly ever", "not often", "almost never"]),
+    ("Never", ["never", "not at all", "i dont take them"]),
+]
+
+DIET_HEALTH_OPTIONS = [
+    ("Not very healthy", ["not very healthy", "not so healthy", "not that healthy", "not too healthy",
+                          "not great", "could be better"]),
+    ("Very healthy", ["very healthy", "really healthy", "extremely healthy", "super healthy", "excellent"]),
+    ("Somewhat healthy", ["somewhat healthy", "fairly healthy", "pretty healthy", "moderately healthy",
+                          "reasonably healthy", "mostly healthy", "kind of healthy", "okay", "average"]),
+    ("Unhealthy", ["unhealthy", "poor", "bad", "terrible", "junk food"]),
+]
+
+WEEKLY_FREQUENCY_OPTIONS = [
+    ("Several times a week", ["several times a week", "most days", "many times a week",
+                              "5 times a week", "five times a week", "4 times a week",
+                              "four times a week", "6 times a week", "six times a week"]),
+    ("A few times a week", ["a few times a week", "few times a week", "couple times a week",
+                            "couple of times a week", "twice a week", "two times a week",
+                            "three times a week", "2 times a week", "3 times a week",
+                            "weekends", "on weekends"]),
+    ("Daily", ["daily", "every day", "everyday", "each day", "with every meal", "every meal"]),
+    ("Rarely", ["rarely", "seldom", "hardly ever", "occasionally", "not often",
+                "almost never", "once in a while"]),
+    ("Never", ["never", "not at all"]),
+]
+
+STRESS_OPTIONS = [
+    ("Very low", ["very low", "really low", "extremely low", "minimal", "no stress"]),
+    ("Very high", ["very high", "really high", "extremely high", "very stressed", "overwhelmed"]),
+    ("Low", ["low", "not much", "a little", "little", "mild", "not very stressed"]),
+    ("Moderate", ["moderate", "medium", "average", "so so", "manageable", "moderately"]),
+    ("High", ["high", "stressed", "a lot", "lots"]),
+]
+
+CURRENT_SYMPTOM_KEYWORDS = {
+    "increased_thirst": ["increased thirst", "thirsty", "thirst"],
+    "frequent_urination": ["frequent urination", "urinating", "urination", "peeing", "pee a lot", "bathroom a lot"],
+    "unexplained_weight_loss": ["unexplained weight loss", "weight loss", "losing weight", "lost weight"],
+    "increased_hunger": ["increased hunger", "hungry", "hunger"],
+    "blurred_vision": ["blurred vision", "blurry vision", "blurry", "blurred", "vision"],
+    "slow_healing_sores": ["slow healing sores", "slow-healing sores", "sores", "cuts heal slowly"],
+    "frequent_infections": ["frequent infections", "infections", "infection"],
+    "numbness_tingling": ["numbness", "tingling", "numb", "pins and needles"],
+    "fatigue": ["fatigue", "tired", "fatigued", "exhausted", "tiredness", "no energy"],
+}
+
+MENTAL_SYMPTOM_FLAGS = [
+    "loss_of_interest", "depression", "difficulty_concentrating", "appetite_changes",
+    "sleep_problems", "hopelessness", "suicidal_thoughts",
+]
+
+FIELD_LABELS = {
+    "symptoms.current": "your current symptoms",
+    "symptoms.blood_sugar.check_frequency": "how often you check your blood sugar",
+    "symptoms.blood_sugar.fasting_range": "your fasting blood sugar range",
+    "symptoms.blood_sugar.post_meal_range": "your after-meal blood sugar range",
+    "symptoms.medications.adherence": "how often you take your medications as prescribed",
+    "symptoms.medications.problems": "that you have no problems with your medications",
+    "lifestyle.diet": "your diet",
+    "lifestyle.activity": "how often you are physically active",
+    "lifestyle.mental": "your stress level and mental health",
+    "lifestyle.cognitive": "that you have not noticed changes in your memory or thinking",
+    "additional.conditions": "that you have no other health conditions",
+    "additional.healthcare": "that you are not currently seeing a healthcare professional",
+    "additional.concerns": "that you have no further questions or concerns",
+}
+
+
+def normalize(text: str) -> str:
+    """Lower-case, drop punctuation that never carries meaning here and collapse whitespace."""
+    text = text.lower().replace("'", "").replace("’", "").replace("–", "-").replace("—", "-")
+    text = re.sub(r"[^a-z0-9\-/\s]", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t.strip("-/") for t in text.split() if t.strip("-/")]
+
+
+class FastPathStats:
+    """Thread-safe per-field counters for the fast path and the Gemini fallback."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fields: Dict[str, Dict[str, float]] = {}
+
+    def _entry(self, field: str) -> Dict[str, float]:
+        if field not in self._fields:
+            self._fields[field] = {"attempts": 0, "hits": 0, "fast_ms": 0.0, "llm_calls": 0, "llm_ms": 0.0}
+        return self._fields[field]
+
+    def record_attempt(self, field: str, hit: bool, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self._entry(field)
+            entry["attempts"] += 1
+            entry["fast_ms"] += elapsed_ms
+            if hit:
+                entry["hits"] += 1
+
+    def record_llm_call(self, field: str, elapsed_ms: float) -> None:
+        with self._lock:
+            entry = self._entry(field)
+            entry["llm_calls"] += 1
+            entry["llm_ms"] += elapsed_ms
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Hit rate and estimated latency saved, per field and overall."""
+        with self._lock:
+            fields = {name: dict(entry) for name, entry in self._fields.items()}
+
+        total_llm_calls = sum(e["llm_calls"] for e in fields.values())
+        total_llm_ms = sum(e["llm_ms"] for e in fields.values())
+        global_llm_ms = total_llm_ms / total_llm_calls if total_llm_calls else DEFAULT_LLM_LATENCY_MS
+
+        report: Dict[str, Any] = {"fields": {}}
+        total_attempts = total_hits = 0
+        total_saved = 0.0
+        for name, entry in sorted(fields.items()):
+            avg_llm_ms = entry["llm_ms"] / entry["llm_calls"] if entry["llm_calls"] else global_llm_ms
+            saved_ms = max(entry["hits"] * avg_llm_ms - entry["fast_ms"], 0.0)
+            report["fields"][name] = {
+                "attempts": int(entry["attempts"]),
+                "hits": int(entry["hits"]),
+                "hit_rate": round(entry["hits"] / entry["attempts"], 4) if entry["attempts"] else 0.0,
+                "avg_fast_path_ms": round(entry["fast_ms"] / entry["attempts"], 4) if entry["attempts"] else 0.0,
+                "avg_llm_ms": round(avg_llm_ms, 1),
+                "latency_saved_ms": round(saved_ms, 1),
+            }
+            total_attempts += entry["attempts"]
+            total_hits += entry["hits"]
+            total_saved += saved_ms
+
+        report["attempts"] = int(total_attempts)
+        report["hits"] = int(total_hits)
+        report["hit_rate"] = round(total_hits / total_attempts, 4) if total_attempts else 0.0
+        report["latency_saved_ms"] = round(total_saved, 1)
+        return report
+
+
+class FastPathExtractor:
+    """Deterministic extractor for closed-choice intake answers.
+
+    Maps a reply to the RECORD_SCHEMA fields of the current prompt using option matching,
+    synonyms, fuzzy matching for typos, negation and mg/dL ranges. Returns None whenever the
+    answer is not confidently understood, so the caller can fall back to Gemini.
+    """
+
+    def __init__(self, questions: List[Tuple[str, str]], min_confidence: float = MIN_CONFIDENCE):
+        self.min_confidence = min_confidence
+        self.stats = FastPathStats()
+        self._question_words = {
+            field: set(tokenize(normalize(question))) for field, question in questions
+        }
+        self._handlers = {
+            "symptoms.current": self._extract_current_symptoms,
+            "symptoms.blood_sugar.check_frequency": lambda m, w: self._extract_choice(
+                m, w, "symptoms.blood_sugar.check_frequency", CHECK_FREQUENCY_OPTIONS),
+            "symptoms.blood_sugar.fasting_range": lambda m, w: self._extract_range(
+                m, w, "symptoms.blood_sugar.fasting_range"),
+            "symptoms.blood_sugar.post_meal_range": lambda m, w: self._extract_range(
+                m, w, "symptoms.blood_sugar.post_meal_range"),
+            "symptoms.medications.adherence": lambda m, w: self._extract_choice(
+                m, w, "symptoms.medications.adherence", ADHERENCE_OPTIONS),
+            "symptoms.medications.problems": lambda m, w: self._extract_denial(
+                m, w, "symptoms.medications.problems", {"has_problems": False, "description": ""}),
+            "lifestyle.diet": self._extract_diet,
+            "lifestyle.activity": lambda m, w: self._extract_choice(
+                m, w, "lifestyle.activity.exercise_frequency", WEEKLY_FREQUENCY_OPTIONS),
+            "lifestyle.mental": self._extract_mental,
+            "lifestyle.cognitive": lambda m, w: self._extract_denial(
+                m, w, "lifestyle.cognitive", {"has_changes": False, "description": ""}),
+            "additional.conditions": lambda m, w: self._extract_denial(
+                m, w, "additional.conditions", {"has_conditions": False, "description": ""}),
+            "additional.healthcare": lambda m, w: self._extract_denial(
+                m, w, "additional.healthcare", {"seeing_doctor": False, "provider_details": ""}),
+            "additional.concerns": lambda m, w: self._extract_denial(
+                m, w, "additional.concerns", "None"),
+        }
+
+    def extract(self, user_message: str, current_prompt: Optional[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """Return {"updated_record", "message", "confidence"} or None to defer to the LLM."""
+        if not current_prompt or current_prompt.get('field') not in self._handlers:
+            return None
+
+        field = current_prompt['field']
+        start = time.perf_counter()
+        result = None
+        try:
+            message = normalize(user_message)
+            if message:
+                allowed = FILLER_WORDS | self._question_words.get(field, set())
+                result = self._handlers[field](message, allowed)
+        except Exception as e:
+            logger.error(f"Fast path extractor failed for {field}: {str(e)}")
+            result = None
+
+        if result is not None and result[1] < self.min_confidence:
+            logger.info(f"Fast path confidence {result[1]:.2f} below threshold for {field}")
+            result = None
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats.record_attempt(field, result is not None, elapsed_ms)
+        if result is None:
+            return None
+
+        updated_record, confidence, summary = result
+        label = FIELD_LABELS.get(field, field)
+        ack = f"Thank you, I've noted {label}" + (f": {summary}." if summary else ".")
+        return {"updated_record": updated_record, "message": ack, "confidence": round(confidence, 3)}
+
+    def record_llm_latency(self, current_prompt: Optional[Dict[str, str]], elapsed_ms: float) -> None:
+        """Time a Gemini fallback so latency saved can be estimated per field."""
+        if current_prompt and current_prompt.get('field') in self._handlers:
+            self.stats.record_llm_call(current_prompt['field'], elapsed_ms)
+
+    # Matching primitives
+
+    @staticmethod
+    def _find_phrases(message: str, options: List[Tuple[str, List[str]]]) -> List[Tuple[int, int, str]]:
+        """Find non-overlapping option phrases, longest first, as (start, end, label) character spans."""
+        candidates = []
+        for label, phrases in options:
+            for phrase in [label.lower()] + phrases:
+                for match in re.finditer(r"(?<![a-z0-9])" + re.escape(phrase) + r"(?![a-z0-9])", message):
+                    candidates.append((match.start(), match.end(), label))
+        candidates.sort(key=lambda c: (-(c[1] - c[0]), c[0]))
+
+        chosen: List[Tuple[int, int, str]] = []
+        for start, end, label in candidates:
+            if all(end <= s or start >= e for s, e, _ in chosen):
+                chosen.append((start, end, label))
+        return sorted(chosen)
+
+    @staticmethod
+    def _is_negated(message: str, start: int) -> bool:
+        preceding = tokenize(message[:start])[-2:]
+        return any(t in ("not", "dont", "never", "no", "without", "isnt") for t in preceding)
+
+    @staticmethod
+    def _leftover(message: str, spans: List[Tuple[int, int]], allowed: set) -> List[str]:
+        """Tokens outside matched spans that are neither filler nor words from the question itself."""
+        chars = list(message)
+        for start, end in spans:
+            for i in range(start, end):
+                chars[i] = " "
+        return [t for t in tokenize("".join(chars)) if t not in allowed and not t.isdigit()]
+
+    @staticmethod
+    def _coverage_confidence(base: float, leftover: List[str], message: str) -> float:
+        if any(t in CONTRAST_WORDS for t in tokenize(message)):
+            return 0.0
+        if not leftover:
+            return base
+        if len(leftover) > 2:
+            return 0.0
+        return base * (1 - 0.1 * len(leftover))
+
+    def _match_choice(self, message: str, allowed: set,
+                      options: List[Tuple[str, List[str]]]) -> Optional[Tuple[str, float, List[Tuple[int, int]]]]:
+        """Match a single option; returns (label, confidence, spans) or None."""
+        found = self._find_phrases(message, options)
+        labels = {label for _, _, label in found}
+        negated = any(self._is_negated(message, start) for start, _, _ in found)
+        if len(labels) == 1 and not negated:
+            label = labels.pop()
+            return label, 1.0, [(s, e) for s, e, _ in found]
+        if found:
+            # Conflicting or negated options ("not daily") are left to the LLM.
+            return None
+
+        # Fuzzy match for short, typo-laden answers such as "rarly" or "somtimes".
+        tokens = [t for t in tokenize(message) if t not in allowed]
+        if not tokens or len(tokens) > 4:
+            return None
+        phrase = " ".join(tokens)
+        vocabulary = {}
+        for label, phrases in options:
+            for p in [label.lower()] + phrases:
+                vocabulary[p] = label
+        close = difflib.get_close_matches(phrase, list(vocabulary), n=2, cutoff=0.8)
+        if not close:
+            return None
+        if len(close) > 1 and vocabulary[close[0]] != vocabulary[close[1]]:
+            return None
+        ratio = difflib.SequenceMatcher(None, phrase, close[0]).ratio()
+        return vocabulary[close[0]], min(0.95, 0.5 + ratio / 2), [(0, len(message))]
+
+    def _match_denial(self, message: str) -> Optional[float]:
+        """A bare denial such as "no" or "none of those"; any word that could be an answer rejects it."""
+        tokens = tokenize(message)
+        if not tokens or tokens[0] not in NEGATION_LEADS:
+            return None
+        if self._leftover(message, [], FILLER_WORDS | NEGATION_LEADS | DENIAL_WORDS):
+            return None
+        return self._coverage_confidence(1.0, [], message) or None
+
+    # Field handlers, each returning (updated_record, confidence, summary) or None
+
+    def _extract_choice(self, message: str, allowed: set, path: str, options):
+        match = self._match_choice(message, allowed, options)
+        if match is None:
+            return None
+        label, confidence, spans = match
+        confidence = self._coverage_confidence(confidence, self._leftover(message, spans, allowed), message)
+        return nest(path, label), confidence, label
+
+    def _extract_range(self, message: str, allowed: set, path: str):
+        if any(p in message for p in UNSURE_PHRASES):
+            return nest(path, "Not defined"), 0.95, "Not defined"
+        if "mmol" in message:
+            return None
+
+        ranges = list(re.finditer(r"(\d{2,3})\s*(?:-|to|and)\s*(\d{2,3})", message))
+        if ranges:
+            if len(ranges) > 1:
+                return None
+            low, high = sorted(int(g) for g in ranges[0].groups())
+            spans = [ranges[0].span()]
+            value = f"{low}-{high} mg/dL"
+        else:
+            numbers = list(re.finditer(r"\d{2,3}", message))
+            if len(numbers) != 1:
+                return None
+            low = high = int(numbers[0].group())
+            spans = [numbers[0].span()]
+            qualifier = next((q for q in ("under", "below", "less than", "over", "above") if q in message), None)
+            value = f"{qualifier} {low} mg/dL" if qualifier else f"around {low} mg/dL"
+            if qualifier:
+                allowed = allowed | set(qualifier.split())
+
+        if low < MIN_GLUCOSE_MG_DL or high > MAX_GLUCOSE_MG_DL:
+            return None
+        confidence = self._coverage_confidence(1.0, self._leftover(message, spans, allowed), message)
+        return nest(path, value), confidence, value
+
+    def _extract_denial(self, message: str, allowed: set, path: str, value: Any):
+        confidence = self._match_denial(message)
+        if confidence is None:
+            return None
+        return nest(path, value), confidence, ""
+
+    def _extract_multi_select(self, message: str, keywords: Dict[str, List[str]]):
+        """Return ({flag: True}, spans) for mentioned symptoms, or None if any mention is negated."""
+        options = [(flag, phrases) for flag, phrases in keywords.items()]
+        found = self._find_phrases(message, options)
+        flags: Dict[str, bool] = {}
+        for start, end, flag in found:
+            if self._is_negated(message, start):
+                # Mixed answers such as "no thirst but tired" need the LLM.
+                return None
+            flags[flag] = True
+        return flags, [(s, e) for s, e, _ in found]
+
+    def _extract_current_symptoms(self, message: str, allowed: set):
+        denial = self._match_denial(message)
+        if denial is not None:
+            flags = {flag: False for flag in CURRENT_SYMPTOM_KEYWORDS}
+            flags["other_symptoms"] = ""
+            return nest("symptoms.current", flags), denial, "none"
+
+        selected = self._extract_multi_select(message, CURRENT_SYMPTOM_KEYWORDS)
+        if selected is None or not selected[0]:
+            return None
+        flags, spans = selected
+        confidence = self._coverage_confidence(1.0, self._leftover(message, spans, allowed), message)
+        return nest("symptoms.current", flags), confidence, ", ".join(f.replace('_', ' ') for f in flags)
+
+    def _extract_diet(self, message: str, allowed: set):
+        health = self._match_choice(message, allowed, DIET_HEALTH_OPTIONS)
+        frequency = self._match_choice(message, allowed, WEEKLY_FREQUENCY_OPTIONS)
+        if health is None or frequency is None:
+            return None
+        spans = health[2] + frequency[2]
+        confidence = self._coverage_confidence(min(health[1], frequency[1]),
+                                               self._leftover(message, spans, allowed), message)
+        value = {"overall_health": health[0], "fruits_vegetables_frequency": frequency[0]}
+        return nest("lifestyle.diet", value), confidence, f"{health[0]}, fruits and vegetables {frequency[0].lower()}"
+
+    def _extract_mental(self, message: str, allowed: set):
+        stress = self._match_choice(message, allowed, STRESS_OPTIONS)
+        if stress is None:
+            return None
+        label, confidence, spans = stress
+
+        # Only an explicit denial of the listed symptoms is handled here; anything else goes to the LLM.
+        remainder = "".join(" " if any(s <= i < e for s, e in spans) else c for i, c in enumerate(message))
+        denial = re.search(r"(?<![a-z0-9])(no|none|nothing|not)(?![a-z0-9])", remainder)
+        if denial is None:
+            return None
+        confidence = min(confidence, self._match_denial(remainder[denial.start():].strip()) or 0.0)
+        if not confidence:
+            return None
+        confidence = self._coverage_confidence(
+            confidence, self._leftover(remainder[:denial.start()], [], allowed), message)
+
+        symptoms = {flag: False for flag in MENTAL_SYMPTOM_FLAGS}
+        symptoms["other"] = ""
+        value = {"stress_level": label, "symptoms": symptoms}
+        return nest("lifestyle.mental", value), confidence, f"stress {label.lower()}, no other symptoms"
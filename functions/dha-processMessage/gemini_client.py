@@ -0,0 +1 @@
+../shared/gemini_client.py
\ No newline at end of file
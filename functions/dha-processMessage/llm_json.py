@@ -0,0 +1,313 @@
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+from schema import RECORD_SCHEMA
+
+# Python literals Gemini occasionally writes in place of JSON ones
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+_TRUE_STRINGS = {"true", "yes", "y"}
+_FALSE_STRINGS = {"false", "no", "n"}
+
+OUTCOMES = ("ok", "recovered", "failed")
+
+
+class TolerantJsonParser:
+    """Incremental parser for the JSON object in a Gemini reply.
+
+    Text can be fed in chunks as it streams. Anything before the first '{' (prose, a markdown
+    fence) and after the object closes is ignored. Trailing commas and Python literals are
+    repaired as they are scanned, and the last point at which the object was well formed is
+    remembered, so a truncated reply can be closed off there instead of being discarded.
+    Raw newlines inside strings are accepted.
+    """
+
+    def __init__(self) -> None:
+        self._out: List[str] = []
+        self._stack: List[List[Any]] = []  # [kind, state, comma index] per open container
+        self._in_string = False
+        self._escape = False
+        self._scalar_start: Optional[int] = None
+        self._safe: Tuple[int, str] = (0, "")
+        self.started = False
+        self.done = False
+        self.broken = False
+        self.repaired = False
+
+    def feed(self, text: str) -> None:
+        for ch in text:
+            if self.done:
+                if not ch.isspace() and ch != '`':
+                    self.repaired = True  # trailing text after the object
+                    break
+                continue
+            if self.broken:
+                break
+            if not self.started:
+                if ch == '{':
+                    self.started = True
+                    self._open('{')
+                continue
+            self._step(ch)
+
+    def finish(self) -> Tuple[Optional[Any], str]:
+        """Return the parsed object and whether it parsed "ok", was "recovered" or "failed"."""
+        if not self.started:
+            return None, "failed"
+        if not self.done and not self.broken:
+            self._close_truncated()
+        if self.broken:
+            return None, "failed"
+
+        if self.done:
+            text = "".join(self._out)
+        else:
+            length, closers = self._safe
+            text = "".join(self._out[:length]) + closers
+        try:
+            value = json.loads(text, strict=False)
+        except json.JSONDecodeError:
+            return None, "failed"
+        return value, ("recovered" if self.repaired or not self.done else "ok")
+
+    # Scanning
+
+    def _step(self, ch: str) -> None:
+        out = self._out
+        if self._in_string:
+            out.append(ch)
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                self._end_string()
+            elif ch < ' ':
+                self.repaired = True  # raw control character, accepted by the non-strict decode
+            return
+
+        if self._scalar_start is not None:
+            if ch.isspace() or ch in ',}]:':
+                if not self._end_scalar():
+                    return
+            else:
+                out.append(ch)
+                return
+
+        frame = self._stack[-1]
+        kind, state = frame[0], frame[1]
+        if ch.isspace():
+            out.append(ch)
+        elif ch == '"':
+            if state not in ('key', 'value'):
+                self.broken = True
+                return
+            if state == 'key':
+                frame[2] = None
+            out.append(ch)
+            self._in_string = True
+        elif ch == ':':
+            if kind != '{' or state != 'colon':
+                self.broken = True
+                return
+            out.append(ch)
+            frame[1] = 'value'
+        elif ch == ',':
+            if state != 'comma':
+                self.broken = True
+                return
+            frame[2] = len(out)
+            out.append(ch)
+            frame[1] = 'key' if kind == '{' else 'value'
+        elif ch in '{[':
+            if state != 'value':
+                self.broken = True
+                return
+            self._open(ch)
+        elif ch in '}]':
+            if (ch == '}') != (kind == '{') or state not in ('key', 'value', 'comma'):
+                self.broken = True
+                return
+            if state != 'comma' and frame[2] is not None:
+                out[frame[2]] = ''  # trailing comma
+                self.repaired = True
+            elif state == 'value' and kind == '{':
+                self.broken = True
+                return
+            out.append(ch)
+            self._stack.pop()
+            if not self._stack:
+                self.done = True
+            else:
+                self._value_done()
+        else:
+            if state != 'value':
+                self.broken = True
+                return
+            self._scalar_start = len(out)
+            out.append(ch)
+
+    def _open(self, ch: str) -> None:
+        self._out.append(ch)
+        self._stack.append([ch, 'key' if ch == '{' else 'value', None])
+        self._mark_safe()
+
+    def _end_string(self) -> None:
+        frame = self._stack[-1]
+        if frame[0] == '{' and frame[1] == 'key':
+            frame[1] = 'colon'
+        else:
+            self._value_done()
+
+    def _end_scalar(self) -> bool:
+        start, self._scalar_start = self._scalar_start, None
+        token = "".join(self._out[start:])
+        if token in _PY_LITERALS:
+            self._out[start:] = [_PY_LITERALS[token]]
+            self.repaired = True
+        else:
+            try:
+                json.loads(token)
+            except json.JSONDecodeError:
+                self.broken = True
+                return False
+        self._value_done()
+        return True
+
+    def _value_done(self) -> None:
+        frame = self._stack[-1]
+        frame[1] = 'comma'
+        frame[2] = None
+        self._mark_safe()
+
+    def _mark_safe(self) -> None:
+        closers = "".join('}' if frame[0] == '{' else ']' for frame in reversed(self._stack))
+        self._safe = (len(self._out), closers)
+
+    def _close_truncated(self) -> None:
+        # A value cut off mid-way is dropped (half a string or number would be stored as the
+        # answer), except a literal that arrived in full
+        if self._scalar_start is not None:
+            token = "".join(self._out[self._scalar_start:])
+            if token in _PY_LITERALS or token in ("true", "false", "null"):
+                self._end_scalar()
+
+
+def parse_tolerant(text: str) -> Tuple[Optional[Any], str]:
+    parser = TolerantJsonParser()
+    parser.feed(text)
+    return parser.finish()
+
+
+def legacy_parses(text: str) -> bool:
+    """Whether the original strip-and-slice parsing would have accepted this reply."""
+    text = text.strip().strip('`').strip()
+    if text.startswith('json'):
+        text = text[4:].strip()
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start != -1 and end != -1:
+        text = text[start:end]
+    try:
+        json.loads(text)
+        return True
+    except json.JSONDecodeError:
+        return False
+
+
+def validate_response(response: Any, schema: Dict[str, Any] = RECORD_SCHEMA) -> Tuple[Optional[Dict[str, Any]], int]:
+    """Check a parsed reply against the record schema.
+
+    Returns the reply reduced to "updated_record" and "message" with unknown keys and
+    mistyped values pruned, and how many were pruned. None if it is not an object at all.
+    """
+    if not isinstance(response, dict):
+        return None, 0
+
+    pruned = 0
+    record = response.get("updated_record", {})
+    if isinstance(record, dict):
+        record, pruned = _prune_dict(record, schema)
+    else:
+        record, pruned = {}, 1
+
+    message = response.get("message", "")
+    if not isinstance(message, str):
+        message = "" if message is None else str(message)
+
+    return {"updated_record": record, "message": message}, pruned
+
+
+def _prune_dict(value: Dict[str, Any], schema: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    cleaned = {}
+    pruned = 0
+    for key, child in value.items():
+        if key not in schema:
+            pruned += 1
+            continue
+        ok, child, child_pruned = _prune(child, schema[key])
+        pruned += child_pruned
+        if ok:
+            cleaned[key] = child
+        else:
+            pruned += 1
+    return cleaned, pruned
+
+
+def _prune(value: Any, schema: Any) -> Tuple[bool, Any, int]:
+    if isinstance(schema, dict):
+        if isinstance(value, dict):
+            cleaned, pruned = _prune_dict(value, schema)
+            return True, cleaned, pruned
+        # A list in place of a section is kept; completion treats it as answering the section
+        return isinstance(value, list), value, 0
+    if isinstance(schema, bool):
+        if isinstance(value, bool):
+            return True, value, 0
+        if isinstance(value, str) and value.strip().lower() in _TRUE_STRINGS | _FALSE_STRINGS:
+            return True, value.strip().lower() in _TRUE_STRINGS, 0
+        return False, None, 0
+    if isinstance(schema, list):
+        if isinstance(value, list):
+            return True, value, 0
+        if isinstance(value, str) and value.strip():
+            return True, [value], 0
+        return False, None, 0
+    if isinstance(schema, str):
+        if isinstance(value, str):
+            return True, value, 0
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return True, str(value), 0
+        return False, None, 0
+    return True, value, 0
+
+
+class ParseStats:
+    """Counts how Gemini replies parsed, and how many the legacy parsing would have lost."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.outcomes = {outcome: 0 for outcome in OUTCOMES}
+        self.retries_saved = 0
+        self.pruned_fields = 0
+
+    def record(self, outcome: str, pruned: int = 0, legacy_ok: bool = True) -> None:
+        with self._lock:
+            self.outcomes[outcome] += 1
+            self.pruned_fields += pruned
+            if outcome == "recovered" and not legacy_ok:
+                self.retries_saved += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = sum(self.outcomes.values())
+            return {
+                "responses": total,
+                **self.outcomes,
+                "failure_rate": round(self.outcomes["failed"] / total, 4) if total else 0.0,
+                "recovery_rate": round(self.outcomes["recovered"] / total, 4) if total else 0.0,
+                "retries_saved": self.retries_saved,
+                "pruned_fields": self.pruned_fields,
+            }
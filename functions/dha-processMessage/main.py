@@ -1,122 +1,73 @@
 import functions_framework
-from flask import jsonify
+from flask import Response, jsonify, stream_with_context
 from flask_cors import CORS
 import json
 import logging
 import traceback
-from google import genai
 from google.genai import types
 import os
-from typing import Dict, Any, List, Optional, Tuple
+import time
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+import admission
+import gemini_client
+import llm_metrics
+import model_router
+from completion import SCHEMA_INDEX, CompletionState, is_filled, merge_user_input
+from fast_path import FastPathExtractor
+from llm_json import ParseStats, TolerantJsonParser, legacy_parses, parse_tolerant, validate_response
+from prompt_builder import build_full_prompt, build_narrative_prompt, build_scoped_prompt
+from schema import RECORD_SCHEMA, QUESTIONS, empty_record, to_response_schema
+from session_store import create_session_store
+from streaming import JsonStringFieldStreamer, sse_event
+from summary_cache import SpeculativeSummaryCache
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize Gemini client
-client = genai.Client(
-    vertexai=True,
-    project="gemini-med-lit-review",
-    location="us-central1",
+generate_content_config = gemini_client.make_config(
+    temperature=0.1  # Lower temperature for more consistent responses
 )
 
-model = "gemini-2.5-pro"
-
-# Define the record schema
-RECORD_SCHEMA: Dict[str, Any] = {
-    "symptoms": {
-        "current": {
-            "increased_thirst": False,
-            "frequent_urination": False,
-            "unexplained_weight_loss": False,
-            "increased_hunger": False,
-            "blurred_vision": False,
-            "slow_healing_sores": False,
-            "frequent_infections": False,
-            "numbness_tingling": False,
-            "fatigue": False,
-            "other_symptoms": ""
+# Bulk narrative intake asks for the whole record back as structured output
+narrative_content_config = gemini_client.make_config(
+    temperature=0.1,
+    response_mime_type="application/json",
+    response_schema={
+        "type": "OBJECT",
+        "properties": {
+            "updated_record": to_response_schema(RECORD_SCHEMA),
+            "message": {"type": "STRING"},
         },
-        "blood_sugar": {
-            "check_frequency": "",
-            "fasting_range": "",
-            "post_meal_range": ""
-        },
-        "medications": {
-            "taking_medications": False,
-            "medication_list": [],
-            "adherence": "",
-            "problems": {
-                "has_problems": False,
-                "description": ""
-            }
-        }
-    },
-    "lifestyle": {
-        "diet": {
-            "overall_health": "",
-            "fruits_vegetables_frequency": ""
-        },
-        "activity": {
-            "exercise_frequency": ""
-        },
-        "mental": {
-            "stress_level": "",
-            "symptoms": {
-                "loss_of_interest": False,
-                "depression": False,
-                "difficulty_concentrating": False,
-                "appetite_changes": False,
-                "sleep_problems": False,
-                "hopelessness": False,
-                "suicidal_thoughts": False,
-                "other": ""
-            }
-        },
-        "cognitive": {
-            "has_changes": False,
-            "description": ""
-        }
+        "required": ["updated_record", "message"],
     },
-    "additional": {
-        "conditions": {
-            "has_conditions": False,
-            "description": ""
-        },
-        "healthcare": {
-            "seeing_doctor": False,
-            "provider_details": ""
-        },
-        "concerns": ""
-    }
-}
+)
+
+# Shown in place of a Gemini reply when generation fails
+EMPTY_RESPONSE_MESSAGE = "I apologize, but I couldn't generate a proper response. Could you please try again?"
+ERROR_RESPONSE_MESSAGE = "I'm sorry, but there was an error processing your request. Please try again later."
+SUMMARY_ERROR_MESSAGE = "We apologize, but we couldn't generate a summary of your responses at this time. Please review your answers and discuss them with your healthcare provider."
 
 class PromptGenerator:
     def __init__(self):
-        self.questions = [
-            ("symptoms.current", "Have you experienced any of the following symptoms in the past week? (Please mention all that apply)\n- Increased thirst\n- Frequent urination\n- Unexplained weight loss\n- Increased hunger\n- Blurred vision\n- Slow-healing sores\n- Frequent infections\n- Numbness or tingling in your hands or feet\n- Fatigue\n- Any other symptoms you'd like to mention"),
-            ("symptoms.blood_sugar.check_frequency", "How often do you check your blood sugar levels?\n- Daily\n- Several times a day\n- Weekly\n- Less often\n- Not at all"),
-            ("symptoms.blood_sugar.fasting_range", "What is your typical fasting blood sugar range in mg/dL?"),
-            ("symptoms.blood_sugar.post_meal_range", "What is your typical blood sugar range after meals in mg/dL?"),
-            ("symptoms.medications.medication_list", "What medications are you taking for your diabetes? Please list the medications and their dosages."),
-            ("symptoms.medications.adherence", "How often do you take your medications as prescribed?\n- Always\n- Most of the time\n- Sometimes\n- Rarely\n- Never"),
-            ("symptoms.medications.problems", "What problems, if any, are you having with your diabetes medications?"),
-            ("lifestyle.diet", "How would you describe your diet?\n- Very healthy\n- Somewhat healthy\n- Not very healthy\n- Unhealthy\n\nHow often do you eat fruits and vegetables?\n- Daily\n- Several times a week\n- A few times a week\n- Rarely\n- Never"),
-            ("lifestyle.activity", "How often do you engage in physical activity?\n- Daily\n- Several times a week\n- A few times a week\n- Rarely\n- Never"),
-            ("lifestyle.mental", "How would you rate your stress levels?\n- Very low\n- Low\n- Moderate\n- High\n- Very high\n\nHave you experienced any of the following symptoms in the past month? \n- Loss of interest in activities you used to enjoy\n- Feeling down or depressed\n- Difficulty concentrating\n- Changes in appetite\n- Sleep problems\n- Feeling hopeless or helpless\n- Thoughts of death or suicide\n- Any other symptoms you'd like to mention."),
-            ("lifestyle.cognitive", "Have you noticed any changes in your memory or thinking skills? If yes, please describe the changes."),
-            ("additional.conditions", "Do you have any other health conditions besides diabetes? If yes, please list them."),
-            ("additional.healthcare", "Are you currently seeing a doctor or other healthcare professional for your diabetes? If yes, who are you seeing?"),
-            ("additional.concerns", "Do you have any questions or concerns about your diabetes?")
-        ]
-
-    def get_next_prompt(self, current_record: Dict[str, Any]) -> Optional[Dict[str, str]]:
-        for field, question in self.questions:
-            if not self.is_field_complete(current_record, field):
-                return {"field": field, "prompt": question}
-        return None
+        self.questions = list(QUESTIONS)
+
+    def get_next_prompt(self, current_record: Dict[str, Any], completion: Optional[CompletionState] = None) -> Optional[Dict[str, str]]:
+        if completion is None:
+            completion = SCHEMA_INDEX.scan(current_record)
+        index = SCHEMA_INDEX.next_question(completion)
+        if index is None:
+            return None
+        field, question = self.questions[index]
+        return {"field": field, "prompt": question}
 
     def is_field_complete(self, record: Dict[str, Any], section_path: str) -> bool:
+        complete = SCHEMA_INDEX.is_field_complete(SCHEMA_INDEX.scan(record), section_path)
+        if complete is not None:
+            return complete
+
+        # Paths outside the schema are not indexed; walk the record instead
         keys = section_path.split('.')
         value = record
         for key in keys:
@@ -128,121 +79,32 @@ class PromptGenerator:
             else:
                 # If we can't navigate further but we're not at the end, it's not complete
                 return False
-        
-        def is_filled(v):
-            if isinstance(v, dict):
-                return any(is_filled(sub_v) for sub_v in v.values())
-            elif isinstance(v, list):
-                return len(v) > 0
-            elif isinstance(v, str):
-                return len(v.strip()) > 0
-            return v is not None
 
         return is_filled(value)
 
 prompt_generator = PromptGenerator()
-
-def create_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]]) -> str:
-    return f"""
-    ## SYSTEM INSTRUCTIONS
-    You are a medical assistant helping to complete a diabetes questionnaire. Analyze the user's response
-    and update the appropriate fields in the record. Only update fields explicitly mentioned in the user's message.
-    You must strictly adhere to the provided schema structure.
-
-    Current Record State:
-    {json.dumps(current_record, indent=2)}
-
-    Current Prompt:
-    {json.dumps(current_prompt, indent=2)}
-
-    ## USER MESSAGE
-    {user_message}
-
-    ## RECORD SCHEMA
-    You must use this exact schema structure when updating the record:
-    {json.dumps(RECORD_SCHEMA, indent=2)}
-
-    ## EXPECTED OUTPUT FORMAT
-    Provide ONLY a JSON response with the following structure. Do not include any text outside this JSON structure:
-    {{
-        "updated_record": {{
-            // Only include fields that are present in the RECORD_SCHEMA and were mentioned by the user
-        }},
-        "message": "Your response message acknowledging what was updated"
-    }}
-
-    ## IMPORTANT GUIDELINES
-    1. Only include sections and fields in "updated_record" that were explicitly mentioned in the user's message AND exist in the RECORD_SCHEMA.
-    2. Do not create new fields or change the structure of the RECORD_SCHEMA.
-    3. For medications, include both name and dosage in the medication_list array.
-    4. For symptoms, set boolean flags to true only when explicitly mentioned as present.
-    5. Use "Not defined" for any requested string information that the user didn't provide clearly.
-    6. Ensure the JSON is valid and properly formatted before returning.
-    7. Do not add any explanatory text outside the JSON structure.
-    8. If you're unsure about any information, do not include it in the updated_record.
-
-    ## SELF-VALIDATION
-    Before returning your response, please verify:
-    1. The JSON structure is valid and matches the expected format.
-    2. Only relevant fields have been updated based on the user's input.
-    3. All updated fields exist in the RECORD_SCHEMA.
-    4. No new fields or structures have been added that don't exist in the RECORD_SCHEMA.
-    5. The "message" field accurately reflects the updates made.
-
-    If any of these checks fail, correct your response before returning it.
-    """
-
-def merge_user_input(current_record: Dict[str, Any], user_input: Dict[str, Any]) -> Dict[str, Any]:
-    """Merge user input with the current record, updating only provided fields."""
-    def deep_update(d: Dict[str, Any], u: Dict[str, Any]) -> Dict[str, Any]:
-        for k, v in u.items():
-            if isinstance(v, dict) and k in d and isinstance(d[k], dict):
-                d[k] = deep_update(d[k], v)
-            else:
-                d[k] = v
-        return d
-
-    return deep_update(current_record, user_input)
-
-def generate_content(prompt: str) -> str:
+fast_path_extractor = FastPathExtractor(prompt_generator.questions)
+session_store = create_session_store()
+parse_stats = ParseStats()
+
+def create_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+                  message_first: bool = False) -> str:
+    """Build the extraction prompt, scoped to the current field when there is one."""
+    if current_prompt and current_prompt.get('field'):
+        prompt = build_scoped_prompt(user_message, current_record, current_prompt)
+    else:
+        prompt = build_full_prompt(user_message, current_record, current_prompt)
+    if message_first:
+        # Lets the acknowledgement be streamed before the record update is generated
+        prompt += '\nWrite the "message" key before "updated_record" in your JSON response.\n'
+    return prompt
+
+def generate_content(prompt: str, config: types.GenerateContentConfig = generate_content_config,
+                     operation: str = "extract", model: str = gemini_client.MODEL) -> str:
     """Generate content using Gemini."""
-    generate_content_config = types.GenerateContentConfig(
-        temperature=0.1,  # Lower temperature for more consistent responses
-        top_p=0.95,
-        max_output_tokens=8192,
-        safety_settings=[
-            types.SafetySetting(
-                category="HARM_CATEGORY_HATE_SPEECH",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_DANGEROUS_CONTENT",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                threshold="OFF"
-            ),
-            types.SafetySetting(
-                category="HARM_CATEGORY_HARASSMENT",
-                threshold="OFF"
-            )
-        ],
-    )
-
     try:
-        contents = [
-            types.Content(
-                role="user",
-                parts=[types.Part(text=prompt)]
-            )
-        ]
-        
-        response = client.models.generate_content(
-            model=model,
-            contents=contents,
-            config=generate_content_config,
-        )
+        response = gemini_client.generate_content(gemini_client.user_content(prompt), config, model=model,
+                                                  operation=operation)
         
         if response.text:
             return response.text
@@ -250,26 +112,29 @@ def generate_content(prompt: str) -> str:
             logger.error("Gemini API returned an empty response")
             return json.dumps({
                 "updated_record": {},
-                "message": "I apologize, but I couldn't generate a proper response. Could you please try again?"
+                "message": EMPTY_RESPONSE_MESSAGE
             })
+    except admission.Overloaded:
+        raise
     except Exception as e:
         logger.error(f"Error generating content from Gemini API: {str(e)}")
         return json.dumps({
             "updated_record": {},
-            "message": "I'm sorry, but there was an error processing your request. Please try again later."
+            "message": ERROR_RESPONSE_MESSAGE
         })
 
-def is_record_complete(record: Dict[str, Any]) -> bool:
-    """Check if all required sections of the record have been filled."""
-    def check_section(section: Dict[str, Any]) -> bool:
-        if isinstance(section, dict):
-            return any(check_section(v) for v in section.values())
-        return bool(section)
+def stream_content(prompt: str, model: str = gemini_client.MODEL) -> Iterator[str]:
+    """Generate content using Gemini, yielding text chunks as they arrive."""
+    for chunk in gemini_client.generate_content_stream(gemini_client.user_content(prompt), generate_content_config,
+                                                     model=model, operation="extract_stream"):
+        if chunk.text:
+            yield chunk.text
 
-    return all(
-        check_section(record[main_section])
-        for main_section in ["symptoms", "lifestyle", "additional"]
-    )
+def is_record_complete(record: Dict[str, Any], completion: Optional[CompletionState] = None) -> bool:
+    """Check if all required sections of the record have been filled."""
+    if completion is None:
+        completion = SCHEMA_INDEX.scan(record)
+    return SCHEMA_INDEX.is_record_complete(completion)
 
 def validate_input(user_message: str, current_record: Dict[str, Any]) -> Tuple[bool, str]:
     """Validate user input and current record."""
@@ -280,7 +145,10 @@ def validate_input(user_message: str, current_record: Dict[str, Any]) -> Tuple[b
     return True, ""
 
 def generate_summary(record: Dict[str, Any]) -> str:
-    """Generate a summary of the patient's responses."""
+    """Generate a summary of the patient's responses from the parts of the record it covers.
+
+    Called by summary_cache with summary_input(record), the same input its key is built from.
+    """
     prompt = f"""
     Based on the following patient record, generate a concise summary (2-3 sentences) highlighting the key points:
 
@@ -297,7 +165,7 @@ def generate_summary(record: Dict[str, Any]) -> str:
     """
 
     try:
-        summary = generate_content(prompt)
+        summary = generate_content(prompt, operation="summary")
         
         # Attempt to parse the response as JSON and extract the 'message' field
         try:
@@ -311,18 +179,247 @@ def generate_summary(record: Dict[str, Any]) -> str:
         return summary.strip()
     except Exception as e:
         logger.error(f"Error generating summary: {str(e)}")
-        return "We apologize, but we couldn't generate a summary of your responses at this time. Please review your answers and discuss them with your healthcare provider."
+        return SUMMARY_ERROR_MESSAGE
+
+# Summaries are precomputed in the background once a single question remains.
+# Apologies returned in place of a summary are not cached.
+summary_cache = SpeculativeSummaryCache(
+    generate_summary,
+    is_cacheable=lambda summary: bool(summary) and summary not in (
+        EMPTY_RESPONSE_MESSAGE, ERROR_RESPONSE_MESSAGE, SUMMARY_ERROR_MESSAGE)
+)
+
+def generate_llm_response(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]]) -> Dict[str, Any]:
+    """Ask Gemini to extract the update and parse its JSON reply."""
+    prompt = create_prompt(user_message, current_record, current_prompt)
+    started = time.perf_counter()
+    response_text = model_router.router.run(
+        "extract", lambda model: generate_content(prompt, model=model), validate=is_valid_extraction)
+    fast_path_extractor.record_llm_latency(current_prompt, (time.perf_counter() - started) * 1000)
+
+    return parse_llm_response(response_text)
+
+
+def is_valid_extraction(response_text: str) -> bool:
+    """Whether a reply parses into the response schema and is not one of our apologies."""
+    response_json, _ = validate_response(parse_tolerant(response_text)[0])
+    return response_json is not None and response_json["message"] not in (
+        EMPTY_RESPONSE_MESSAGE, ERROR_RESPONSE_MESSAGE)
+
+
+def parse_llm_response(response_text: str, parser: Optional[TolerantJsonParser] = None) -> Dict[str, Any]:
+    """Parse Gemini's JSON reply, repairing what it can and pruning fields outside the schema.
+
+    A streaming caller passes in the parser it has already fed the chunks to.
+    """
+    # Log the response for debugging
+    logger.info(f"Gemini API response: {response_text}")
+
+    if parser is None:
+        parser = TolerantJsonParser()
+        parser.feed(response_text)
+    parsed, outcome = parser.finish()
+    response_json, pruned = validate_response(parsed)
+    if response_json is None:
+        outcome = "failed"
+    parse_stats.record(outcome, pruned, legacy_ok=outcome != "recovered" or legacy_parses(response_text))
+
+    if outcome == "recovered":
+        logger.warning("Recovered a malformed Gemini response")
+    if pruned:
+        logger.warning(f"Pruned {pruned} fields outside the record schema from the Gemini response")
+
+    if response_json is None:
+        logger.error("Failed to parse Gemini response as JSON")
+        logger.error(f"Raw response: {response_text}")
+
+        # Fallback: create a simple response
+        response_json = {
+            "updated_record": {},
+            "message": "I'm sorry, but I couldn't process your input correctly. Let me ask you about the next item we need to complete."
+        }
+
+    return response_json
+
+
+def process_turn(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+                 completion: Optional[CompletionState] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Apply one user message to the record and work out the next prompt.
+
+    The completion state is updated in place; it is built from the record if not given.
+    A cached intake summary is only reused within the same session.
+    """
+    # Closed-choice answers are resolved locally; anything ambiguous goes to Gemini
+    response_json = extract_fast_path(user_message, current_prompt)
+    if response_json is None:
+        response_json = generate_llm_response(user_message, current_record, current_prompt)
+
+    return apply_response(user_message, current_record, current_prompt, response_json, completion, session_id)
+
+
+def extract_fast_path(user_message: str, current_prompt: Optional[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+    fast_result = fast_path_extractor.extract(user_message, current_prompt)
+    if not fast_result:
+        return None
+    logger.info(f"Fast path answered {current_prompt['field']} (confidence {fast_result['confidence']})")
+    return {
+        "updated_record": fast_result["updated_record"],
+        "message": fast_result["message"]
+    }
+
+
+def apply_response(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+                   response_json: Dict[str, Any], completion: Optional[CompletionState] = None,
+                   session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Merge an extracted update into the record and build the response payload."""
+    if completion is None:
+        completion = SCHEMA_INDEX.scan(current_record)
+
+    if isinstance(response_json, dict) and "updated_record" in response_json:
+        # Ensure updated_record has all necessary sections
+        for section in RECORD_SCHEMA:
+            if section not in response_json["updated_record"]:
+                response_json["updated_record"][section] = {}
+        
+        updated_record = merge_user_input(current_record, response_json["updated_record"], completion)
+        
+        # Explicit handling for "no" responses
+        if "no" in user_message.lower():
+            if current_prompt and current_prompt['field'] == "additional.conditions":
+                updated_record['additional']['conditions'] = {"has_conditions": False}
+                SCHEMA_INDEX.apply(completion, updated_record, ["additional.conditions"])
+
+        # Check if any fields were actually updated
+        if updated_record == current_record:
+            # No updates were made, so we should prompt for the next available field
+            next_prompt = prompt_generator.get_next_prompt(current_record, completion)
+            if next_prompt:
+                response_json["message"] = f"{response_json.get('message', '')} {next_prompt['prompt']}"
+            else:
+                summary = summary_cache.get(updated_record, session_id)
+                response_json["message"] = f"Thank you for completing the intake! You may modify your entries at any time. {summary}"
+        else:
+            # Fields were updated, so get the next prompt based on the updated record
+            next_prompt = prompt_generator.get_next_prompt(updated_record, completion)
+
+        # One question left: start on the summary now, unless the last answer would change it
+        if (next_prompt and SCHEMA_INDEX.remaining_questions(completion) == 1
+                and not summary_cache.affects_summary(next_prompt['field'])):
+            summary_cache.precompute(updated_record, session_id)
+
+        record_complete = is_record_complete(updated_record, completion)
+
+        return {
+            "updated_record": updated_record,
+            "next_prompt": next_prompt,
+            "ready_to_insert": record_complete,
+            "message": response_json.get("message", ""),
+            "completedSections": get_completed_sections(updated_record, completion)
+        }
+    else:
+        logger.error(f"Invalid response structure from Gemini: {response_json}")
+        raise ValueError("Invalid response structure from Gemini")
+
+
+def process_narrative(narrative: str, current_record: Dict[str, Any],
+                      completion: Optional[CompletionState] = None, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """Fill every field a free-text narrative answers with one structured-output call.
+
+    Returns the same payload as process_turn, plus the questions that are still open.
+    """
+    if completion is None:
+        completion = SCHEMA_INDEX.scan(current_record)
+
+    prompt = build_narrative_prompt(narrative, current_record)
+    response_text = model_router.router.run(
+        "narrative", lambda model: generate_content(prompt, narrative_content_config, operation="narrative", model=model),
+        validate=is_valid_extraction)
+    response_json = parse_llm_response(response_text)
+    updated_record = merge_user_input(current_record, response_json["updated_record"], completion)
+
+    open_questions = [
+        {"field": prompt_generator.questions[i][0], "prompt": prompt_generator.questions[i][1]}
+        for i in SCHEMA_INDEX.pending_questions(completion)
+    ]
+    next_prompt = open_questions[0] if open_questions else None
+    if next_prompt:
+        message = f"{response_json['message']} {next_prompt['prompt']}"
+    else:
+        summary = summary_cache.get(updated_record, session_id)
+        message = f"Thank you for completing the intake! You may modify your entries at any time. {summary}"
+
+    return {
+        "updated_record": updated_record,
+        "next_prompt": next_prompt,
+        "open_questions": open_questions,
+        "ready_to_insert": is_record_complete(updated_record, completion),
+        "message": message.strip(),
+        "completedSections": get_completed_sections(updated_record, completion)
+    }
+
+
+def stream_turn(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+                completion: CompletionState,
+                on_result: Optional[Callable[[Dict[str, Any]], None]] = None,
+                session_id: Optional[str] = None) -> Iterator[str]:
+    """Like process_turn, but yields Server-Sent Events.
+
+    "message" events carry acknowledgement text as Gemini generates it; a final "done" event
+    carries the same payload process_turn returns.
+    """
+    try:
+        response_json = extract_fast_path(user_message, current_prompt)
+        if response_json is not None:
+            yield sse_event("message", {"delta": response_json["message"]})
+        else:
+            prompt = create_prompt(user_message, current_record, current_prompt, message_first=True)
+            streamer = JsonStringFieldStreamer("message")
+            parser = TolerantJsonParser()
+            chunks = []
+            plan = model_router.router.plan("extract_stream")
+            started = time.perf_counter()
+            for text in stream_content(prompt, model=plan[0]):
+                chunks.append(text)
+                parser.feed(text)
+                delta = streamer.feed(text)
+                if delta:
+                    yield sse_event("message", {"delta": delta})
+            elapsed = time.perf_counter() - started
+            fast_path_extractor.record_llm_latency(current_prompt, elapsed * 1000)
+            response_text = "".join(chunks)
+            valid = is_valid_extraction(response_text)
+            model_router.router.record("extract_stream", plan[0], elapsed, valid)
+            if not valid and len(plan) > 1:
+                # The streamed text cannot be taken back; redo the extraction unstreamed
+                model_router.router.escalate("extract_stream", plan[0], plan[1], "invalid output")
+                response_json = parse_llm_response(generate_content(prompt, model=plan[1]))
+            else:
+                response_json = parse_llm_response(response_text, parser)
+
+        result = apply_response(user_message, current_record, current_prompt, response_json, completion, session_id)
+        if on_result:
+            on_result(result)
+        yield sse_event("done", result)
+    except admission.Overloaded as e:
+        logger.warning(f"Turned away streamed message: {str(e)}")
+        yield sse_event("error", {"error": str(e), "retry_after": e.headers()["Retry-After"]})
+    except Exception as e:
+        logger.error(f"Error streaming message: {str(e)}")
+        logger.error(f"Traceback: {traceback.format_exc()}")
+        yield sse_event("error", {"error": "An unexpected error occurred. Please try again later."})
 
 
 @functions_framework.http
+@llm_metrics.instrumented("dha-processMessage")
+@admission.rate_limited(session_exists=lambda session_id: session_store.get(session_id) is not None)
 def process_message(request):
     """HTTP Cloud Function for processing diabetes questionnaire responses."""
     # Handle CORS preflight request
     if request.method == 'OPTIONS':
         headers = {
             'Access-Control-Allow-Origin': '*',
-            'Access-Control-Allow-Methods': 'POST, OPTIONS',
-            'Access-Control-Allow-Headers': 'Content-Type',
+            'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+            'Access-Control-Allow-Headers': 'Content-Type, Accept',
             'Access-Control-Max-Age': '3600'
         }
         return ('', 204, headers)
@@ -332,90 +429,99 @@ def process_message(request):
         'Access-Control-Allow-Origin': '*'
     }
 
+    # Fast path hit rate and latency saved per field
+    if request.method == 'GET':
+        return jsonify({
+            **fast_path_extractor.stats.snapshot(),
+            "llm_cache": gemini_client.cache_stats(),
+            "summary_cache": dict(summary_cache.stats),
+            "json_parser": parse_stats.snapshot(),
+            "model_router": model_router.router.snapshot(),
+            "admission": admission.gate.snapshot()
+        }), 200, headers
+
     try:
         # Parse request data
         request_json = request.get_json(silent=True)
         if not request_json:
             return jsonify({"error": "No JSON data provided"}), 400, headers
 
+        if request_json.get('action') == 'create_session':
+            initial_record = request_json.get('currentRecord') or empty_record()
+            if not isinstance(initial_record, dict):
+                return jsonify({"error": "Invalid current record format."}), 400, headers
+            completion = SCHEMA_INDEX.scan(initial_record)
+            next_prompt = prompt_generator.get_next_prompt(initial_record, completion)
+            session_id = session_store.create(initial_record, next_prompt, completion.to_dict())
+            return jsonify({
+                "sessionId": session_id,
+                "updated_record": initial_record,
+                "next_prompt": next_prompt,
+                "message": next_prompt['prompt'] if next_prompt else "",
+                "completedSections": get_completed_sections(initial_record, completion)
+            }), 200, headers
+
         # Extract required data from request
-        user_message: str = request_json.get('userMessage')
-        current_record: Dict[str, Any] = request_json.get('currentRecord', RECORD_SCHEMA.copy())
-        current_prompt: Optional[Dict[str, str]] = request_json.get('currentPrompt')
+        bulk_intake = request_json.get('action') == 'bulk_intake'
+        if bulk_intake:
+            # The patient's whole story as free text, in place of a single answer
+            user_message: str = request_json.get('narrative') or ''
+        else:
+            user_message = request_json.get('userMessage')
+        session_id: Optional[str] = request_json.get('sessionId')
+        if session_id:
+            # The record and prompt are held server-side; the client only sends its message
+            session = session_store.get(session_id)
+            if session is None:
+                return jsonify({"error": "Session not found or expired"}), 404, headers
+            current_record: Dict[str, Any] = session["record"]
+            current_prompt: Optional[Dict[str, str]] = session["current_prompt"]
+            completion = CompletionState.from_dict(session.get("completion"))
+        else:
+            current_record = request_json.get('currentRecord', RECORD_SCHEMA.copy())
+            current_prompt = request_json.get('currentPrompt')
+            completion = None
 
         # Validate input
         is_valid, error_message = validate_input(user_message, current_record)
         if not is_valid:
             return jsonify({"error": error_message}), 400, headers
 
-        # Generate and process response
-        prompt = create_prompt(user_message, current_record, current_prompt)
-        response_text = generate_content(prompt)
-        
-        # Log the response for debugging
-        logger.info(f"Gemini API response: {response_text}")
+        if completion is None:
+            completion = SCHEMA_INDEX.scan(current_record)
+
+        def save_session(result: Dict[str, Any]) -> None:
+            if session_id:
+                session_store.put(session_id, {
+                    "record": result["updated_record"],
+                    "current_prompt": result["next_prompt"],
+                    "completion": completion.to_dict()
+                })
+                result["sessionId"] = session_id
+
+        if bulk_intake:
+            result = process_narrative(user_message, current_record, completion, session_id)
+            save_session(result)
+            return jsonify(result), 200, headers
+
+        # Opt-in streaming of the acknowledgement as Server-Sent Events
+        if request_json.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            events = stream_turn(user_message, current_record, current_prompt, completion, save_session, session_id)
+            return Response(stream_with_context(events), 200, {
+                **headers,
+                'Content-Type': 'text/event-stream',
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
 
-        # Attempt to parse the response as JSON
-        try:
-            # Strip markdown code block if present
-            response_text = response_text.strip().strip('`').strip()
-            if response_text.startswith('json'):
-                response_text = response_text[4:].strip()
-            # Find the first '{' and the last '}' to extract the JSON object
-            start = response_text.find('{')
-            end = response_text.rfind('}') + 1
-            if start != -1 and end != -1:
-                response_text = response_text[start:end]
-            response_json = json.loads(response_text)
-        except json.JSONDecodeError as json_err:
-            logger.error(f"Failed to parse Gemini response as JSON: {str(json_err)}")
-            logger.error(f"Raw response: {response_text}")
-            
-            # Fallback: create a simple response
-            response_json = {
-                "updated_record": {},
-                "message": "I'm sorry, but I couldn't process your input correctly. Let me ask you about the next item we need to complete."
-            }
-
-        if isinstance(response_json, dict) and "updated_record" in response_json:
-            # Ensure updated_record has all necessary sections
-            for section in RECORD_SCHEMA:
-                if section not in response_json["updated_record"]:
-                    response_json["updated_record"][section] = {}
-            
-            updated_record = merge_user_input(current_record, response_json["updated_record"])
-            
-            # Explicit handling for "no" responses
-            if "no" in user_message.lower():
-                if current_prompt and current_prompt['field'] == "additional.conditions":
-                    updated_record['additional']['conditions'] = {"has_conditions": False}
-
-            # Check if any fields were actually updated
-            if updated_record == current_record:
-                # No updates were made, so we should prompt for the next available field
-                next_prompt = prompt_generator.get_next_prompt(current_record)
-                if next_prompt:
-                    response_json["message"] = f"{response_json.get('message', '')} {next_prompt['prompt']}"
-                else:
-                    summary = generate_summary(updated_record)
-                    response_json["message"] = f"Thank you for completing the intake! You may modify your entries at any time. {summary}"
-            else:
-                # Fields were updated, so get the next prompt based on the updated record
-                next_prompt = prompt_generator.get_next_prompt(updated_record)
+        result = process_turn(user_message, current_record, current_prompt, completion, session_id)
+        save_session(result)
 
-            record_complete = is_record_complete(updated_record)
-
-            return jsonify({
-                "updated_record": updated_record,
-                "next_prompt": next_prompt,
-                "ready_to_insert": record_complete,
-                "message": response_json.get("message", ""),
-                "completedSections": get_completed_sections(updated_record)
-            }), 200, headers
-        else:
-            logger.error(f"Invalid response structure from Gemini: {response_json}")
-            raise ValueError("Invalid response structure from Gemini")
+        return jsonify(result), 200, headers
 
+    except admission.Overloaded as e:
+        logger.warning(f"Turned away message: {str(e)}")
+        return jsonify({"error": str(e)}), e.status, {**headers, **e.headers()}
     except Exception as e:
         logger.error(f"Error processing message: {str(e)}")
         logger.error(f"Traceback: {traceback.format_exc()}")
@@ -423,49 +529,10 @@ def process_message(request):
             "error": "An unexpected error occurred. Please try again later."
         }), 500, headers
 
-def get_completed_sections(record: Dict[str, Any]) -> List[str]:
-    completed = []
-    
-    def is_section_filled(section: Any) -> bool:
-        if isinstance(section, dict):
-            return any(is_section_filled(v) for v in section.values())
-        elif isinstance(section, list):
-            return bool(section)
-        elif isinstance(section, str):
-            return bool(section.strip())  # Consider only non-empty strings as filled
-        return section is not None and section != ""
-
-    # Symptoms section
-    symptoms = record.get("symptoms", {})
-    if is_section_filled(symptoms.get("current")):
-        completed.append("symptoms-current")
-    if is_section_filled(symptoms.get("blood_sugar")):
-        completed.append("symptoms-blood-sugar")
-    if is_section_filled(symptoms.get("medications")):
-        completed.append("symptoms-medications")
-        completed.append("symptoms-problems")  # Assuming problems are part of medications
-
-    # Lifestyle section
-    lifestyle = record.get("lifestyle", {})
-    if is_section_filled(lifestyle.get("diet")):
-        completed.append("lifestyle-diet")
-    if is_section_filled(lifestyle.get("activity")):
-        completed.append("lifestyle-activity")
-    if is_section_filled(lifestyle.get("mental")):
-        completed.append("lifestyle-mental")
-    if is_section_filled(lifestyle.get("cognitive")):
-        completed.append("lifestyle-cognitive")
-
-    # Additional section
-    additional = record.get("additional", {})
-    if is_section_filled(additional.get("conditions")):
-        completed.append("additional-conditions")
-    if is_section_filled(additional.get("healthcare")):
-        completed.append("additional-healthcare")
-    if is_section_filled(additional.get("concerns")):
-        completed.append("additional-concerns")
-
-    return completed
+def get_completed_sections(record: Dict[str, Any], completion: Optional[CompletionState] = None) -> List[str]:
+    if completion is None:
+        completion = SCHEMA_INDEX.scan(record)
+    return SCHEMA_INDEX.completed_sections(completion)
 
 if __name__ == "__main__":
     # This is used when running locally only
@@ -473,7 +540,8 @@ if __name__ == "__main__":
     app = Flask(__name__)
     CORS(app)
     
-    @app.route('/', methods=['POST'])
+    @app.route('/', methods=['GET', 'POST'])
+    @app.route('/metrics', methods=['GET'])
     def local_process_message():
         return process_message(request)
     
@@ -0,0 +1,124 @@
+import json
+from typing import Dict, Any, Optional
+
+from schema import RECORD_SCHEMA, QUESTIONS, get_path, nest
+
+# Identical on every turn so it can be served from the model's prefix cache;
+# everything that varies per request is appended after it.
+SCOPED_PROMPT_PREFIX = """## SYSTEM INSTRUCTIONS
+You are a medical assistant helping to complete a diabetes questionnaire. Analyze the user's response to the current question and update the matching fields of the record. Only update fields explicitly mentioned in the user's message.
+You must strictly adhere to the schema slice given below; it is rooted at the top of the full record.
+
+## EXPECTED OUTPUT FORMAT
+Provide ONLY a JSON response with this structure and no text outside it:
+{"updated_record": {<only schema fields the user mentioned, nested exactly as in the schema slice>}, "message": "<acknowledgement of what was updated>"}
+
+## IMPORTANT GUIDELINES
+1. Only include fields that were explicitly mentioned in the user's message AND exist in the schema slice.
+2. Do not create new fields or change the structure of the schema.
+3. For medications, include both name and dosage in the medication_list array.
+4. For symptoms, set boolean flags to true only when explicitly mentioned as present.
+5. Use "Not defined" for any requested string information that the user didn't provide clearly.
+6. If you're unsure about any information, do not include it in the updated_record.
+7. Ensure the JSON is valid; the "message" field must accurately reflect the updates made.
+"""
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False)
+
+
+def build_scoped_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Dict[str, str]) -> str:
+    """Prompt carrying only the schema and record sub-trees for the current field, in compact JSON."""
+    field = current_prompt.get('field', '')
+    schema_slice = get_path(RECORD_SCHEMA, field) if field else None
+    if schema_slice is None:
+        return build_full_prompt(user_message, current_record, current_prompt)
+
+    record_slice = get_path(current_record, field) if isinstance(current_record, dict) else None
+    if record_slice is None:
+        record_slice = {} if isinstance(schema_slice, dict) else schema_slice
+
+    return (
+        f"{SCOPED_PROMPT_PREFIX}\n"
+        f"## RECORD SCHEMA SLICE\n{compact_json(nest(field, schema_slice))}\n\n"
+        f"## CURRENT VALUES\n{compact_json(nest(field, record_slice))}\n\n"
+        f"## CURRENT QUESTION\n{current_prompt.get('prompt', '')}\n\n"
+        f"## USER MESSAGE\n{user_message}\n"
+    )
+
+
+def build_full_prompt(user_message: str, current_record: Dict[str, Any], current_prompt: Optional[Dict[str, str]]) -> str:
+    """Prompt carrying the whole record and schema, used when there is no current field to scope to."""
+    return f"""
+    ## SYSTEM INSTRUCTIONS
+    You are a medical assistant helping to complete a diabetes questionnaire. Analyze the user's response
+    and update the appropriate fields in the record. Only update fields explicitly mentioned in the user's message.
+    You must strictly adhere to the provided schema structure.
+
+    Current Record State:
+    {json.dumps(current_record, indent=2)}
+
+    Current Prompt:
+    {json.dumps(current_prompt, indent=2)}
+
+    ## USER MESSAGE
+    {user_message}
+
+    ## RECORD SCHEMA
+    You must use this exact schema structure when updating the record:
+    {json.dumps(RECORD_SCHEMA, indent=2)}
+
+    ## EXPECTED OUTPUT FORMAT
+    Provide ONLY a JSON response with the following structure. Do not include any text outside this JSON structure:
+    {{
+        "updated_record": {{
+            // Only include fields that are present in the RECORD_SCHEMA and were mentioned by the user
+        }},
+        "message": "Your response message acknowledging what was updated"
+    }}
+
+    ## IMPORTANT GUIDELINES
+    1. Only include sections and fields in "updated_record" that were explicitly mentioned in the user's message AND exist in the RECORD_SCHEMA.
+    2. Do not create new fields or change the structure of the RECORD_SCHEMA.
+    3. For medications, include both name and dosage in the medication_list array.
+    4. For symptoms, set boolean flags to true only when explicitly mentioned as present.
+    5. Use "Not defined" for any requested string information that the user didn't provide clearly.
+    6. Ensure the JSON is valid and properly formatted before returning.
+    7. Do not add any explanatory text outside the JSON structure.
+    8. If you're unsure about any information, do not include it in the updated_record.
+
+    ## SELF-VALIDATION
+    Before returning your response, please verify:
+    1. The JSON structure is valid and matches the expected format.
+    2. Only relevant fields have been updated based on the user's input.
+    3. All updated fields exist in the RECORD_SCHEMA.
+    4. No new fields or structures have been added that don't exist in the RECORD_SCHEMA.
+    5. The "message" field accurately reflects the updates made.
+
+    If any of these checks fail, correct your response before returning it.
+    """
+
+
+def build_narrative_prompt(narrative: str, current_record: Dict[str, Any]) -> str:
+    """Prompt for extracting every schema field a free-text narrative answers in one call.
+
+    The response shape is enforced by the structured output schema, so it is not spelled out here.
+    """
+    return (
+        "## SYSTEM INSTRUCTIONS\n"
+        "You are a medical assistant helping to complete a diabetes questionnaire. The patient has described "
+        "their situation in their own words. Fill in every field of the record that the narrative answers, "
+        "following the record schema.\n\n"
+        "## IMPORTANT GUIDELINES\n"
+        "1. Leave out any field the narrative does not address. Do not fill in defaults.\n"
+        "2. Set a boolean to false only when the patient clearly says it does not apply, for example "
+        "\"no tingling in my hands or feet\".\n"
+        "3. For symptoms, set boolean flags to true only when described as present.\n"
+        "4. For medications, include both name and dosage in the medication_list array.\n"
+        "5. For closed-choice questions, use the closest of the listed options as the value.\n"
+        "6. In \"message\", briefly summarise back to the patient what you recorded.\n\n"
+        f"## QUESTIONNAIRE\n{compact_json([{'field': field, 'question': question} for field, question in QUESTIONS])}\n\n"
+        f"## CURRENT VALUES\n{compact_json(current_record)}\n\n"
+        f"## PATIENT NARRATIVE\n{narrative}\n"
+    )
@@ -0,0 +1,131 @@
+from typing import Dict, Any, List, Optional, Tuple
+
+# Define the record schema
+RECORD_SCHEMA: Dict[str, Any] = {
+    "symptoms": {
+        "current": {
+            "increased_thirst": False,
+            "frequent_urination": False,
+            "unexplained_weight_loss": False,
+            "increased_hunger": False,
+            "blurred_vision": False,
+            "slow_healing_sores": False,
+            "frequent_infections": False,
+            "numbness_tingling": False,
+            "fatigue": False,
+            "other_symptoms": ""
+        },
+        "blood_sugar": {
+            "check_frequency": "",
+            "fasting_range": "",
+            "post_meal_range": ""
+        },
+        "medications": {
+            "taking_medications": False,
+            "medication_list": [],
+            "adherence": "",
+            "problems": {
+                "has_problems": False,
+                "description": ""
+            }
+        }
+    },
+    "lifestyle": {
+        "diet": {
+            "overall_health": "",
+            "fruits_vegetables_frequency": ""
+        },
+        "activity": {
+            "exercise_frequency": ""
+        },
+        "mental": {
+            "stress_level": "",
+            "symptoms": {
+                "loss_of_interest": False,
+                "depression": False,
+                "difficulty_concentrating": False,
+                "appetite_changes": False,
+                "sleep_problems": False,
+                "hopelessness": False,
+                "suicidal_thoughts": False,
+                "other": ""
+            }
+        },
+        "cognitive": {
+            "has_changes": False,
+            "description": ""
+        }
+    },
+    "additional": {
+        "conditions": {
+            "has_conditions": False,
+            "description": ""
+        },
+        "healthcare": {
+            "seeing_doctor": False,
+            "provider_details": ""
+        },
+        "concerns": ""
+    }
+}
+
+
+# Intake questions in the order they are asked, keyed by the record path they fill
+QUESTIONS: List[Tuple[str, str]] = [
+    ("symptoms.current", "Have you experienced any of the following symptoms in the past week? (Please mention all that apply)\n- Increased thirst\n- Frequent urination\n- Unexplained weight loss\n- Increased hunger\n- Blurred vision\n- Slow-healing sores\n- Frequent infections\n- Numbness or tingling in your hands or feet\n- Fatigue\n- Any other symptoms you'd like to mention"),
+    ("symptoms.blood_sugar.check_frequency", "How often do you check your blood sugar levels?\n- Daily\n- Several times a day\n- Weekly\n- Less often\n- Not at all"),
+    ("symptoms.blood_sugar.fasting_range", "What is your typical fasting blood sugar range in mg/dL?"),
+    ("symptoms.blood_sugar.post_meal_range", "What is your typical blood sugar range after meals in mg/dL?"),
+    ("symptoms.medications.medication_list", "What medications are you taking for your diabetes? Please list the medications and their dosages."),
+    ("symptoms.medications.adherence", "How often do you take your medications as prescribed?\n- Always\n- Most of the time\n- Sometimes\n- Rarely\n- Never"),
+    ("symptoms.medications.problems", "What problems, if any, are you having with your diabetes medications?"),
+    ("lifestyle.diet", "How would you describe your diet?\n- Very healthy\n- Somewhat healthy\n- Not very healthy\n- Unhealthy\n\nHow often do you eat fruits and vegetables?\n- Daily\n- Several times a week\n- A few times a week\n- Rarely\n- Never"),
+    ("lifestyle.activity", "How often do you engage in physical activity?\n- Daily\n- Several times a week\n- A few times a week\n- Rarely\n- Never"),
+    ("lifestyle.mental", "How would you rate your stress levels?\n- Very low\n- Low\n- Moderate\n- High\n- Very high\n\nHave you experienced any of the following symptoms in the past month? \n- Loss of interest in activities you used to enjoy\n- Feeling down or depressed\n- Difficulty concentrating\n- Changes in appetite\n- Sleep problems\n- Feeling hopeless or helpless\n- Thoughts of death or suicide\n- Any other symptoms you'd like to mention."),
+    ("lifestyle.cognitive", "Have you noticed any changes in your memory or thinking skills? If yes, please describe the changes."),
+    ("additional.conditions", "Do you have any other health conditions besides diabetes? If yes, please list them."),
+    ("additional.healthcare", "Are you currently seeing a doctor or other healthcare professional for your diabetes? If yes, who are you seeing?"),
+    ("additional.concerns", "Do you have any questions or concerns about your diabetes?")
+]
+
+
+def get_path(record: Dict[str, Any], path: str) -> Optional[Any]:
+    """Return the value at a dotted path, or None if any part of the path is missing."""
+    value: Any = record
+    for key in path.split('.'):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def nest(path: str, value: Any) -> Dict[str, Any]:
+    """Build a partial record rooted at the top of RECORD_SCHEMA from a dotted path."""
+    result: Any = value
+    for key in reversed(path.split('.')):
+        result = {key: result}
+    return result
+
+
+def empty_record() -> Dict[str, Any]:
+    """Record skeleton with every section present and no answers, as the frontend starts out."""
+    def skeleton(node: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: skeleton(v) for k, v in node.items() if isinstance(v, dict)}
+    return skeleton(RECORD_SCHEMA)
+
+
+def to_response_schema(node: Any = RECORD_SCHEMA) -> Dict[str, Any]:
+    """OpenAPI-style schema for Gemini structured output, mirroring RECORD_SCHEMA.
+
+    No property is required, so fields the patient did not address can be left out.
+    """
+    if isinstance(node, dict):
+        return {
+            "type": "OBJECT",
+            "properties": {key: to_response_schema(child) for key, child in node.items()},
+        }
+    if isinstance(node, bool):
+        return {"type": "BOOLEAN"}
+    if isinstance(node, list):
+        return {"type": "ARRAY", "items": {"type": "STRING"}}
+    return {"type": "STRING"}
@@ -0,0 +1,178 @@
+import abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_CACHE_SIZE = int(os.environ.get("SESSION_CACHE_SIZE", "1024"))
+SESSION_TTL_SECONDS = float(os.environ.get("SESSION_TTL_SECONDS", "3600"))
+# /tmp is the only writable location on Cloud Functions; point this at a mounted volume to survive restarts.
+SESSION_DB_PATH = os.environ.get("SESSION_DB_PATH", "/tmp/intake_sessions.db")
+
+
+class SessionBackend(abc.ABC):
+    """Durable tier behind the in-process session cache."""
+
+    @abc.abstractmethod
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The stored session with its "expires_at", or None."""
+
+    @abc.abstractmethod
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Store the session; raises if it was not stored."""
+
+    @abc.abstractmethod
+    def delete(self, session_id: str) -> None:
+        pass
+
+    def purge_expired(self, now: float) -> int:
+        """Drop sessions expired by `now`; backends that expire entries themselves need not."""
+        return 0
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Stores sessions as JSON rows in a local SQLite database.
+
+    The database is a file on the instance, under /tmp by default, so it is not shared: with
+    more than one Cloud Functions instance a session is only found by the instance that created
+    it. It survives eviction from the memory cache, not scale-out; run a single instance, or
+    implement SessionBackend over a shared store, to keep sessions across instances.
+    """
+
+    def __init__(self, path: str = SESSION_DB_PATH) -> None:
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, expires_at FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        session = json.loads(row[0])
+        session["expires_at"] = row[1]
+        return session
+
+    def save(self, session_id: str, session: Dict[str, Any]) -> None:
+        data = json.dumps({k: v for k, v in session.items() if k != "expires_at"})
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, expires_at) VALUES (?, ?, ?)",
+                (session_id, data, session["expires_at"]),
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+
+    def purge_expired(self, now: float) -> int:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE expires_at <= ?", (now,))
+            self._conn.commit()
+        return cursor.rowcount
+
+
+class SessionStore:
+    """LRU cache of intake sessions with TTL expiry and a write-through durable tier.
+
+    A session is a dict with "record", "current_prompt" and the serialised completion state.
+    Every write goes to the backend first, and is kept in memory only once the backend has
+    stored it, so entries evicted from memory are reloaded from it later. get() returns a copy,
+    so a request changes the stored session only through put().
+    """
+
+    def __init__(self, capacity: int = SESSION_CACHE_SIZE, ttl_seconds: float = SESSION_TTL_SECONDS,
+                 backend: Optional[SessionBackend] = None) -> None:
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def create(self, record: Dict[str, Any], current_prompt: Optional[Dict[str, str]],
+               completion: Optional[Dict[str, Any]] = None) -> str:
+        session_id = uuid.uuid4().hex
+        self.put(session_id, {"record": record, "current_prompt": current_prompt, "completion": completion})
+        return session_id
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Return the session, or None if it does not exist or has expired."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                self._sessions.move_to_end(session_id)
+
+        if session is None and self.backend is not None:
+            session = self.backend.load(session_id)
+            if session is not None:
+                self._remember(session_id, session)
+
+        if session is None:
+            return None
+        if session["expires_at"] <= now:
+            self.delete(session_id)
+            return None
+        return json.loads(json.dumps(session))
+
+    def put(self, session_id: str, session: Dict[str, Any]) -> None:
+        """Store a session and extend its expiry; if the backend write fails, nothing changes."""
+        stored = json.loads(json.dumps({k: v for k, v in session.items() if k != "expires_at"}))
+        stored["expires_at"] = time.time() + self.ttl_seconds
+        if self.backend is not None:
+            self.backend.save(session_id, stored)
+        self._remember(session_id, stored)
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.backend is not None:
+            self.backend.delete(session_id)
+
+    def purge_expired(self) -> int:
+        """Drop expired sessions from both tiers."""
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s["expires_at"] <= now]
+            for sid in expired:
+                del self._sessions[sid]
+        purged = len(expired)
+        if self.backend is not None:
+            purged = max(purged, self.backend.purge_expired(now))
+        return purged
+
+    def _remember(self, session_id: str, session: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[session_id] = session
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.capacity:
+                self._sessions.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+
+def create_session_store() -> SessionStore:
+    """Session store backed by SQLite, or memory only if the database cannot be opened."""
+    try:
+        backend: Optional[SessionBackend] = SQLiteSessionBackend(SESSION_DB_PATH)
+    except sqlite3.Error as e:
+        logger.error(f"Could not open session database at {SESSION_DB_PATH}: {str(e)}")
+        backend = None
+    return SessionStore(backend=backend)
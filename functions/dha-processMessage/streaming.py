@@ -0,0 +1 @@
+../shared/streaming.py
\ No newline at end of file
@@ -0,0 +1,131 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional
+
+from schema import get_path
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_CACHE_SIZE = int(os.environ.get("SUMMARY_CACHE_SIZE", "256"))
+SUMMARY_CACHE_TTL_SECONDS = float(os.environ.get("SUMMARY_CACHE_TTL_SECONDS", "1800"))
+SUMMARY_WORKERS = int(os.environ.get("SUMMARY_WORKERS", "2"))
+
+# The parts of the record the summary is generated from: symptoms, medication side effects,
+# mental health and cognitive changes. Answers elsewhere do not invalidate a summary.
+SUMMARY_PATHS = [
+    "symptoms.current",
+    "symptoms.medications",
+    "lifestyle.mental",
+    "lifestyle.cognitive",
+]
+
+
+def summary_input(record: Dict[str, Any], paths: List[str] = SUMMARY_PATHS) -> Dict[str, Any]:
+    """The parts of the record at `paths`, nested as in the record; all the summary prompt sees."""
+    projection: Dict[str, Any] = {}
+    for path in paths:
+        *parents, leaf = path.split('.')
+        node = projection
+        for key in parents:
+            node = node.setdefault(key, {})
+        node[leaf] = get_path(record, path)
+    return projection
+
+
+class SpeculativeSummaryCache:
+    """Precomputes intake summaries in the background and caches them by their prompt input.
+
+    precompute() is called once the intake is one answer from complete. When the last answer
+    arrives, get() returns the cached summary if that answer left the summarised parts of the
+    record unchanged, waits for a speculative run still in flight, or generates one on the spot.
+
+    `generate` is given summary_input(record), and the key hashes exactly that, so a cached
+    summary was always generated from the same input. Entries are also scoped to the session
+    they were made for; callers without a session only ever hit summaries of the very input
+    they sent.
+    """
+
+    def __init__(self, generate: Callable[[Dict[str, Any]], str],
+                 is_cacheable: Callable[[str], bool] = lambda summary: bool(summary),
+                 paths: List[str] = SUMMARY_PATHS, max_entries: int = SUMMARY_CACHE_SIZE,
+                 ttl_seconds: float = SUMMARY_CACHE_TTL_SECONDS, max_workers: int = SUMMARY_WORKERS):
+        self._generate = generate
+        self._is_cacheable = is_cacheable
+        self.paths = paths
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summary")
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, Future] = {}
+        self.stats = {"speculations": 0, "hits": 0, "waits": 0, "misses": 0}
+
+    def key(self, record: Dict[str, Any], scope: Optional[str] = None) -> str:
+        keyed = {"scope": scope, "input": summary_input(record, self.paths)}
+        return hashlib.sha256(json.dumps(keyed, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+    def affects_summary(self, field: str) -> bool:
+        """Whether answering this question can change the summary."""
+        return any(field == p or field.startswith(p + ".") or p.startswith(field + ".") for p in self.paths)
+
+    def precompute(self, record: Dict[str, Any], scope: Optional[str] = None) -> None:
+        """Start generating the summary for this record in the background, unless already known."""
+        key = self.key(record, scope)
+        snapshot = json.loads(json.dumps(summary_input(record, self.paths)))
+        with self._lock:
+            if self._lookup(key) is not None or key in self._in_flight:
+                return
+            # Carry the request's context so the call is attributed to its endpoint
+            future = self._executor.submit(contextvars.copy_context().run, self._run, key, snapshot)
+            self._in_flight[key] = future
+            self.stats["speculations"] += 1
+        logger.info(f"Speculatively generating intake summary {key[:12]}")
+
+    def get(self, record: Dict[str, Any], scope: Optional[str] = None) -> str:
+        key = self.key(record, scope)
+        with self._lock:
+            summary = self._lookup(key)
+            future = self._in_flight.get(key) if summary is None else None
+            if summary is not None:
+                self.stats["hits"] += 1
+            elif future is not None:
+                self.stats["waits"] += 1
+            else:
+                self.stats["misses"] += 1
+
+        if summary is not None:
+            return summary
+        if future is not None:
+            return future.result()
+        return self._run(key, summary_input(record, self.paths))
+
+    def _run(self, key: str, prompt_input: Dict[str, Any]) -> str:
+        try:
+            summary = self._generate(prompt_input)
+            if self._is_cacheable(summary):
+                with self._lock:
+                    self._entries[key] = (summary, time.time() + self.ttl_seconds)
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            return summary
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
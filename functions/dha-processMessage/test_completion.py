@@ -0,0 +1,115 @@
+import copy
+import random
+
+import pytest
+
+from completion import COMPLETED_SECTIONS, SCHEMA_INDEX, CompletionState, merge_user_input
+from schema import QUESTIONS, RECORD_SCHEMA
+
+
+# The record walks that the completion bitmaps replaced, as main.py had them
+
+def baseline_is_filled(v):
+    if isinstance(v, dict):
+        return any(baseline_is_filled(sub_v) for sub_v in v.values())
+    elif isinstance(v, list):
+        return len(v) > 0
+    elif isinstance(v, str):
+        return len(v.strip()) > 0
+    return v is not None
+
+
+def baseline_is_field_complete(record, section_path):
+    value = record
+    for key in section_path.split('.'):
+        if isinstance(value, dict):
+            value = value.get(key, {})
+        elif isinstance(value, list):
+            return True
+        else:
+            return False
+    return baseline_is_filled(value)
+
+
+def baseline_is_record_complete(record):
+    def check_section(section):
+        if isinstance(section, dict):
+            return any(check_section(v) for v in section.values())
+        return bool(section)
+    return all(check_section(record[main_section]) for main_section in ["symptoms", "lifestyle", "additional"])
+
+
+def baseline_completed_sections(record):
+    return [name for name, path in COMPLETED_SECTIONS
+            if baseline_is_filled(record[path.split('.')[0]].get(path.split('.')[1]))]
+
+
+LEAF_VALUES = [True, False, None, "", "  ", "Not defined", "Daily", 0, [], ["Metformin 500mg"], {"note": ""}]
+
+
+def random_node(rng, node):
+    if isinstance(node, dict):
+        roll = rng.random()
+        if roll < 0.1:
+            return rng.choice([[], ["free text"], "free text", ""])
+        value = {key: random_node(rng, child) for key, child in node.items() if rng.random() < 0.6}
+        if rng.random() < 0.1:
+            value["unexpected"] = rng.choice(LEAF_VALUES)
+        return value
+    return rng.choice(LEAF_VALUES)
+
+
+def random_record(rng):
+    # The baseline walks assumed the three top-level sections are objects
+    return {key: {k: random_node(rng, child) for k, child in node.items() if rng.random() < 0.6}
+            for key, node in RECORD_SCHEMA.items()}
+
+
+def assert_matches_baseline(state, record):
+    for field, _ in QUESTIONS:
+        assert SCHEMA_INDEX.is_field_complete(state, field) == baseline_is_field_complete(record, field), field
+    pending = [i for i, (field, _) in enumerate(QUESTIONS) if not baseline_is_field_complete(record, field)]
+    assert SCHEMA_INDEX.pending_questions(state) == pending
+    assert SCHEMA_INDEX.next_question(state) == (pending[0] if pending else None)
+    assert SCHEMA_INDEX.completed_sections(state) == baseline_completed_sections(record)
+    assert SCHEMA_INDEX.is_record_complete(state) == baseline_is_record_complete(record)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_scan_matches_baseline_walks(seed):
+    record = random_record(random.Random(seed))
+    assert_matches_baseline(SCHEMA_INDEX.scan(record), record)
+
+
+@pytest.mark.parametrize("seed", range(100))
+def test_incremental_merge_matches_fresh_scan(seed):
+    rng = random.Random(seed)
+    record = random_record(rng)
+    state = SCHEMA_INDEX.scan(record)
+    for _ in range(3):
+        update = random_record(rng)
+        record = merge_user_input(record, update, state)
+        fresh = SCHEMA_INDEX.scan(record)
+        assert state.to_dict() == fresh.to_dict()
+        assert_matches_baseline(state, record)
+
+
+def test_false_answers_count_as_answered_but_not_toward_completion():
+    record = {"symptoms": {"current": {"fatigue": False}}, "lifestyle": {}, "additional": {}}
+    state = SCHEMA_INDEX.scan(record)
+    assert SCHEMA_INDEX.is_field_complete(state, "symptoms.current")
+    assert SCHEMA_INDEX.next_question(state) == 1
+    assert not SCHEMA_INDEX.is_record_complete(state)
+
+
+def test_list_in_place_of_a_section_answers_everything_below_it():
+    state = SCHEMA_INDEX.scan({"symptoms": {"medications": ["Metformin"]}})
+    assert SCHEMA_INDEX.is_field_complete(state, "symptoms.medications.problems")
+    assert SCHEMA_INDEX.is_field_complete(state, "symptoms.medications.problems.description")
+
+
+def test_state_round_trips_and_rejects_other_schemas():
+    state = SCHEMA_INDEX.scan(random_record(random.Random(0)))
+    data = state.to_dict()
+    assert CompletionState.from_dict(copy.deepcopy(data)).to_dict() == data
+    assert CompletionState.from_dict({**data, "schema": "other"}) is None
@@ -0,0 +1,75 @@
+import pytest
+
+from fast_path import FastPathExtractor
+from schema import QUESTIONS
+
+
+@pytest.fixture
+def extractor():
+    return FastPathExtractor(QUESTIONS)
+
+
+def extract(extractor, message, field):
+    return extractor.extract(message, {"field": field})
+
+
+@pytest.mark.parametrize("message, field", [
+    ("No, just fatigue", "symptoms.current"),
+    ("no, thirst and blurred vision", "symptoms.current"),
+    ("No, I have hypertension", "additional.conditions"),
+    ("No, who are you seeing? my GP", "additional.healthcare"),
+    ("no, some nausea", "symptoms.medications.problems"),
+    ("no, I forget names", "lifestyle.cognitive"),
+    ("once a week", "lifestyle.activity"),
+    ("daily mornings", "symptoms.blood_sugar.check_frequency"),
+])
+def test_answers_carrying_content_defer_to_llm(extractor, message, field):
+    assert extract(extractor, message, field) is None
+
+
+@pytest.mark.parametrize("message, field, expected", [
+    ("no", "symptoms.current", {"fatigue": False, "increased_thirst": False}),
+    ("None of those", "symptoms.current", {"blurred_vision": False}),
+    ("no problems", "symptoms.medications.problems", {"has_problems": False}),
+    ("no changes", "lifestyle.cognitive", {"has_changes": False}),
+    ("No, nothing else", "additional.conditions", {"has_conditions": False}),
+    ("no i dont", "additional.healthcare", {"seeing_doctor": False}),
+])
+def test_bare_denials(extractor, message, field, expected):
+    result = extract(extractor, message, field)
+    assert result is not None and result["confidence"] == 1.0
+    value = result["updated_record"]
+    for key in field.split("."):
+        value = value[key]
+    assert expected.items() <= value.items()
+
+
+def test_concerns_denial(extractor):
+    result = extract(extractor, "nope thats all", "additional.concerns")
+    assert result["updated_record"] == {"additional": {"concerns": "None"}}
+
+
+def test_symptoms_selected(extractor):
+    result = extract(extractor, "tired and thirsty", "symptoms.current")
+    assert result["updated_record"]["symptoms"]["current"] == {"fatigue": True, "increased_thirst": True}
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("a few times a week", "A few times a week"),
+    ("every day", "Daily"),
+    ("rarly", "Rarely"),
+])
+def test_activity_frequency(extractor, message, expected):
+    result = extract(extractor, message, "lifestyle.activity")
+    assert result["updated_record"] == {"lifestyle": {"activity": {"exercise_frequency": expected}}}
+
+
+def test_mental_stress_and_denial(extractor):
+    result = extract(extractor, "moderate, no other symptoms", "lifestyle.mental")
+    mental = result["updated_record"]["lifestyle"]["mental"]
+    assert mental["stress_level"] == "Moderate"
+    assert not any(value for value in mental["symptoms"].values())
+
+
+def test_mental_denial_naming_a_symptom_defers(extractor):
+    assert extract(extractor, "moderate, no, trouble sleeping", "lifestyle.mental") is None
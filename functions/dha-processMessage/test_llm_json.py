@@ -0,0 +1,58 @@
+import pytest
+
+from llm_json import TolerantJsonParser, legacy_parses, parse_tolerant, validate_response
+
+REPLY = '{"updated_record": {"symptoms": {"current": {"fatigue": true}}}, "message": "Noted."}'
+
+
+@pytest.mark.parametrize("text", [
+    REPLY,
+    f"```json\n{REPLY}\n```",
+    f"Here is the update:\n```\n{REPLY}\n```\n",
+])
+def test_fenced_and_prefixed_replies_parse(text):
+    value, outcome = parse_tolerant(text)
+    assert outcome == "ok" and value["updated_record"]["symptoms"]["current"]["fatigue"] is True
+
+
+def test_truncated_reply_is_closed_at_the_last_complete_value():
+    text = '{"updated_record": {"symptoms": {"current": {"fatigue": true, "other_symptoms": "tingling in th'
+    value, outcome = parse_tolerant(text)
+    assert outcome == "recovered"
+    assert value == {"updated_record": {"symptoms": {"current": {"fatigue": True}}}}
+    assert not legacy_parses(text)
+
+
+def test_truncated_after_a_complete_literal_keeps_it():
+    value, outcome = parse_tolerant('{"updated_record": {"additional": {"conditions": {"has_conditions": false')
+    assert outcome == "recovered"
+    assert value["updated_record"]["additional"]["conditions"] == {"has_conditions": False}
+
+
+def test_python_literals_and_trailing_commas_are_repaired():
+    value, outcome = parse_tolerant('{"updated_record": {"symptoms": {"current": {"fatigue": True,}}}, "message": None,}')
+    assert outcome == "recovered"
+    assert value == {"updated_record": {"symptoms": {"current": {"fatigue": True}}}, "message": None}
+
+
+def test_streamed_chunks_parse_like_the_whole_reply():
+    parser = TolerantJsonParser()
+    for i in range(0, len(REPLY), 7):
+        parser.feed(REPLY[i:i + 7])
+    assert parser.finish() == parse_tolerant(REPLY)
+
+
+@pytest.mark.parametrize("text", ["I could not update the record.", '{"message": "a" "b"}'])
+def test_unrecoverable_replies_fail(text):
+    assert parse_tolerant(text) == (None, "failed")
+
+
+def test_validate_prunes_unknown_keys_and_coerces_types():
+    reply = {"updated_record": {"symptoms": {"current": {"fatigue": "yes", "made_up": True},
+                                             "medications": {"medication_list": "Metformin"}}},
+             "message": None}
+    validated, pruned = validate_response(reply)
+    assert validated == {"updated_record": {"symptoms": {"current": {"fatigue": True},
+                                                          "medications": {"medication_list": ["Metformin"]}}},
+                         "message": ""}
+    assert pruned == 1
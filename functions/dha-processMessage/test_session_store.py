@@ -0,0 +1,59 @@
+import pytest
+
+from session_store import SessionStore, SQLiteSessionBackend
+
+
+class FailingBackend(SQLiteSessionBackend):
+    def __init__(self, path):
+        super().__init__(path)
+        self.fail = False
+
+    def save(self, session_id, session):
+        if self.fail:
+            raise OSError("disk full")
+        super().save(session_id, session)
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return FailingBackend(str(tmp_path / "sessions.db"))
+
+
+def test_failed_write_leaves_the_session_unchanged(backend):
+    store = SessionStore(backend=backend)
+    session_id = store.create({"step": 1}, None)
+    backend.fail = True
+    with pytest.raises(OSError):
+        store.put(session_id, {"record": {"step": 2}, "current_prompt": None, "completion": None})
+    assert store.get(session_id)["record"] == {"step": 1}
+    assert backend.load(session_id)["record"] == {"step": 1}
+
+
+def test_failed_create_keeps_nothing_in_memory(backend):
+    store = SessionStore(backend=backend)
+    backend.fail = True
+    with pytest.raises(OSError):
+        store.create({"step": 1}, None)
+    assert len(store) == 0
+
+
+def test_get_returns_a_copy(backend):
+    store = SessionStore(backend=backend)
+    session_id = store.create({"symptoms": {"current": {}}}, None)
+    store.get(session_id)["record"]["symptoms"]["current"]["fatigue"] = True
+    assert store.get(session_id)["record"] == {"symptoms": {"current": {}}}
+
+
+def test_evicted_session_is_reloaded_from_the_backend(backend):
+    store = SessionStore(capacity=1, backend=backend)
+    first = store.create({"step": 1}, None)
+    store.create({"step": 2}, None)
+    assert len(store) == 1
+    assert store.get(first)["record"] == {"step": 1}
+
+
+def test_expired_session_is_gone_from_both_tiers(backend):
+    store = SessionStore(ttl_seconds=0, backend=backend)
+    session_id = store.create({"step": 1}, None)
+    assert store.get(session_id) is None
+    assert backend.load(session_id) is None and len(store) == 0
@@ -0,0 +1,288 @@
+"""Admission control in front of the Gemini calls.
+
+Two layers:
+- gate: at most GEMINI_MAX_IN_FLIGHT model calls run at once per instance. Further calls wait
+  in a FIFO queue of at most ADMISSION_MAX_QUEUE, each for at most ADMISSION_QUEUE_TIMEOUT_SECONDS.
+  A call that finds the queue full, or whose wait runs out, gets Overloaded (503) at once
+  instead of piling onto a rate-limited backend.
+- rate_limiter: a token bucket per client (a server-issued session id the endpoint has validated,
+  else the caller's IP as seen by the trusted front end) that answers 429 once a client sends more
+  than RATE_LIMIT_PER_MINUTE requests, after a burst of RATE_LIMIT_BURST. Session-keyed requests
+  also spend from address_limiter, one bucket per IP for all its sessions that is
+  RATE_LIMIT_SESSIONS_PER_ADDRESS times as large, so opening sessions does not multiply a rate.
+
+Both carry a Retry-After estimate. Queue depth, in-flight calls, wait times and rejections are
+exported through llm_metrics.
+"""
+import asyncio
+import contextlib
+import functools
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, Iterator, Optional
+
+from llm_metrics import metrics
+
+GEMINI_MAX_IN_FLIGHT = int(os.environ.get("GEMINI_MAX_IN_FLIGHT", "16"))
+ADMISSION_MAX_QUEUE = int(os.environ.get("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+
+RATE_LIMIT_PER_MINUTE = float(os.environ.get("RATE_LIMIT_PER_MINUTE", "30"))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", "10"))
+# Sessions' worth of requests one address may send in total, e.g. a clinic behind one NAT
+RATE_LIMIT_SESSIONS_PER_ADDRESS = float(os.environ.get("RATE_LIMIT_SESSIONS_PER_ADDRESS", "3"))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get("RATE_LIMIT_MAX_CLIENTS", "10000"))
+# Proxies in front of the function that append to X-Forwarded-For; the caller's address is the
+# hop the outermost of them appended. Earlier hops are whatever the client sent. 0 uses remote_addr.
+TRUSTED_PROXY_HOPS = int(os.environ.get("TRUSTED_PROXY_HOPS", "1"))
+
+
+class Overloaded(Exception):
+    """The request was not admitted; the client should retry after `retry_after` seconds."""
+
+    def __init__(self, reason: str, retry_after: float, status: int = 503) -> None:
+        super().__init__(f"Service busy ({reason}); retry after {math.ceil(retry_after)}s")
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
+
+    def headers(self) -> Dict[str, str]:
+        return {"Retry-After": str(max(1, math.ceil(self.retry_after))),
+                "Access-Control-Expose-Headers": "Retry-After"}
+
+
+class _Waiter:
+    def __init__(self, loop: Optional[asyncio.AbstractEventLoop] = None) -> None:
+        self.granted = False
+        self.loop = loop
+        self.event = threading.Event() if loop is None else None
+        self.future = loop.create_future() if loop is not None else None
+
+    def grant(self) -> None:
+        self.granted = True
+        if self.event is not None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
+
+
+class AdmissionGate:
+    """Bounded concurrency with a bounded FIFO wait queue, usable from threads and coroutines.
+
+    A released slot is handed straight to the oldest waiter, so late arrivals cannot overtake.
+    """
+
+    def __init__(self, max_in_flight: int = GEMINI_MAX_IN_FLIGHT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 timeout_seconds: float = ADMISSION_QUEUE_TIMEOUT_SECONDS) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.timeout_seconds = timeout_seconds
+        self.in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # Moving average of how long a call holds its slot, for Retry-After estimates
+        self._hold_seconds = 1.0
+
+    @contextlib.contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        started = time.perf_counter()
+        waiter = self._enter(None)
+        if waiter is not None:
+            waiter.event.wait(self.timeout_seconds if timeout is None else timeout)
+            self._check_granted(waiter, started)
+        acquired = time.perf_counter()
+        metrics.record_admission_wait(acquired - started)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired)
+
+    @contextlib.asynccontextmanager
+    async def aslot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        started = time.perf_counter()
+        waiter = self._enter(asyncio.get_running_loop())
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future),
+                                       self.timeout_seconds if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                self._abandon(waiter)
+                raise
+            self._check_granted(waiter, started)
+        acquired = time.perf_counter()
+        metrics.record_admission_wait(acquired - started)
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - acquired)
+
+    def retry_after(self) -> float:
+        """Rough time until a newly queued call would be admitted."""
+        return self._hold_seconds * (len(self._waiters) + 1) / max(1, self.max_in_flight)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "mean_hold_seconds": round(self._hold_seconds, 3),
+            }
+
+    def _enter(self, loop: Optional[asyncio.AbstractEventLoop]) -> Optional[_Waiter]:
+        """Take a slot and return None, or join the queue and return the waiter."""
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                self._publish()
+                return None
+            if len(self._waiters) >= self.max_queue:
+                retry_after = self.retry_after()
+                metrics.record_admission_rejection("queue_full")
+                raise Overloaded("queue full", retry_after)
+            waiter = _Waiter(loop)
+            self._waiters.append(waiter)
+            self._publish()
+            return waiter
+
+    def _check_granted(self, waiter: _Waiter, started: float) -> None:
+        with self._lock:
+            if waiter.granted:
+                return
+            self._waiters.remove(waiter)
+            self._publish()
+            retry_after = self.retry_after()
+        metrics.record_admission_wait(time.perf_counter() - started, outcome="timeout")
+        metrics.record_admission_rejection("deadline")
+        raise Overloaded("queue wait exceeded", retry_after)
+
+    def _abandon(self, waiter: _Waiter) -> None:
+        with self._lock:
+            if not waiter.granted:
+                self._waiters.remove(waiter)
+                self._publish()
+                return
+        # The slot was handed over just as the waiter gave up; pass it on
+        self._release(0.0, observe=False)
+
+    def _release(self, held_seconds: float, observe: bool = True) -> None:
+        with self._lock:
+            if observe:
+                self._hold_seconds += 0.1 * (held_seconds - self._hold_seconds)
+            if self._waiters:
+                self._waiters.popleft().grant()
+            else:
+                self.in_flight -= 1
+            self._publish()
+
+    def _publish(self) -> None:
+        metrics.set_admission_load(self.in_flight, len(self._waiters))
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, burst: float, now: float) -> None:
+        self.rate = rate_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets per client key, keeping the most recently seen `max_clients`."""
+
+    def __init__(self, per_minute: float = RATE_LIMIT_PER_MINUTE, burst: float = RATE_LIMIT_BURST,
+                 max_clients: int = RATE_LIMIT_MAX_CLIENTS) -> None:
+        self.rate = per_minute / 60
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, key: str) -> None:
+        """Spend one of the client's tokens, or raise Overloaded with status 429."""
+        if self.rate <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            wait = bucket.take(now)
+        if wait:
+            metrics.record_admission_rejection("rate_limited")
+            raise Overloaded("rate limit", wait, status=429)
+
+
+def client_key(headers: Any, remote_addr: Optional[str], session_id: Optional[str] = None,
+               trusted_hops: int = TRUSTED_PROXY_HOPS) -> str:
+    """The session if given, else the caller's address as recorded by the trusted front end.
+
+    session_id must be one the server issued and has checked exists; the client can send any.
+    """
+    if session_id:
+        return f"session:{session_id}"
+    hops = [hop.strip() for hop in headers.get("X-Forwarded-For", "").split(",") if hop.strip()]
+    address = hops[-trusted_hops] if 0 < trusted_hops <= len(hops) else remote_addr
+    return f"ip:{address or 'unknown'}"
+
+
+def rate_limited(handler: Optional[Callable] = None, *,
+                 session_exists: Optional[Callable[[str], bool]] = None) -> Callable:
+    """Decorator for a Flask-style handler: answers 429 with Retry-After once its client is over the limit.
+
+    Used bare, clients are keyed by address. An endpoint with server-side sessions passes
+    session_exists, and a request's sessionId keys its client only when that returns True;
+    such a request is also charged to its address in address_limiter.
+    """
+    if handler is None:
+        return functools.partial(rate_limited, session_exists=session_exists)
+
+    @functools.wraps(handler)
+    def wrapper(request, *args, **kwargs):
+        if request.method in ('OPTIONS', 'GET'):
+            return handler(request, *args, **kwargs)
+        session_id = None
+        if session_exists is not None:
+            request_json = request.get_json(silent=True)
+            candidate = request_json.get('sessionId') if isinstance(request_json, dict) else None
+            if isinstance(candidate, str) and candidate and session_exists(candidate):
+                session_id = candidate
+        try:
+            rate_limiter.check(client_key(request.headers, request.remote_addr, session_id))
+            if session_id:
+                address_limiter.check(client_key(request.headers, request.remote_addr))
+        except Overloaded as e:
+            headers = {'Access-Control-Allow-Origin': request.headers.get('Origin', '*'), **e.headers()}
+            return {"error": str(e)}, e.status, headers
+        return handler(request, *args, **kwargs)
+    return wrapper
+
+
+gate = AdmissionGate()
+rate_limiter = RateLimiter()
+address_limiter = RateLimiter(per_minute=RATE_LIMIT_PER_MINUTE * RATE_LIMIT_SESSIONS_PER_ADDRESS,
+                              burst=RATE_LIMIT_BURST * RATE_LIMIT_SESSIONS_PER_ADDRESS)
@@ -0,0 +1,373 @@
+"""Gemini client shared by the Cloud Functions.
+
+Each function directory links to this file, so it is deployed alongside that function's main.py
+and imported as a sibling module. The client is created once per instance and reused by every
+request, keeping its HTTP connections warm. Calls get a timeout, retries with jittered backoff
+on 429/5xx and network errors, and optionally a hedged second request for tail latency.
+Responses are cached by content when the caller opts in, which it should only for calls whose
+prompts carry no patient data and whose output is not meant to vary. Every call is recorded in llm_metrics under its
+operation name. Calls that reach the network hold an admission.gate slot while they run, so a
+burst queues (or is turned away with Overloaded) instead of all hitting the API at once.
+The a-prefixed variants do the same on client.aio for asyncio handlers.
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+
+import httpx
+from google import genai
+from google.genai import errors, types
+
+import admission
+import response_cache
+from llm_metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+GEMINI_PROJECT = os.environ.get("GEMINI_PROJECT", "gemini-med-lit-review")
+GEMINI_LOCATION = os.environ.get("GEMINI_LOCATION", "us-central1")
+MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-pro")
+
+GEMINI_TIMEOUT_MS = int(os.environ.get("GEMINI_TIMEOUT_MS", "120000"))
+GEMINI_MAX_RETRIES = int(os.environ.get("GEMINI_MAX_RETRIES", "3"))
+GEMINI_RETRY_BASE_SECONDS = float(os.environ.get("GEMINI_RETRY_BASE_SECONDS", "0.5"))
+GEMINI_RETRY_MAX_SECONDS = float(os.environ.get("GEMINI_RETRY_MAX_SECONDS", "8"))
+# Send a second, identical request if the first has not answered after this long; 0 disables hedging
+GEMINI_HEDGE_AFTER_SECONDS = float(os.environ.get("GEMINI_HEDGE_AFTER_SECONDS", "0"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+SAFETY_SETTINGS = [
+    types.SafetySetting(category=category, threshold="OFF")
+    for category in (
+        "HARM_CATEGORY_HATE_SPEECH",
+        "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "HARM_CATEGORY_HARASSMENT",
+    )
+]
+
+T = TypeVar("T")
+
+_client: Optional[genai.Client] = None
+_client_lock = threading.Lock()
+_hedge_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini-hedge")
+_cache = response_cache.create_response_cache()
+
+
+def get_client() -> genai.Client:
+    """The process-wide Gemini client, created on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = genai.Client(
+                    vertexai=True,
+                    project=GEMINI_PROJECT,
+                    location=GEMINI_LOCATION,
+                    # Concurrency is bounded by admission.gate, not by the HTTP pool
+                    http_options=types.HttpOptions(timeout=GEMINI_TIMEOUT_MS),
+                )
+    return _client
+
+
+def make_config(temperature: float, **kwargs: Any) -> types.GenerateContentConfig:
+    """Generation config with the settings every function uses; keyword arguments override them."""
+    settings = {
+        "temperature": temperature,
+        "top_p": 0.95,
+        "max_output_tokens": 8192,
+        "safety_settings": SAFETY_SETTINGS,
+    }
+    settings.update(kwargs)
+    return types.GenerateContentConfig(**settings)
+
+
+def user_content(*parts: Any) -> List[types.Content]:
+    """A single user turn; strings become text parts."""
+    return [types.Content(
+        role="user",
+        parts=[types.Part(text=part) if isinstance(part, str) else part for part in parts],
+    )]
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError))
+
+
+def with_retries(call: Callable[[], T], max_retries: int = GEMINI_MAX_RETRIES) -> T:
+    """Run a call, retrying retryable errors with full-jitter exponential backoff."""
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt))
+            attempt += 1
+            logger.warning(f"Gemini call failed ({str(e)}); retry {attempt}/{max_retries} in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def generate_content(contents: Any, config: types.GenerateContentConfig, model: str = MODEL,
+                     hedge_after: float = GEMINI_HEDGE_AFTER_SECONDS, cache: bool = False,
+                     operation: str = "generate_content") -> types.GenerateContentResponse:
+    """generate_content with retries, and a hedged duplicate request if hedge_after is set."""
+    started = time.perf_counter()
+    key = _cache_key("unary", model, config, contents) if cache else None
+    if key is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="cache_hit")
+            return types.GenerateContentResponse.model_validate_json(cached[0])
+
+    def call() -> types.GenerateContentResponse:
+        return with_retries(lambda: get_client().models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        ))
+
+    with admission.gate.slot():
+        try:
+            response = call() if hedge_after <= 0 else _hedged(call, hedge_after)
+        except Exception:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="error")
+            raise
+    metrics.record_call(operation, model, time.perf_counter() - started, response.usage_metadata)
+    if key is not None and response.text:
+        _cache.put(key, [response.model_dump_json(exclude_none=True)])
+    return response
+
+
+def generate_content_stream(contents: Any, config: types.GenerateContentConfig, model: str = MODEL,
+                            cache: bool = False,
+                            operation: str = "generate_content_stream") -> Iterator[types.GenerateContentResponse]:
+    """generate_content_stream, retried until the first chunk arrives.
+
+    Once a chunk has been yielded the stream cannot be replayed, so later errors are raised.
+    A cached stream is replayed chunk by chunk; only streams read to the end are cached.
+    """
+    started = time.perf_counter()
+    key = _cache_key("stream", model, config, contents) if cache else None
+    if key is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="cache_hit")
+            for chunk in cached:
+                yield types.GenerateContentResponse.model_validate_json(chunk)
+            return
+
+    def start():
+        stream = get_client().models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        return stream, next(stream, None)
+
+    with admission.gate.slot():
+        try:
+            stream, first = with_retries(start)
+        except Exception:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="error")
+            raise
+        first_token = time.perf_counter() - started
+        if first is None:
+            metrics.record_call(operation, model, first_token, first_token_seconds=first_token)
+            return
+
+        chunks = []
+        usage = None
+        outcome = "error"
+        try:
+            for chunk in _chain(first, stream):
+                # Each chunk carries the usage so far; the last one has the totals
+                usage = chunk.usage_metadata or usage
+                if key is not None:
+                    chunks.append(chunk.model_dump_json(exclude_none=True))
+                yield chunk
+            outcome = "ok"
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.record_call(operation, model, time.perf_counter() - started, usage,
+                                outcome=outcome, first_token_seconds=first_token)
+        if key is not None and chunks:
+            _cache.put(key, chunks)
+
+
+async def awith_retries(call: Callable[[], Awaitable[T]], max_retries: int = GEMINI_MAX_RETRIES) -> T:
+    """with_retries for coroutines; waits between attempts without blocking the event loop."""
+    attempt = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            if attempt >= max_retries or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(GEMINI_RETRY_MAX_SECONDS, GEMINI_RETRY_BASE_SECONDS * 2 ** attempt))
+            attempt += 1
+            logger.warning(f"Gemini call failed ({str(e)}); retry {attempt}/{max_retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+
+
+async def agenerate_content(contents: Any, config: types.GenerateContentConfig, model: str = MODEL,
+                            hedge_after: float = GEMINI_HEDGE_AFTER_SECONDS, cache: bool = False,
+                            operation: str = "generate_content") -> types.GenerateContentResponse:
+    """generate_content on the async client."""
+    started = time.perf_counter()
+    key = _cache_key("unary", model, config, contents) if cache else None
+    if key is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="cache_hit")
+            return types.GenerateContentResponse.model_validate_json(cached[0])
+
+    def call() -> Awaitable[types.GenerateContentResponse]:
+        return awith_retries(lambda: get_client().aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config,
+        ))
+
+    async with admission.gate.aslot():
+        try:
+            response = await (call() if hedge_after <= 0 else _ahedged(call, hedge_after))
+        except Exception:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="error")
+            raise
+    metrics.record_call(operation, model, time.perf_counter() - started, response.usage_metadata)
+    if key is not None and response.text:
+        _cache.put(key, [response.model_dump_json(exclude_none=True)])
+    return response
+
+
+async def agenerate_content_stream(contents: Any, config: types.GenerateContentConfig, model: str = MODEL,
+                                   cache: bool = False,
+                                   operation: str = "generate_content_stream") -> AsyncIterator[types.GenerateContentResponse]:
+    """generate_content_stream on the async client, with the same retry and caching rules."""
+    started = time.perf_counter()
+    key = _cache_key("stream", model, config, contents) if cache else None
+    if key is not None:
+        cached = _cache.get(key)
+        if cached is not None:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="cache_hit")
+            for chunk in cached:
+                yield types.GenerateContentResponse.model_validate_json(chunk)
+            return
+
+    async def start():
+        stream = await get_client().aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config,
+        )
+        return stream, await anext(stream, None)
+
+    async with admission.gate.aslot():
+        try:
+            stream, first = await awith_retries(start)
+        except Exception:
+            metrics.record_call(operation, model, time.perf_counter() - started, outcome="error")
+            raise
+        first_token = time.perf_counter() - started
+        if first is None:
+            metrics.record_call(operation, model, first_token, first_token_seconds=first_token)
+            return
+
+        chunks = []
+        usage = first.usage_metadata
+        outcome = "error"
+        try:
+            if key is not None:
+                chunks.append(first.model_dump_json(exclude_none=True))
+            yield first
+            async for chunk in stream:
+                usage = chunk.usage_metadata or usage
+                if key is not None:
+                    chunks.append(chunk.model_dump_json(exclude_none=True))
+                yield chunk
+            outcome = "ok"
+        except (GeneratorExit, asyncio.CancelledError):
+            outcome = "cancelled"
+            raise
+        finally:
+            metrics.record_call(operation, model, time.perf_counter() - started, usage,
+                                outcome=outcome, first_token_seconds=first_token)
+        if key is not None and chunks:
+            _cache.put(key, chunks)
+
+
+def cache_stats() -> Optional[Dict[str, Any]]:
+    """Response cache counters, or None if the cache is disabled."""
+    return _cache.stats() if _cache is not None else None
+
+
+def _cache_key(kind: str, model: str, config: types.GenerateContentConfig, contents: Any) -> Optional[str]:
+    """Unary calls cache one response and streams their chunks, so the two never share an entry."""
+    if _cache is None:
+        return None
+    return response_cache.cache_key(f"{kind}:{model}", _dump(config), _dump(contents))
+
+
+def _dump(value: Any) -> Any:
+    if isinstance(value, (list, tuple)):
+        return [_dump(item) for item in value]
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return value
+
+
+def _chain(first: T, rest: Iterator[T]) -> Iterator[T]:
+    yield first
+    yield from rest
+
+
+def _hedged(call: Callable[[], T], hedge_after: float) -> T:
+    primary = _hedge_executor.submit(call)
+    done, _ = wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info(f"Gemini call slower than {hedge_after}s; sending a hedged request")
+    pending = {primary, _hedge_executor.submit(call)}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+            error = future.exception()
+    raise error
+
+
+async def _ahedged(call: Callable[[], Awaitable[T]], hedge_after: float) -> T:
+    primary = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait([primary], timeout=hedge_after)
+    if done:
+        return primary.result()
+
+    logger.info(f"Gemini call slower than {hedge_after}s; sending a hedged request")
+    pending = {primary, asyncio.ensure_future(call())}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return task.result()
+            error = task.exception()
+    raise error
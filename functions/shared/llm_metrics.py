@@ -0,0 +1,325 @@
+"""Per-call Gemini instrumentation, aggregated per endpoint and served in Prometheus text format.
+
+gemini_client records every call: wall time, time to first chunk for streams, prompt and output
+tokens from usage_metadata, and estimated cost. The endpoint a call belongs to is set by the
+instrumented() decorator on each function's HTTP handler, which also serves GET .../metrics;
+instrumented_async() does the same for the ASGI handlers.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# USD per million tokens as (input, output); thinking tokens are billed as output.
+# Override with GEMINI_PRICES_JSON='{"model": [input, output]}'.
+PRICES_PER_MILLION: Dict[str, Tuple[float, float]] = {
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.5-flash": (0.30, 2.50),
+    "gemini-2.5-flash-lite": (0.10, 0.40),
+}
+PRICES_PER_MILLION.update({
+    model: tuple(prices) for model, prices in json.loads(os.environ.get("GEMINI_PRICES_JSON", "{}")).items()
+})
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16, 32, 64, 128)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 2048, 4096, 8192, 16384, 32768, 131072)
+COST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Cloud Functions sets K_SERVICE to the function name; handlers override it per request
+_endpoint: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "endpoint", default=os.environ.get("K_SERVICE", "unknown"))
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, as Prometheus exposes it."""
+
+    def __init__(self, name: str, help_text: str, buckets: Iterable[float]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self._series: Dict[Labels, List[float]] = {}  # bucket counts..., +Inf count, sum
+
+    def observe(self, labels: Labels, value: float) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', _number(bound)),))} {_number(count)}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {_number(series[-2])}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_number(series[-2])}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[Labels, float] = {}
+
+    def inc(self, labels: Labels, value: float = 1.0) -> None:
+        self._series[labels] = self._series.get(labels, 0.0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_number(value)}")
+        return lines
+
+
+class Gauge:
+    def __init__(self, name: str, help_text: str) -> None:
+        self.name = name
+        self.help_text = help_text
+        self._series: Dict[Labels, float] = {}
+
+    def set(self, labels: Labels, value: float) -> None:
+        self._series[labels] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        for labels, value in sorted(self._series.items()):
+            lines.append(f"{self.name}{_format_labels(labels)} {_number(value)}")
+        return lines
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class LLMMetrics:
+    """Registry of the Gemini call and endpoint metrics."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.call_seconds = Histogram(
+            "gemini_call_duration_seconds", "Wall time of Gemini calls, including retries.", SECONDS_BUCKETS)
+        self.first_token_seconds = Histogram(
+            "gemini_time_to_first_token_seconds", "Time until the first chunk of a streamed Gemini call.",
+            SECONDS_BUCKETS)
+        self.prompt_tokens = Histogram("gemini_prompt_tokens", "Prompt tokens per Gemini call.", TOKEN_BUCKETS)
+        self.output_tokens = Histogram(
+            "gemini_output_tokens", "Output tokens per Gemini call, thinking included.", TOKEN_BUCKETS)
+        self.call_cost = Histogram("gemini_call_cost_usd", "Estimated cost per Gemini call.", COST_BUCKETS)
+        self.tokens = Counter("gemini_tokens_total", "Tokens billed, by kind.")
+        self.cost = Counter("gemini_cost_usd_total", "Estimated Gemini spend.")
+        self.request_seconds = Histogram(
+            "endpoint_request_duration_seconds", "Wall time of HTTP requests per endpoint.", SECONDS_BUCKETS)
+        self.admission_in_flight = Gauge("admission_in_flight", "Gemini calls holding an admission slot.")
+        self.admission_queue_depth = Gauge("admission_queue_depth", "Gemini calls waiting for an admission slot.")
+        self.admission_wait_seconds = Histogram(
+            "admission_wait_seconds", "Time Gemini calls waited for an admission slot.", SECONDS_BUCKETS)
+        self.admission_rejections = Counter(
+            "admission_rejections_total", "Requests turned away by admission control, by reason.")
+        self.coalesced = Counter(
+            "singleflight_requests_total", "Coalescable requests, as leader (generated) or follower (shared).")
+        self.retrieval_cache = Counter(
+            "retrieval_cache_lookups_total", "Retrieval query cache lookups, by result (exact_hits, similar_hits, misses).")
+        self.document_cache = Counter(
+            "document_cache_lookups_total", "Article lookups in the in-process document cache, by result.")
+        self.document_cache_entries = Gauge("document_cache_entries", "Articles held in the document cache.")
+        self.document_cache_bytes = Gauge("document_cache_bytes", "Approximate memory held by the document cache.")
+        self.stage_seconds = Histogram(
+            "pipeline_stage_duration_seconds", "Wall time of request pipeline stages, by mode and stage.",
+            SECONDS_BUCKETS)
+
+    def record_call(self, operation: str, model: str, seconds: float, usage: Any = None,
+                    outcome: str = "ok", first_token_seconds: Optional[float] = None) -> float:
+        """Record one Gemini call and return its estimated cost in USD."""
+        endpoint = _endpoint.get()
+        labels = (("endpoint", endpoint), ("operation", operation), ("model", model))
+        prompt, output = usage_tokens(usage) if outcome == "ok" else (0, 0)
+        cost = estimate_cost(model, prompt, output)
+        with self._lock:
+            self.call_seconds.observe(labels + (("outcome", outcome),), seconds)
+            if first_token_seconds is not None:
+                self.first_token_seconds.observe(labels, first_token_seconds)
+            if outcome == "ok":
+                self.prompt_tokens.observe(labels, prompt)
+                self.output_tokens.observe(labels, output)
+                self.call_cost.observe(labels, cost)
+                self.tokens.inc((("endpoint", endpoint), ("model", model), ("kind", "prompt")), prompt)
+                self.tokens.inc((("endpoint", endpoint), ("model", model), ("kind", "output")), output)
+                self.cost.inc((("endpoint", endpoint), ("model", model)), cost)
+        return cost
+
+    def record_request(self, endpoint: str, status: int, seconds: float) -> None:
+        with self._lock:
+            self.request_seconds.observe((("endpoint", endpoint), ("status", str(status))), seconds)
+
+    def set_admission_load(self, in_flight: int, queued: int) -> None:
+        with self._lock:
+            self.admission_in_flight.set((), in_flight)
+            self.admission_queue_depth.set((), queued)
+
+    def record_admission_wait(self, seconds: float, outcome: str = "admitted") -> None:
+        with self._lock:
+            self.admission_wait_seconds.observe((("endpoint", _endpoint.get()), ("outcome", outcome)), seconds)
+
+    def record_admission_rejection(self, reason: str) -> None:
+        with self._lock:
+            self.admission_rejections.inc((("endpoint", _endpoint.get()), ("reason", reason)))
+
+    def record_coalesced(self, leader: bool) -> None:
+        with self._lock:
+            self.coalesced.inc((("endpoint", _endpoint.get()), ("role", "leader" if leader else "follower")))
+
+    def record_retrieval_cache(self, result: str) -> None:
+        with self._lock:
+            self.retrieval_cache.inc((("endpoint", _endpoint.get()), ("result", result)))
+
+    def record_document_cache(self, hits: int, misses: int) -> None:
+        with self._lock:
+            endpoint = _endpoint.get()
+            self.document_cache.inc((("endpoint", endpoint), ("result", "hit")), hits)
+            self.document_cache.inc((("endpoint", endpoint), ("result", "miss")), misses)
+
+    def set_document_cache_size(self, entries: int, size_bytes: int) -> None:
+        with self._lock:
+            self.document_cache_entries.set((), entries)
+            self.document_cache_bytes.set((), size_bytes)
+
+    def record_stage(self, mode: str, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stage_seconds.observe((("endpoint", _endpoint.get()), ("mode", mode), ("stage", stage)), seconds)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = (self.call_seconds, self.first_token_seconds, self.prompt_tokens, self.output_tokens,
+                       self.call_cost, self.tokens, self.cost, self.request_seconds, self.admission_in_flight,
+                       self.admission_queue_depth, self.admission_wait_seconds, self.admission_rejections,
+                       self.coalesced, self.retrieval_cache, self.document_cache,
+                       self.document_cache_entries, self.document_cache_bytes, self.stage_seconds)
+            lines = [line for metric in metrics for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+
+def usage_tokens(usage: Any) -> Tuple[int, int]:
+    """(prompt, output) token counts from a response's usage_metadata."""
+    if usage is None:
+        return 0, 0
+    prompt = getattr(usage, "prompt_token_count", None) or 0
+    output = (getattr(usage, "candidates_token_count", None) or 0) + (getattr(usage, "thoughts_token_count", None) or 0)
+    return prompt, output
+
+
+def estimate_cost(model: str, prompt_tokens: int, output_tokens: int) -> float:
+    input_price, output_price = PRICES_PER_MILLION.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+metrics = LLMMetrics()
+
+
+def instrumented(endpoint: str) -> Callable:
+    """Decorator for an HTTP handler: labels its Gemini calls and times it.
+
+    A streamed response is labelled and timed until its body has been sent, not just until
+    the handler returns it. GET requests to a path ending in /metrics are answered with the
+    metrics instead.
+    """
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        def wrapper(request, *args, **kwargs):
+            if request.method == 'GET' and request.path.rstrip('/').endswith('/metrics'):
+                return metrics.render(), 200, {'Content-Type': METRICS_CONTENT_TYPE}
+            token = _endpoint.set(endpoint)
+            started = time.perf_counter()
+            status = 500
+            streamed = False
+            try:
+                response = handler(request, *args, **kwargs)
+                status = _status_of(response)
+                if getattr(response, "is_streamed", False):
+                    response.response = _labelled_stream(
+                        response.response, contextvars.copy_context(), endpoint, status, started)
+                    streamed = True
+                return response
+            finally:
+                if not streamed:
+                    metrics.record_request(endpoint, status, time.perf_counter() - started)
+                _endpoint.reset(token)
+        return wrapper
+    return decorator
+
+
+def _labelled_stream(body: Iterable[Any], context: contextvars.Context, endpoint: str, status: int,
+                     started: float) -> Iterable[Any]:
+    """Iterate a response body in the handler's context, then record the request."""
+    iterator = iter(body)
+    try:
+        while True:
+            try:
+                chunk = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            context.run(close)
+        metrics.record_request(endpoint, status, time.perf_counter() - started)
+
+
+def instrumented_async(endpoint: str) -> Callable:
+    """instrumented() for coroutine handlers. Metrics are served by a separate route there."""
+    def decorator(handler: Callable) -> Callable:
+        @functools.wraps(handler)
+        async def wrapper(request, *args, **kwargs):
+            token = _endpoint.set(endpoint)
+            started = time.perf_counter()
+            status = 500
+            streamed = False
+            try:
+                response = await handler(request, *args, **kwargs)
+                status = _status_of(response)
+                if hasattr(response, "body_iterator"):
+                    response.body_iterator = _alabelled_stream(response.body_iterator, endpoint, status, started)
+                    streamed = True
+                return response
+            finally:
+                if not streamed:
+                    metrics.record_request(endpoint, status, time.perf_counter() - started)
+                _endpoint.reset(token)
+        return wrapper
+    return decorator
+
+
+async def _alabelled_stream(body: Any, endpoint: str, status: int, started: float) -> Any:
+    """_labelled_stream for async bodies, which the server iterates in a task of its own."""
+    token = _endpoint.set(endpoint)
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        _endpoint.reset(token)
+        metrics.record_request(endpoint, status, time.perf_counter() - started)
+
+
+def _status_of(response: Any) -> int:
+    if isinstance(response, tuple) and len(response) > 1 and isinstance(response[1], int):
+        return response[1]
+    return getattr(response, "status_code", 200)
@@ -0,0 +1,212 @@
+"""Per-task choice between the fast and the capable Gemini model.
+
+The policy lists, for each task, the candidate models cheapest first and a latency budget in
+seconds. A call goes to the first candidate that is healthy (its measured success rate over the
+last ROUTER_WINDOW calls is at least ROUTER_MIN_SUCCESS_RATE) and whose median latency fits the
+budget. If its output fails the caller's validation, or it raises, the call is repeated on the
+next candidate, so a task that starts on Flash escalates to Pro; being turned away by admission
+control is not a model failure and is raised as is. Tasks missing from the policy
+always use GEMINI_MODEL. Override the policy with
+MODEL_ROUTING_JSON='{"task": {"models": [...], "budget_seconds": 5}}'.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+import admission
+
+logger = logging.getLogger(__name__)
+
+FAST_MODEL = os.environ.get("GEMINI_FAST_MODEL", "gemini-2.5-flash")
+PRO_MODEL = os.environ.get("GEMINI_MODEL", "gemini-2.5-pro")
+
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", "100"))
+# A model is judged on its success rate only once it has this many calls in the window
+ROUTER_MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", "20"))
+ROUTER_MIN_SUCCESS_RATE = float(os.environ.get("ROUTER_MIN_SUCCESS_RATE", "0.8"))
+# Every Nth call of a task tries its first candidate even if it was passed over, so it can recover
+ROUTER_PROBE_EVERY = int(os.environ.get("ROUTER_PROBE_EVERY", "20"))
+
+DEFAULT_POLICY: Dict[str, Dict[str, Any]] = {
+    "extract": {"models": [FAST_MODEL, PRO_MODEL], "budget_seconds": 8},
+    "extract_stream": {"models": [FAST_MODEL, PRO_MODEL], "budget_seconds": 8},
+    "narrative": {"models": [FAST_MODEL, PRO_MODEL], "budget_seconds": 30},
+    "retrieval_summary": {"models": [FAST_MODEL, PRO_MODEL], "budget_seconds": 10},
+    "medication_image": {"models": [FAST_MODEL, PRO_MODEL], "budget_seconds": 20},
+}
+
+T = TypeVar("T")
+
+
+class ModelStats:
+    """Outcomes of the last `window` calls of one task on one model."""
+
+    def __init__(self, window: int) -> None:
+        self._calls: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.escalations = 0
+
+    def record(self, seconds: float, ok: bool) -> None:
+        self._calls.append((seconds, ok))
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def success_rate(self) -> Optional[float]:
+        if not self._calls:
+            return None
+        return sum(ok for _, ok in self._calls) / len(self._calls)
+
+    def median_seconds(self) -> Optional[float]:
+        if not self._calls:
+            return None
+        seconds = sorted(s for s, _ in self._calls)
+        return seconds[len(seconds) // 2]
+
+    def snapshot(self) -> Dict[str, Any]:
+        success_rate = self.success_rate()
+        median = self.median_seconds()
+        return {
+            "calls": len(self._calls),
+            "success_rate": round(success_rate, 4) if success_rate is not None else None,
+            "median_seconds": round(median, 3) if median is not None else None,
+            "escalations": self.escalations,
+        }
+
+
+class ModelRouter:
+    """Routes each task to a model chain according to the policy and the measured outcomes."""
+
+    def __init__(self, policy: Optional[Dict[str, Dict[str, Any]]] = None, default_model: str = PRO_MODEL,
+                 window: int = ROUTER_WINDOW, min_samples: int = ROUTER_MIN_SAMPLES,
+                 min_success_rate: float = ROUTER_MIN_SUCCESS_RATE, probe_every: int = ROUTER_PROBE_EVERY) -> None:
+        self.policy = policy if policy is not None else load_policy()
+        self.default_model = default_model
+        self.window = window
+        self.min_samples = min_samples
+        self.min_success_rate = min_success_rate
+        self.probe_every = probe_every
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+        self._calls: Dict[str, int] = {}
+
+    def candidates(self, task: str) -> List[str]:
+        return list(self.policy.get(task, {}).get("models") or [self.default_model])
+
+    def plan(self, task: str, budget_seconds: Optional[float] = None) -> List[str]:
+        """Models to try in order: the chosen one, then every candidate after it."""
+        models = self.candidates(task)
+        if budget_seconds is None:
+            budget_seconds = self.policy.get(task, {}).get("budget_seconds")
+        with self._lock:
+            calls = self._calls[task] = self._calls.get(task, 0) + 1
+            if len(models) == 1 or (self.probe_every and calls % self.probe_every == 0):
+                return models
+            healthy = [m for m in models if self._healthy(task, m)] or models
+            in_budget = [m for m in healthy if self._fits(task, m, budget_seconds)]
+            if in_budget:
+                chosen = in_budget[0]
+            else:
+                # Nothing is fast enough; take whichever healthy model is fastest
+                chosen = min(healthy, key=lambda m: self._median(task, m))
+        return models[models.index(chosen):]
+
+    def record(self, task: str, model: str, seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._stats_for(task, model).record(seconds, ok)
+
+    def run(self, task: str, call: Callable[[str], T], validate: Optional[Callable[[T], bool]] = None,
+            budget_seconds: Optional[float] = None) -> T:
+        """Call `call(model)` along the plan until a result passes `validate`.
+
+        The last model's result is returned even if it fails validation; its exception is raised.
+        """
+        plan = self.plan(task, budget_seconds)
+        for i, model in enumerate(plan):
+            started = time.perf_counter()
+            try:
+                result = call(model)
+            except admission.Overloaded:
+                raise
+            except Exception as e:
+                self.record(task, model, time.perf_counter() - started, False)
+                if i == len(plan) - 1:
+                    raise
+                self.escalate(task, model, plan[i + 1], f"error: {str(e)}")
+                continue
+            ok = validate is None or validate(result)
+            self.record(task, model, time.perf_counter() - started, ok)
+            if ok or i == len(plan) - 1:
+                return result
+            self.escalate(task, model, plan[i + 1], "invalid output")
+
+    async def arun(self, task: str, call: Callable[[str], Awaitable[T]],
+                   validate: Optional[Callable[[T], bool]] = None, budget_seconds: Optional[float] = None) -> T:
+        """run() for a coroutine call."""
+        plan = self.plan(task, budget_seconds)
+        for i, model in enumerate(plan):
+            started = time.perf_counter()
+            try:
+                result = await call(model)
+            except admission.Overloaded:
+                raise
+            except Exception as e:
+                self.record(task, model, time.perf_counter() - started, False)
+                if i == len(plan) - 1:
+                    raise
+                self.escalate(task, model, plan[i + 1], f"error: {str(e)}")
+                continue
+            ok = validate is None or validate(result)
+            self.record(task, model, time.perf_counter() - started, ok)
+            if ok or i == len(plan) - 1:
+                return result
+            self.escalate(task, model, plan[i + 1], "invalid output")
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (task, model), stats in sorted(self._stats.items()):
+                result.setdefault(task, {})[model] = stats.snapshot()
+            return result
+
+    def escalate(self, task: str, model: str, next_model: str, reason: str) -> None:
+        logger.warning(f"{task} on {model} failed ({reason}); escalating to {next_model}")
+        with self._lock:
+            self._stats_for(task, model).escalations += 1
+
+    def _stats_for(self, task: str, model: str) -> ModelStats:
+        stats = self._stats.get((task, model))
+        if stats is None:
+            stats = self._stats[(task, model)] = ModelStats(self.window)
+        return stats
+
+    def _healthy(self, task: str, model: str) -> bool:
+        stats = self._stats.get((task, model))
+        if stats is None or len(stats) < self.min_samples:
+            return True
+        return stats.success_rate() >= self.min_success_rate
+
+    def _fits(self, task: str, model: str, budget_seconds: Optional[float]) -> bool:
+        if budget_seconds is None:
+            return True
+        stats = self._stats.get((task, model))
+        median = stats.median_seconds() if stats is not None else None
+        return median is None or median <= budget_seconds
+
+    def _median(self, task: str, model: str) -> float:
+        stats = self._stats.get((task, model))
+        median = stats.median_seconds() if stats is not None else None
+        return median if median is not None else 0.0
+
+
+def load_policy() -> Dict[str, Dict[str, Any]]:
+    policy = {task: dict(entry) for task, entry in DEFAULT_POLICY.items()}
+    for task, entry in json.loads(os.environ.get("MODEL_ROUTING_JSON", "{}")).items():
+        policy.setdefault(task, {}).update(entry)
+    return policy
+
+
+router = ModelRouter()
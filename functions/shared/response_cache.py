@@ -0,0 +1,209 @@
+"""Content-addressed cache of Gemini responses, shared by the Cloud Functions.
+
+Entries are keyed by a hash of the model, generation config and request contents and kept in an
+in-process LRU and, when LLM_CACHE_DISK_ENABLED=1, a SQLite file that outlives a warm instance's
+memory pressure. The file stores responses unencrypted, so it stays off unless every cached
+call is known to carry no patient data. Both tiers expire entries after a TTL and are bounded in
+bytes, evicting least recently used first.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.environ.get("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_TTL_SECONDS = float(os.environ.get("LLM_CACHE_TTL_SECONDS", "86400"))
+LLM_CACHE_MEMORY_BYTES = int(os.environ.get("LLM_CACHE_MEMORY_BYTES", str(32 * 1024 * 1024)))
+LLM_CACHE_DISK_ENABLED = os.environ.get("LLM_CACHE_DISK_ENABLED", "0") == "1"
+LLM_CACHE_DISK_BYTES = int(os.environ.get("LLM_CACHE_DISK_BYTES", str(256 * 1024 * 1024)))
+# /tmp is the only writable location on Cloud Functions
+LLM_CACHE_DB_PATH = os.environ.get("LLM_CACHE_DB_PATH", "/tmp/llm_response_cache.db")
+
+
+def cache_key(model: str, config: Any, contents: Any) -> str:
+    """Hash of everything that determines a response. config and contents must be JSON-serialisable."""
+    payload = json.dumps([model, config, contents], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class MemoryTier:
+    """LRU of cached values bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.evictions = 0
+
+    def get(self, key: str, now: float) -> Optional[List[str]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, size, expires_at = entry
+        if expires_at <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: str, value: List[str], size: int, expires_at: float) -> None:
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, size, expires_at)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._entries.pop(key)
+        self.bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskTier:
+    """Cached values as rows in a local SQLite database, bounded by total size in bytes."""
+
+    def __init__(self, path: str, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.evictions = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        self.bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def get(self, key: str, now: float) -> Optional[List[str]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            self._delete(key)
+            return None
+        self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+        self._conn.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: List[str], size: int, expires_at: float, now: float) -> None:
+        if size > self.max_bytes:
+            return
+        self._delete(key)
+        self._conn.execute(
+            "INSERT INTO responses (key, value, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+            (key, json.dumps(value), size, expires_at, now),
+        )
+        self.bytes += size
+        if self.bytes > self.max_bytes:
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall()
+            self.bytes = sum(size for _, size in rows)
+            for old_key, old_size in rows:
+                if self.bytes <= self.max_bytes:
+                    break
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                self.bytes -= old_size
+                self.evictions += 1
+        self._conn.commit()
+
+    def _delete(self, key: str) -> None:
+        row = self._conn.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self.bytes -= row[0]
+
+
+class ResponseCache:
+    """Two-tier cache of serialised responses with hit/miss counters.
+
+    A value is the list of serialised response chunks for one call: one for a unary call,
+    one per chunk for a stream. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, ttl_seconds: float = LLM_CACHE_TTL_SECONDS, memory_bytes: int = LLM_CACHE_MEMORY_BYTES,
+                 disk: Optional[DiskTier] = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.memory = MemoryTier(memory_bytes)
+        self.disk = disk
+        self._lock = threading.Lock()
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0}
+
+    def get(self, key: str) -> Optional[List[str]]:
+        now = time.time()
+        with self._lock:
+            value = self.memory.get(key, now)
+            if value is not None:
+                self.counters["memory_hits"] += 1
+                return value
+            if self.disk is not None:
+                try:
+                    value = self.disk.get(key, now)
+                except sqlite3.Error as e:
+                    logger.error(f"Response cache read failed: {str(e)}")
+                    value = None
+                if value is not None:
+                    self.counters["disk_hits"] += 1
+                    self.memory.put(key, value, _size(value), now + self.ttl_seconds)
+                    return value
+            self.counters["misses"] += 1
+            return None
+
+    def put(self, key: str, value: List[str]) -> None:
+        now = time.time()
+        size = _size(value)
+        with self._lock:
+            self.counters["stores"] += 1
+            self.memory.put(key, value, size, now + self.ttl_seconds)
+            if self.disk is not None:
+                try:
+                    self.disk.put(key, value, size, now + self.ttl_seconds, now)
+                except sqlite3.Error as e:
+                    logger.error(f"Response cache write failed: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_entries": len(self.memory),
+                "memory_bytes": self.memory.bytes,
+                "disk_bytes": self.disk.bytes if self.disk is not None else 0,
+                "evictions": self.memory.evictions + (self.disk.evictions if self.disk is not None else 0),
+            }
+
+
+def _size(value: List[str]) -> int:
+    return sum(len(chunk) for chunk in value)
+
+
+def create_response_cache() -> Optional[ResponseCache]:
+    """Cache in memory, also backed by SQLite if enabled and openable, or None if disabled."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    if not LLM_CACHE_DISK_ENABLED:
+        return ResponseCache()
+    try:
+        disk: Optional[DiskTier] = DiskTier(LLM_CACHE_DB_PATH, LLM_CACHE_DISK_BYTES)
+    except sqlite3.Error as e:
+        logger.error(f"Could not open response cache at {LLM_CACHE_DB_PATH}: {str(e)}")
+        disk = None
+    return ResponseCache(disk=disk)
@@ -0,0 +1,117 @@
+"""Coalescing of identical in-flight requests.
+
+When a request arrives while an identical one (same action and same inputs, see request_key) is
+still being generated, it waits for that leader's result instead of starting its own generation.
+The leader's exception is raised to its followers as well. Nothing is kept once the call
+finishes; this is not a cache. Leaders and followers are counted in llm_metrics, by endpoint.
+"""
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Tuple, TypeVar
+
+from llm_metrics import metrics
+
+T = TypeVar("T")
+
+
+def request_key(action: str, *inputs: Any) -> str:
+    payload = json.dumps([action, *inputs], sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class _AsyncCall:
+    def __init__(self, task: asyncio.Future) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; concurrent callers with that key share its outcome.
+
+    do() coordinates threads; ado() coordinates coroutines on one event loop.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._async_calls: Dict[Tuple[int, str], _AsyncCall] = {}
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            self._count(leader)
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """do() for coroutines.
+
+        The call runs in a task of its own that every caller awaits shielded, so a caller that goes
+        away (a client disconnect), leader or not, does not cancel it for the others. The task is
+        cancelled only once nobody is waiting for it.
+        """
+        loop_key = (id(asyncio.get_running_loop()), key)
+        entry = self._async_calls.get(loop_key)
+        leader = entry is None
+        if leader:
+            task = asyncio.ensure_future(fn())
+            entry = self._async_calls[loop_key] = _AsyncCall(task)
+            task.add_done_callback(lambda done: self._async_done(loop_key, done))
+        with self._lock:
+            self._count(leader)
+
+        entry.waiters += 1
+        try:
+            return await asyncio.shield(entry.task)
+        finally:
+            entry.waiters -= 1
+            if entry.waiters == 0 and not entry.task.done():
+                # Nobody wants it any more; later callers start afresh rather than join a cancelled call
+                if self._async_calls.get(loop_key) is entry:
+                    del self._async_calls[loop_key]
+                entry.task.cancel()
+
+    def _async_done(self, loop_key: Tuple[int, str], task: asyncio.Future) -> None:
+        entry = self._async_calls.get(loop_key)
+        if entry is not None and entry.task is task:
+            del self._async_calls[loop_key]
+        if not task.cancelled():
+            # Mark it retrieved; every waiter may have gone
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.leaders + self.followers
+            return {
+                "leaders": self.leaders,
+                "followers": self.followers,
+                "in_flight": len(self._calls) + len(self._async_calls),
+                "coalescing_ratio": round(self.followers / total, 4) if total else 0.0,
+            }
+
+    def _count(self, leader: bool) -> None:
+        if leader:
+            self.leaders += 1
+        else:
+            self.followers += 1
+        metrics.record_coalesced(leader)
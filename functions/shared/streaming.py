@@ -0,0 +1,98 @@
+import json
+from typing import Any, Optional
+
+# Marks the closing quote of a string
+_END = object()
+
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+
+def sse_event(event: str, data: Any) -> str:
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class JsonStringFieldStreamer:
+    """Pulls the decoded value of one top-level string field out of streamed JSON text.
+
+    Text before the first '{' (such as a markdown fence) is ignored. feed() returns whatever
+    part of the field's value has arrived so far, so it can be forwarded before the rest of
+    the object is generated.
+    """
+
+    def __init__(self, field: str = "message"):
+        self.field = field
+        self._depth = 0
+        self._in_string = False
+        self._escape: Optional[str] = None
+        self._token = []
+        self._last_key: Optional[str] = None
+        self._expect_value = False
+        self._capturing = False
+        self.done = False
+
+    def feed(self, text: str) -> str:
+        out = []
+        for ch in text:
+            if self.done:
+                break
+            if self._in_string:
+                decoded = self._string_char(ch)
+                if decoded is None:
+                    continue
+                if decoded is _END:
+                    self._end_string()
+                    continue
+                if self._capturing:
+                    out.append(decoded)
+                else:
+                    self._token.append(decoded)
+                continue
+
+            if ch == '{':
+                self._depth += 1
+                self._expect_value = False
+            elif ch in '}]':
+                self._depth -= 1
+            elif ch == '[':
+                self._depth += 1
+            elif ch == ':' and self._depth == 1:
+                self._expect_value = True
+            elif ch == ',':
+                self._expect_value = False
+            elif ch == '"' and self._depth >= 1:
+                self._in_string = True
+                self._token = []
+                self._capturing = (self._depth == 1 and self._expect_value and self._last_key == self.field)
+        return "".join(out)
+
+    def _string_char(self, ch: str):
+        if self._escape is not None:
+            self._escape += ch
+            if self._escape[0] == 'u':
+                if len(self._escape) < 5:
+                    return None
+                code, self._escape = self._escape[1:], None
+                try:
+                    return chr(int(code, 16))
+                except ValueError:
+                    return ""
+            escaped, self._escape = self._escape, None
+            return _ESCAPES.get(escaped, escaped)
+        if ch == '\\':
+            self._escape = ""
+            return None
+        if ch == '"':
+            return _END
+        return ch
+
+    def _end_string(self):
+        self._in_string = False
+        if self._capturing:
+            self._capturing = False
+            self.done = True
+        elif self._depth == 1:
+            if self._expect_value:
+                self._expect_value = False
+            else:
+                self._last_key = "".join(self._token)
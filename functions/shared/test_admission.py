@@ -0,0 +1,42 @@
+import pytest
+
+import admission
+
+
+class FakeRequest:
+    method = "POST"
+    remote_addr = "10.0.0.1"
+
+    def __init__(self, session_id):
+        self.headers = {"X-Forwarded-For": "203.0.113.7"}
+        self._json = {"sessionId": session_id}
+
+    def get_json(self, silent=False):
+        return self._json
+
+
+@pytest.fixture
+def limits(monkeypatch):
+    monkeypatch.setattr(admission, "rate_limiter", admission.RateLimiter(per_minute=60, burst=2))
+    monkeypatch.setattr(admission, "address_limiter", admission.RateLimiter(per_minute=180, burst=6))
+
+
+def handler(request):
+    return {"ok": True}, 200, {}
+
+
+def test_new_sessions_do_not_multiply_an_address_rate(limits):
+    endpoint = admission.rate_limited(handler, session_exists=lambda session_id: True)
+    statuses = [endpoint(FakeRequest(f"session-{i}"))[1] for i in range(10)]
+    # Each fresh session has a full bucket, but the address runs out after 6
+    assert statuses == [200] * 6 + [429] * 4
+
+
+def test_session_bucket_still_limits_one_session(limits):
+    endpoint = admission.rate_limited(handler, session_exists=lambda session_id: True)
+    assert [endpoint(FakeRequest("session"))[1] for _ in range(3)] == [200, 200, 429]
+
+
+def test_unknown_session_is_keyed_by_address(limits):
+    endpoint = admission.rate_limited(handler, session_exists=lambda session_id: False)
+    assert [endpoint(FakeRequest(f"forged-{i}"))[1] for i in range(3)] == [200, 200, 429]
@@ -0,0 +1,40 @@
+import glob
+import os
+from importlib import metadata
+
+import google.auth
+import pytest
+from google.auth.credentials import AnonymousCredentials
+
+import gemini_client
+
+FUNCTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def pinned_genai_versions():
+    pins = set()
+    for path in glob.glob(os.path.join(FUNCTIONS_DIR, "*", "requirements.txt")):
+        with open(path) as f:
+            for line in f:
+                name, _, version = line.strip().partition("==")
+                if name == "google-genai":
+                    pins.add(version)
+    return pins
+
+
+@pytest.fixture
+def fresh_client(monkeypatch):
+    monkeypatch.setattr(google.auth, "default", lambda *args, **kwargs: (AnonymousCredentials(), "test-project"))
+    monkeypatch.setattr(gemini_client, "_client", None)
+    yield
+    gemini_client._client = None
+
+
+def test_every_function_pins_the_same_google_genai():
+    assert pinned_genai_versions() == {metadata.version("google-genai")}
+
+
+def test_client_builds_against_pinned_sdk(fresh_client):
+    client = gemini_client.get_client()
+    assert client is gemini_client.get_client()
+    assert client._api_client._http_options["timeout"] == gemini_client.GEMINI_TIMEOUT_MS
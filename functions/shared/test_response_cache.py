@@ -0,0 +1,29 @@
+import inspect
+import os
+
+import gemini_client
+import response_cache
+
+
+def test_disk_tier_is_off_by_default(tmp_path, monkeypatch):
+    path = tmp_path / "cache.db"
+    monkeypatch.setattr(response_cache, "LLM_CACHE_DB_PATH", str(path))
+    cache = response_cache.create_response_cache()
+    cache.put("key", ["response"])
+    assert cache.get("key") == ["response"]
+    assert cache.disk is None and not os.path.exists(path)
+
+
+def test_disk_tier_when_enabled(tmp_path, monkeypatch):
+    monkeypatch.setattr(response_cache, "LLM_CACHE_DISK_ENABLED", True)
+    monkeypatch.setattr(response_cache, "LLM_CACHE_DB_PATH", str(tmp_path / "cache.db"))
+    response_cache.create_response_cache().put("key", ["response"])
+    # A new instance's memory is empty, so this hit comes from the file
+    cache = response_cache.create_response_cache()
+    assert cache.get("key") == ["response"] and cache.stats()["disk_hits"] == 1
+
+
+def test_gemini_calls_are_uncached_unless_asked():
+    for fn in (gemini_client.generate_content, gemini_client.generate_content_stream,
+               gemini_client.agenerate_content, gemini_client.agenerate_content_stream):
+        assert inspect.signature(fn).parameters["cache"].default is False
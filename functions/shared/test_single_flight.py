@@ -0,0 +1,92 @@
+import asyncio
+import threading
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_do_shares_result_between_threads():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait()
+        return "result"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    leader.start()
+    started.wait()
+    follower = threading.Thread(target=lambda: results.append(flight.do("k", work)))
+    follower.start()
+    while flight.followers == 0:
+        pass
+    release.set()
+    leader.join()
+    follower.join()
+    assert results == ["result", "result"] and calls == [1]
+
+
+def test_cancelled_leader_does_not_fail_follower():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flight.ado("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.ado("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        return await follower, flight.stats()
+
+    result, stats = asyncio.run(scenario())
+    assert result == "result"
+    assert stats["leaders"] == 1 and stats["followers"] == 1 and stats["in_flight"] == 0
+
+
+def test_work_cancelled_once_nobody_waits():
+    async def scenario():
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.Event().wait()
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        caller = asyncio.create_task(flight.ado("k", work))
+        await asyncio.sleep(0)
+        caller.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        # A new caller starts its own call instead of joining the cancelled one
+        return await flight.ado("k", lambda: asyncio.sleep(0, "fresh"))
+
+    assert asyncio.run(scenario()) == "fresh"
+
+
+def test_exception_raised_to_every_caller():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0)
+            raise ValueError("boom")
+
+        return await asyncio.gather(flight.ado("k", work), flight.ado("k", work), return_exceptions=True)
+
+    assert [str(e) for e in asyncio.run(scenario())] == ["boom", "boom"]